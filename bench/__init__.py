@@ -0,0 +1,7 @@
+"""Benchmarks for veritable-python.
+
+Run a suite as a module from the repository root, e.g.:
+
+    python -m bench.throughput --json results.json
+
+"""
@@ -0,0 +1,147 @@
+"""Helpers shared by the veritable-python benchmarks."""
+
+import gc
+import json
+import platform
+import random
+import sys
+import time
+from timeit import default_timer
+from optparse import OptionParser
+from veritable.version import __version__
+
+TYPES = ['real', 'count', 'categorical', 'boolean']
+
+
+def synthetic_schema(ncols, types=TYPES):
+    """Returns a schema of ncols columns cycling through types."""
+    return dict([('col{0}'.format(i), {'type': types[i % len(types)]})
+        for i in range(ncols)])
+
+
+def synthetic_value(rng, coltype, cardinality):
+    if coltype == 'real':
+        return rng.gauss(0, 1)
+    if coltype == 'count':
+        return rng.randint(0, 100)
+    if coltype == 'categorical':
+        return 'cat{0}'.format(rng.randint(0, cardinality - 1))
+    return rng.random() < 0.5
+
+
+def synthetic_rows(schema, nrows, cardinality=10, fill=1.0, as_strings=False,
+                   seed=0):
+    """Yields nrows synthetic row dicts matching schema.
+
+    Arguments:
+    schema -- the analysis schema the rows follow
+    nrows -- the number of rows
+    cardinality -- the number of distinct values of categorical columns
+        (default: 10)
+    fill -- the probability that a cell is present (default: 1.0)
+    as_strings -- controls whether values are rendered as strings, as
+        read_csv would return them (default: False)
+    seed -- the random seed (default: 0)
+
+    """
+    rng = random.Random(seed)
+    columns = sorted(schema.keys())
+    for i in range(nrows):
+        row = {'_id': str(i)}
+        for c in columns:
+            if fill >= 1.0 or rng.random() < fill:
+                v = synthetic_value(rng, schema[c]['type'], cardinality)
+                row[c] = str(v) if as_strings else v
+        yield row
+
+
+def measure(f, repeat=3, setup=None, min_time=0.05):
+    """Times f and returns its fastest mean duration in seconds.
+
+    Each of repeat samples calls f as many times as needed to take at least
+    min_time seconds in all, so that very fast calls are timed reliably; the
+    sample's mean duration per call is taken. If setup is given, it is
+    called before each call to f, outside the timing, and its return value
+    is passed to f.
+
+    """
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        total = 0.0
+        calls = 0
+        while calls == 0 or total < min_time:
+            arg = setup() if setup is not None else None
+            start = default_timer()
+            if setup is not None:
+                f(arg)
+            else:
+                f()
+            total += default_timer() - start
+            calls += 1
+        elapsed = total / calls
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def result(suite, name, params, seconds, items, unit, **extra):
+    """Builds a benchmark result record.
+
+    The rate is items per second, in the given unit.
+
+    """
+    res = {'suite': suite, 'name': name, 'params': params,
+        'seconds': seconds, 'items': items, 'unit': unit,
+        'rate': items / seconds if seconds > 0 else float('inf')}
+    res.update(extra)
+    return res
+
+
+def result_key(res):
+    """Identifies a result by its suite, name and parameters."""
+    return "{0}.{1}[{2}]".format(res['suite'], res['name'], ",".join([
+        "{0}={1}".format(k, res['params'][k]) for k in
+        sorted(res['params'])]))
+
+
+def environment():
+    """Describes the machine and interpreter the benchmarks ran on."""
+    return {'veritable': __version__, 'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(), 'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def write_results(results, path=None, **extra):
+    """Writes results as JSON to path, or to stdout if path is None or '-'.
+
+    Any keyword arguments are written as further top-level entries.
+
+    """
+    doc = {'environment': environment(), 'results': results}
+    doc.update(extra)
+    text = json.dumps(doc, indent=2, sort_keys=True)
+    if path is None or path == '-':
+        sys.stdout.write(text + '\n')
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+
+
+def report(res, stream=sys.stderr):
+    """Prints a one-line summary of a result."""
+    stream.write("{0:<60} {1:>14.1f} {2}\n".format(result_key(res),
+        res['rate'], res['unit']))
+
+
+def make_parser(usage):
+    """Returns an OptionParser with the options common to all suites."""
+    parser = OptionParser(usage=usage)
+    parser.add_option('--json', default=None,
+        help="write machine-readable results to this file ('-' for stdout)")
+    parser.add_option('--quick', action='store_true', default=False,
+        help="run smaller problem sizes")
+    parser.add_option('--repeat', type='int', default=3,
+        help="number of runs per benchmark; the fastest is reported")
+    return parser
@@ -0,0 +1,197 @@
+"""Performance regression gate.
+
+Runs the benchmark suites and compares their results with the baselines
+committed under bench/baselines, one file per suite. A result regresses if
+its rate falls more than the rate tolerance below the baseline, or if its
+peak memory rises more than the memory tolerance above it. The command
+exits with status 1 if anything regressed, or if a baseline result was not
+measured at all.
+
+    python -m bench.gate                    # check against the baselines
+    python -m bench.gate --suite utils      # check one suite
+    python -m bench.gate --update           # record new baselines
+    python -m bench.gate --results r.json   # check results already measured
+
+Baselines are only comparable with runs on similar hardware: record them on
+the machine that runs the gate, and update them deliberately, in their own
+commit, when a change is expected to move performance.
+
+"""
+
+import json
+import os
+import sys
+from .common import result_key, write_results, make_parser
+from . import prediction, throughput, utils_scaling
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'baselines')
+
+# default tolerances, as fractions of the baseline value; a baseline file
+#   may override them with its own 'tolerance' entry
+TOLERANCE = {'rate': 0.3, 'peak_memory': 0.15}
+
+
+def _run_utils(quick, repeat):
+    return utils_scaling.run(quick=quick, repeat=repeat, verbose=False)[0]
+
+SUITES = {
+    'throughput': lambda quick, repeat: throughput.run(quick=quick,
+        repeat=repeat, verbose=False),
+    'prediction': lambda quick, repeat: prediction.run(quick=quick,
+        repeat=repeat, verbose=False),
+    'utils': _run_utils}
+
+
+def baseline_path(suite, directory=BASELINE_DIR):
+    return os.path.join(directory, '{0}.json'.format(suite))
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, results, tolerance=None):
+    """Compares results with a baseline document.
+
+    Returns a tuple (regressions, missing, improvements), where regressions
+    and improvements are lists of (key, metric, baseline value, value) and
+    missing lists the keys of baseline results absent from results.
+
+    Arguments:
+    baseline -- a baseline document, as written by write_results
+    results -- a list of result records
+    tolerance -- a dict of tolerances for 'rate' and 'peak_memory'
+        (default: None) If None, the baseline's own tolerance, or TOLERANCE.
+
+    """
+    if tolerance is None:
+        tolerance = dict(TOLERANCE)
+        tolerance.update(baseline.get('tolerance', {}))
+    current = dict([(result_key(r), r) for r in results])
+    regressions = []
+    missing = []
+    improvements = []
+    for base in baseline['results']:
+        key = result_key(base)
+        if key not in current:
+            missing.append(key)
+            continue
+        res = current[key]
+        if res['rate'] < base['rate'] * (1 - tolerance['rate']):
+            regressions.append((key, 'rate', base['rate'], res['rate']))
+        elif res['rate'] > base['rate'] * (1 + tolerance['rate']):
+            improvements.append((key, 'rate', base['rate'], res['rate']))
+        base_memory = base.get('peak_memory')
+        memory = res.get('peak_memory')
+        if base_memory and memory is not None:
+            if memory > base_memory * (1 + tolerance['peak_memory']):
+                regressions.append((key, 'peak_memory', base_memory, memory))
+            elif memory < base_memory * (1 - tolerance['peak_memory']):
+                improvements.append((key, 'peak_memory', base_memory,
+                    memory))
+    return regressions, missing, improvements
+
+
+def merge(results, more):
+    """Merges two runs of a suite, keeping the best measurement of each."""
+    merged = []
+    others = dict([(result_key(r), r) for r in more])
+    for r in results:
+        r = dict(r)
+        other = others.get(result_key(r))
+        if other is not None:
+            if other['rate'] > r['rate']:
+                r['seconds'] = other['seconds']
+                r['rate'] = other['rate']
+            if other.get('peak_memory') is not None and (
+                    r.get('peak_memory') is None or
+                    other['peak_memory'] < r['peak_memory']):
+                r['peak_memory'] = other['peak_memory']
+        merged.append(r)
+    return merged
+
+
+def _describe(entry):
+    (key, metric, base, value) = entry
+    return "{0} {1}: {2:.1f} -> {3:.1f} ({4:+.0%})".format(key, metric, base,
+        value, (value - base) / float(base))
+
+
+def check(suite, results, baseline, stream=sys.stderr):
+    """Reports on a suite's results and returns whether it passed."""
+    regressions, missing, improvements = compare(baseline, results)
+    for entry in regressions:
+        stream.write("REGRESSION {0}\n".format(_describe(entry)))
+    for key in missing:
+        stream.write("MISSING {0}\n".format(key))
+    for entry in improvements:
+        stream.write("improved {0}\n".format(_describe(entry)))
+    passed = not regressions and not missing
+    stream.write("{0}: {1} ({2} results, {3} regressions, {4} missing)\n"
+        .format(suite, "ok" if passed else "FAILED",
+            len(baseline['results']), len(regressions), len(missing)))
+    return passed
+
+
+def main(argv=None):
+    parser = make_parser("python -m bench.gate [options]")
+    parser.set_defaults(quick=True, repeat=5)
+    parser.add_option('--full', action='store_false', dest='quick',
+        help="run the full problem sizes rather than the quick ones")
+    parser.add_option('--suite', action='append', default=None,
+        choices=sorted(SUITES.keys()),
+        help="the suite to run; may be repeated (default: all)")
+    parser.add_option('--update', action='store_true', default=False,
+        help="record the results as the new baselines")
+    parser.add_option('--results', default=None,
+        help="check results from this file instead of running the suites")
+    parser.add_option('--retries', type='int', default=2,
+        help="number of times to rerun a suite to confirm a regression")
+    parser.add_option('--baselines', default=BASELINE_DIR,
+        help="the directory holding the baseline files")
+    (options, args) = parser.parse_args(argv)
+    suites = options.suite or sorted(SUITES.keys())
+    if options.results is not None:
+        measured = load(options.results)['results']
+    passed = True
+    measured_all = []
+    for suite in suites:
+        if options.results is not None:
+            results = [r for r in measured if r['suite'] == suite]
+        else:
+            sys.stderr.write("Running {0}...\n".format(suite))
+            results = SUITES[suite](options.quick, options.repeat)
+        path = baseline_path(suite, options.baselines)
+        if options.update:
+            measured_all.extend(results)
+            write_results(results, path, tolerance=TOLERANCE,
+                options={'quick': options.quick, 'repeat': options.repeat})
+            sys.stderr.write("Wrote {0}\n".format(path))
+            continue
+        if not os.path.exists(path):
+            sys.stderr.write("{0}: no baseline at {1}\n".format(suite, path))
+            passed = False
+            continue
+        baseline = load(path)
+        # timings on a busy machine are noisy, so confirm any regression by
+        #   running the suite again and keeping the best of the runs
+        for i in range(options.retries if options.results is None else 0):
+            regressions, missing, improvements = compare(baseline, results)
+            if not regressions:
+                break
+            sys.stderr.write("{0}: {1} possible regressions, running " \
+                "again...\n".format(suite, len(regressions)))
+            results = merge(results, SUITES[suite](options.quick,
+                options.repeat))
+        measured_all.extend(results)
+        passed = check(suite, results, baseline) and passed
+    if options.json is not None:
+        write_results(measured_all, options.json)
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
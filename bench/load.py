@@ -0,0 +1,356 @@
+"""Load test simulating many concurrent clients of a stand-in server.
+
+Spawns a number of worker threads or processes, each with its own
+connection, driving a weighted mix of get_row, predict, similar_to and
+cursor scans through the public API for a fixed duration. Reports
+throughput, latency percentiles and error rates per operation, to help size
+worker pools and check rate limiting, retries and circuit breaking under
+load before deploying.
+
+    python -m bench.load --workers 16 --duration 30 --latency 0.02
+    python -m bench.load --mode process --transport http --workers 8 \\
+        --requests-per-second 200 --error-rate 0.01 --retry-after 1
+
+With --transport inprocess (the default), threads share one in-process
+stand-in server; processes each serve their own copy of the same data, so
+only the client side is shared. With --transport http, all workers talk to
+one stand-in served over HTTP from the parent process.
+
+"""
+
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from timeit import default_timer
+import veritable
+from veritable.breaker import CircuitBreaker
+from veritable.ratelimit import RateLimiter, SharedMemoryBackend
+from veritable.standin import StandinServer, make_standin_server
+from veritable.transport import InProcessTransport
+from .common import (synthetic_schema, synthetic_rows, result, report,
+    write_results, make_parser)
+
+SUITE = 'load'
+TABLE_ID = 'load'
+ANALYSIS_ID = 'load'
+
+OPERATIONS = ['get_row', 'predict', 'similar_to', 'scan']
+DEFAULT_MIX = {'get_row': 40, 'predict': 30, 'similar_to': 20, 'scan': 10}
+
+
+def parse_mix(text):
+    """Parses an operation mix such as 'get_row=40,predict=30'."""
+    mix = {}
+    for part in text.split(','):
+        (op, weight) = part.split('=')
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError("Unknown operation {0}".format(op))
+        mix[op] = float(weight)
+    return mix
+
+
+def populate(api, server, nrows, ncols):
+    """Creates the table and analysis the workers use.
+
+    Errors are not injected while the data is loaded.
+
+    """
+    schema = synthetic_schema(ncols)
+    error_rate = server.error_rate
+    server.error_rate = 0.0
+    try:
+        table = api.create_table(TABLE_ID, force=True)
+        table.batch_upload_rows(synthetic_rows(schema, nrows), per_page=1000)
+        table.create_analysis(schema, ANALYSIS_ID).wait()
+    finally:
+        server.error_rate = error_rate
+    return schema
+
+
+def percentile(values, p):
+    """Returns the p-th percentile (0-100) of a sorted list of values."""
+    if not values:
+        return None
+    i = int(round(p / 100.0 * (len(values) - 1)))
+    return values[min(max(i, 0), len(values) - 1)]
+
+
+def _error_name(e):
+    code = getattr(e, 'code', None)
+    if code is not None:
+        return str(code)
+    response = getattr(e, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        return str(status)
+    return e.__class__.__name__
+
+
+class Worker:
+
+    """Drives a mix of operations through one connection.
+
+    Arguments:
+    api -- the API handle to use
+    schema -- the schema of the load table
+    nrows -- the number of rows in the load table
+    mix -- a dict mapping operations to their relative weights
+    scan_rows -- the number of rows read by each cursor scan
+    predict_count -- the number of samples requested by each prediction
+    seed -- the seed for choosing operations and their arguments
+
+    """
+
+    def __init__(self, api, schema, nrows, mix, scan_rows=100,
+                 predict_count=10, seed=0):
+        self.api = api
+        self.schema = schema
+        self.nrows = nrows
+        self.scan_rows = scan_rows
+        self.predict_count = predict_count
+        self.rng = random.Random(seed)
+        self.ops = [op for op in OPERATIONS if mix.get(op, 0) > 0]
+        total = float(sum([mix[op] for op in self.ops]))
+        self.cumulative = []
+        acc = 0.0
+        for op in self.ops:
+            acc += mix[op] / total
+            self.cumulative.append(acc)
+        self.columns = sorted(schema.keys())
+        self.table = api.get_table(TABLE_ID)
+        self.analysis = self.table.get_analysis(ANALYSIS_ID)
+
+    def choose(self):
+        x = self.rng.random()
+        for (op, c) in zip(self.ops, self.cumulative):
+            if x < c:
+                return op
+        return self.ops[-1]
+
+    def _row_id(self):
+        return str(self.rng.randint(0, self.nrows - 1))
+
+    def get_row(self):
+        self.table.get_row(self._row_id())
+
+    def predict(self):
+        self.analysis.predict({self.rng.choice(self.columns): None},
+            count=self.predict_count)
+
+    def similar_to(self):
+        list(self.analysis.similar_to(self._row_id(),
+            self.rng.choice(self.columns), max_rows=10))
+
+    def scan(self):
+        for row in self.table.get_rows(start=self._row_id(),
+                limit=self.scan_rows):
+            pass
+
+    def run(self, duration):
+        """Runs operations for duration seconds.
+
+        Returns a list of (operation, latency, error) samples, where error is
+        None for successful operations.
+
+        """
+        samples = []
+        end = time.time() + duration
+        while time.time() < end:
+            op = self.choose()
+            start = default_timer()
+            error = None
+            try:
+                getattr(self, op)()
+            except Exception as e:
+                error = _error_name(e)
+            samples.append((op, default_timer() - start, error))
+        return samples
+
+
+def _connect(options, url, server, limiter, breaker):
+    kwargs = {'rate_limiter': limiter, 'breaker': breaker,
+        'coalesce_gets': options.coalesce_gets, 'hedge': options.hedge,
+        'timeout': options.timeout}
+    if url is None:
+        kwargs['transport'] = InProcessTransport(server)
+        url = 'http://standin'
+    return veritable.connect('load', url, **kwargs)
+
+
+def _make_server(options):
+    return StandinServer(latency=options.latency, jitter=options.jitter,
+        error_rate=options.error_rate, retry_after=options.retry_after,
+        seed=0)
+
+
+def _work(options, url, server, limiter, index, queue=None):
+    # the body of a worker thread or process
+    if server is None and url is None:
+        # a process serving its own in-process copy of the data
+        server = _make_server(options)
+        populate(_connect(options, None, server, None, None), server,
+            options.rows, options.cols)
+    breaker = CircuitBreaker() if options.breaker else None
+    api = _connect(options, url, server, limiter, breaker)
+    worker = Worker(api, synthetic_schema(options.cols), options.rows,
+        options.mix, scan_rows=options.scan_rows,
+        predict_count=options.predict_count, seed=index)
+    samples = worker.run(options.duration)
+    if queue is not None:
+        queue.put(samples)
+    return samples
+
+
+def summarize(samples, duration, params):
+    """Summarizes samples into one result record per operation, plus 'all'.
+
+    Each record gives the throughput in operations per second, the 50th,
+    90th, 99th percentile and maximum latencies in seconds, the error rate,
+    and the count of each kind of error.
+
+    """
+    by_op = {'all': []}
+    for s in samples:
+        by_op.setdefault(s[0], []).append(s)
+        by_op['all'].append(s)
+    results = []
+    for op in OPERATIONS + ['all']:
+        ops = by_op.get(op)
+        if not ops:
+            continue
+        latencies = sorted([lat for (o, lat, err) in ops])
+        errors = {}
+        for (o, lat, err) in ops:
+            if err is not None:
+                errors[err] = errors.get(err, 0) + 1
+        results.append(result(SUITE, op, params, duration, len(ops), 'ops/s',
+            p50=percentile(latencies, 50), p90=percentile(latencies, 90),
+            p99=percentile(latencies, 99), max=latencies[-1],
+            error_rate=sum(errors.values()) / float(len(ops)),
+            errors=errors))
+    return results
+
+
+def run(options, verbose=True):
+    """Runs the load test and returns a list of result records."""
+    httpd = None
+    url = None
+    server = None
+    if options.transport == 'http':
+        httpd = make_standin_server(port=0, latency=options.latency,
+            jitter=options.jitter, error_rate=options.error_rate,
+            retry_after=options.retry_after, seed=0)
+        t = threading.Thread(target=httpd.serve_forever)
+        t.daemon = True
+        t.start()
+        url = 'http://127.0.0.1:{0}'.format(httpd.server_port)
+        populate(veritable.connect('load', url), httpd.get_app(),
+            options.rows, options.cols)
+    elif options.mode == 'thread':
+        server = _make_server(options)
+        populate(_connect(options, None, server, None, None), server,
+            options.rows, options.cols)
+    limiter = None
+    if options.requests_per_second is not None:
+        backend = SharedMemoryBackend() if options.mode == 'process' else None
+        limiter = RateLimiter(
+            requests_per_second=options.requests_per_second,
+            backend=backend)
+    samples = []
+    try:
+        if options.mode == 'thread':
+            lock = threading.Lock()
+            def target(i):
+                s = _work(options, url, server, limiter, i)
+                with lock:
+                    samples.extend(s)
+            threads = [threading.Thread(target=target, args=(i,))
+                for i in range(options.workers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        else:
+            queue = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=_work,
+                args=(options, url, None, limiter, i, queue))
+                for i in range(options.workers)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                samples.extend(queue.get())
+            for p in procs:
+                p.join()
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+    # every worker runs for the same duration once it has set up
+    duration = options.duration
+    params = {'mode': options.mode, 'transport': options.transport,
+        'workers': options.workers}
+    results = summarize(samples, duration, params)
+    if verbose:
+        for res in results:
+            report(res)
+            sys.stderr.write("    p50 {0:.4f}s  p90 {1:.4f}s  p99 {2:.4f}s  " \
+                "max {3:.4f}s  errors {4:.2%} {5}\n".format(res['p50'],
+                res['p90'], res['p99'], res['max'], res['error_rate'],
+                res['errors'] or ''))
+    return results
+
+
+def make_load_parser():
+    parser = make_parser("python -m bench.load [options]")
+    parser.add_option('--workers', type='int', default=8)
+    parser.add_option('--mode', default='thread',
+        choices=['thread', 'process'])
+    parser.add_option('--transport', default='inprocess',
+        choices=['inprocess', 'http'])
+    parser.add_option('--duration', type='float', default=10.0,
+        help="seconds each worker runs for")
+    parser.add_option('--mix', default=None,
+        help="operation weights, e.g. 'get_row=40,predict=30,similar_to=20," \
+            "scan=10'")
+    parser.add_option('--rows', type='int', default=1000,
+        help="rows in the load table")
+    parser.add_option('--cols', type='int', default=8,
+        help="columns in the load table")
+    parser.add_option('--scan-rows', type='int', default=100,
+        help="rows read by each cursor scan")
+    parser.add_option('--predict-count', type='int', default=10,
+        help="samples requested by each prediction")
+    parser.add_option('--latency', type='float', default=0.0,
+        help="seconds of latency injected by the stand-in server")
+    parser.add_option('--jitter', type='float', default=0.0,
+        help="seconds of random latency added on top of --latency")
+    parser.add_option('--error-rate', type='float', default=0.0,
+        help="probability that the stand-in fails a request with a 503")
+    parser.add_option('--retry-after', type='float', default=None,
+        help="Retry-After seconds sent with injected errors")
+    parser.add_option('--requests-per-second', type='float', default=None,
+        help="client-side rate limit shared by all workers")
+    parser.add_option('--timeout', type='float', default=None,
+        help="per-request timeout in seconds")
+    parser.add_option('--coalesce-gets', action='store_true', default=False)
+    parser.add_option('--hedge', action='store_true', default=False)
+    parser.add_option('--breaker', action='store_true', default=False,
+        help="give each worker a circuit breaker")
+    return parser
+
+
+def main(argv=None):
+    parser = make_load_parser()
+    (options, args) = parser.parse_args(argv)
+    options.mix = parse_mix(options.mix) if options.mix else DEFAULT_MIX
+    if options.quick:
+        options.duration = min(options.duration, 2.0)
+    results = run(options)
+    if options.json is not None:
+        write_results(results, options.json)
+
+
+if __name__ == '__main__':
+    main()
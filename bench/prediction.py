@@ -0,0 +1,86 @@
+"""Client-side cost of Prediction objects.
+
+Measures how fast Prediction objects are built from predicted distributions,
+which computes a point estimate and an uncertainty for every predicted
+column, and how fast credible_values and prob_within are answered, as the
+number of samples and predicted columns grows.
+
+    python -m bench.prediction --json prediction.json
+
+"""
+
+import random
+from veritable.api import Prediction
+from .common import (synthetic_schema, synthetic_value, measure, result,
+    report, write_results, make_parser)
+
+SUITE = 'prediction'
+
+
+def distribution(schema, request, count, seed=0):
+    """Returns count synthetic samples for the predicted columns of request."""
+    rng = random.Random(seed)
+    samples = []
+    for i in range(count):
+        sample = {}
+        for c in request:
+            if request[c] is None:
+                sample[c] = synthetic_value(rng, schema[c]['type'], 10)
+        samples.append(sample)
+    return samples
+
+
+def bench_construct(count, width, npredictions, repeat=3):
+    schema = synthetic_schema(width)
+    request = dict([(c, None) for c in schema])
+    dist = distribution(schema, request, count)
+    def run():
+        for i in range(npredictions):
+            Prediction(request, dist, schema)
+    seconds = measure(run, repeat)
+    return result(SUITE, 'construct', {'count': count, 'width': width},
+        seconds, npredictions, 'predictions/s')
+
+
+def bench_queries(count, width, nqueries, repeat=3):
+    schema = synthetic_schema(width)
+    request = dict([(c, None) for c in schema])
+    prediction = Prediction(request, distribution(schema, request, count),
+        schema)
+    specs = {'real': (-1.0, 1.0), 'count': (10, 50),
+        'categorical': ['cat0', 'cat1'], 'boolean': [True]}
+    columns = sorted(schema.keys())
+    def run():
+        for i in range(nqueries):
+            c = columns[i % len(columns)]
+            prediction.credible_values(c)
+            prediction.prob_within(c, specs[schema[c]['type']])
+    seconds = measure(run, repeat)
+    return result(SUITE, 'queries', {'count': count, 'width': width},
+        seconds, nqueries, 'queries/s')
+
+
+def run(quick=False, repeat=3, verbose=True):
+    """Runs the suite and returns a list of result records."""
+    n = 10 if quick else 100
+    results = []
+    for count in [10, 100, 1000]:
+        for width in [1, 8]:
+            for res in [bench_construct(count, width, n, repeat),
+                        bench_queries(count, width, n, repeat)]:
+                results.append(res)
+                if verbose:
+                    report(res)
+    return results
+
+
+def main(argv=None):
+    parser = make_parser("python -m bench.prediction [options]")
+    (options, args) = parser.parse_args(argv)
+    results = run(quick=options.quick, repeat=options.repeat)
+    if options.json is not None:
+        write_results(results, options.json)
+
+
+if __name__ == '__main__':
+    main()
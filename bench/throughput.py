@@ -0,0 +1,158 @@
+"""End-to-end throughput of the client against a local stand-in server.
+
+Measures rows/s for Table.batch_upload_rows, rows/s for cursor scans of
+Table.get_rows, predictions/s and cells/s for Analysis.batch_predict at
+several sample counts and widths, and rows/s for Grouping.get_rows.
+
+By default the client talks to the stand-in in-process, which measures the
+client's own CPU cost. With --transport http it talks to a stand-in served
+over HTTP on a local port, which adds socket and HTTP overhead and any
+latency injected with --latency.
+
+    python -m bench.throughput --json throughput.json
+
+"""
+
+import threading
+import veritable
+from veritable.standin import StandinServer, make_standin_server
+from veritable.transport import InProcessTransport
+from .common import (synthetic_schema, synthetic_rows, measure, result,
+    report, write_results, make_parser)
+
+SUITE = 'throughput'
+
+
+def make_api(transport='inprocess', latency=0.0, enable_gzip=True):
+    """Connects to a new stand-in server.
+
+    Returns a tuple (api, close), where close stops the server.
+
+    """
+    if transport == 'inprocess':
+        server = StandinServer(latency=latency, seed=0)
+        api = veritable.connect('bench', 'http://standin',
+            transport=InProcessTransport(server), enable_gzip=enable_gzip)
+        return api, lambda: None
+    if transport == 'http':
+        httpd = make_standin_server(port=0, latency=latency, seed=0)
+        t = threading.Thread(target=httpd.serve_forever)
+        t.daemon = True
+        t.start()
+        api = veritable.connect('bench', 'http://127.0.0.1:{0}'.format(
+            httpd.server_port), enable_gzip=enable_gzip)
+        return api, httpd.shutdown
+    raise ValueError("Unknown transport {0}".format(transport))
+
+
+def bench_upload(api, nrows, ncols, per_page=100, repeat=3):
+    schema = synthetic_schema(ncols)
+    rows = list(synthetic_rows(schema, nrows))
+    def setup():
+        return api.create_table()
+    def run(table):
+        table.batch_upload_rows(rows, per_page=per_page)
+    seconds = measure(run, repeat, setup)
+    return result(SUITE, 'upload', {'rows': nrows, 'cols': ncols,
+        'per_page': per_page}, seconds, nrows, 'rows/s')
+
+
+def populate(api, nrows, ncols):
+    """Creates a table of synthetic rows and a finished analysis of it."""
+    schema = synthetic_schema(ncols)
+    table = api.create_table()
+    table.batch_upload_rows(synthetic_rows(schema, nrows), per_page=1000)
+    analysis = table.create_analysis(schema)
+    analysis.wait()
+    return table, analysis, schema
+
+
+def bench_scan(table, nrows, ncols, per_page=100, repeat=3):
+    def run():
+        n = 0
+        for row in veritable.cursor.Cursor(table._conn, table._link('rows'),
+                per_page=per_page):
+            n += 1
+        assert n == nrows
+    seconds = measure(run, repeat)
+    return result(SUITE, 'scan', {'rows': nrows, 'cols': ncols,
+        'per_page': per_page}, seconds, nrows, 'rows/s')
+
+
+def bench_predict(analysis, schema, nrequests, count, width, repeat=3):
+    columns = sorted(schema.keys())
+    requests = []
+    for i in range(nrequests):
+        row = {'_request_id': str(i)}
+        for c in columns[:width]:
+            row[c] = None
+        requests.append(row)
+    def run():
+        n = 0
+        for p in analysis.batch_predict([dict(r) for r in requests], count):
+            n += 1
+        assert n == nrequests
+    seconds = measure(run, repeat)
+    return result(SUITE, 'batch_predict', {'requests': nrequests,
+        'count': count, 'width': width}, seconds, nrequests,
+        'predictions/s', cells_per_second=nrequests * count * width / seconds)
+
+
+def bench_group(analysis, column, nrows, repeat=3):
+    grouping = analysis.get_grouping(column)
+    grouping.wait()
+    def run():
+        n = 0
+        for row in grouping.get_rows():
+            n += 1
+        assert n == nrows
+    seconds = measure(run, repeat)
+    return result(SUITE, 'group_rows', {'rows': nrows}, seconds, nrows,
+        'rows/s')
+
+
+def run(quick=False, repeat=3, transport='inprocess', latency=0.0,
+        enable_gzip=True, verbose=True):
+    """Runs the suite and returns a list of result records."""
+    nrows = 500 if quick else 5000
+    nrequests = 20 if quick else 200
+    results = []
+    def add(res):
+        results.append(res)
+        if verbose:
+            report(res)
+    api, close = make_api(transport, latency, enable_gzip)
+    try:
+        for ncols in [10, 50]:
+            add(bench_upload(api, nrows, ncols, repeat=repeat))
+        table, analysis, schema = populate(api, nrows, 10)
+        for per_page in [100, 1000]:
+            add(bench_scan(table, nrows, 10, per_page=per_page,
+                repeat=repeat))
+        for count in [10, 100]:
+            for width in [1, 5]:
+                add(bench_predict(analysis, schema, nrequests, count, width,
+                    repeat=repeat))
+        add(bench_group(analysis, 'col2', nrows, repeat=repeat))
+    finally:
+        close()
+    return results
+
+
+def main(argv=None):
+    parser = make_parser("python -m bench.throughput [options]")
+    parser.add_option('--transport', default='inprocess',
+        choices=['inprocess', 'http'])
+    parser.add_option('--latency', type='float', default=0.0,
+        help="seconds of latency injected by the stand-in server")
+    parser.add_option('--no-gzip', action='store_true', default=False)
+    (options, args) = parser.parse_args(argv)
+    results = run(quick=options.quick, repeat=options.repeat,
+        transport=options.transport, latency=options.latency,
+        enable_gzip=not options.no_gzip)
+    if options.json is not None:
+        write_results(results, options.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""Scaling curves for the data preparation functions in veritable.utils.
+
+Times read_csv, iter_csv, write_csv, make_schema, clean_data, validate_data
+and clean_predictions on synthetic data while the number of rows, the number
+of columns and the cardinality of categorical columns grow in turn, recording
+the peak memory allocated by each call where tracemalloc is available.
+
+Each curve is summarised by its scaling exponent, the slope of log(time)
+against log(size). The functions should all be linear in rows and columns,
+so an exponent well above 1 points to accidental quadratic behaviour. With
+--strict, the command exits with status 1 if any curve exceeds
+--max-exponent.
+
+    python -m bench.utils_scaling --json utils_scaling.json
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from math import log
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+from veritable.utils import (read_csv, iter_csv, write_csv, make_schema,
+    clean_data, validate_data, clean_predictions)
+from .common import (synthetic_schema, synthetic_rows, measure, result,
+    report, write_results, make_parser)
+
+SUITE = 'utils'
+
+# the largest number of categories validate_data accepts in a column
+MAX_CATS = 256
+
+
+def _copy(rows):
+    return [dict(r) for r in rows]
+
+
+def _case_write_csv(tmpdir):
+    def case(schema, rows):
+        path = os.path.join(tmpdir, 'write.csv')
+        return None, lambda arg: write_csv(rows, path)
+    return case
+
+
+def _case_read_csv(tmpdir):
+    def case(schema, rows):
+        path = os.path.join(tmpdir, 'read.csv')
+        write_csv(rows, path)
+        return None, lambda arg: read_csv(path, id_col='_id')
+    return case
+
+
+def _case_read_csv_schema(tmpdir):
+    def case(schema, rows):
+        path = os.path.join(tmpdir, 'typed.csv')
+        write_csv(rows, path)
+        return None, lambda arg: read_csv(path, id_col='_id', schema=schema)
+    return case
+
+
+def _case_iter_csv(tmpdir):
+    def case(schema, rows):
+        path = os.path.join(tmpdir, 'iter.csv')
+        write_csv(rows, path)
+        def f(arg):
+            for row in iter_csv(path, id_col='_id'):
+                pass
+        return None, f
+    return case
+
+
+def _case_make_schema(schema, rows):
+    rules = [['^col.*', {'type': 'categorical'}]]
+    return None, lambda arg: make_schema(rules, rows=rows)
+
+
+def _case_clean_data(schema, rows):
+    # rows as read from a .csv: every value is a string to be converted
+    strings = list(synthetic_rows(schema, len(rows), as_strings=True))
+    return lambda: _copy(strings), lambda arg: clean_data(arg, schema)
+
+
+def _case_validate_data(schema, rows):
+    return None, lambda arg: validate_data(rows, schema)
+
+
+def _case_clean_predictions(schema, rows):
+    requests = []
+    columns = sorted(schema.keys())
+    for r in rows:
+        req = dict(r)
+        req[columns[0]] = None
+        requests.append(req)
+    return (lambda: _copy(requests),
+        lambda arg: clean_predictions(arg, schema))
+
+
+def cases(tmpdir):
+    """Returns (name, case, max_cardinality) for each benchmarked function.
+
+    A case is called as case(schema, rows) and returns (setup, f) for
+    measure; max_cardinality is the largest cardinality the function
+    accepts, or None.
+
+    """
+    return [
+        ('write_csv', _case_write_csv(tmpdir), None),
+        ('read_csv', _case_read_csv(tmpdir), None),
+        ('iter_csv', _case_iter_csv(tmpdir), None),
+        ('read_csv_schema', _case_read_csv_schema(tmpdir), None),
+        ('make_schema', _case_make_schema, None),
+        ('clean_data', _case_clean_data, None),
+        ('validate_data', _case_validate_data, MAX_CATS),
+        ('clean_predictions', _case_clean_predictions, MAX_CATS)]
+
+
+def peak_memory(f, setup=None):
+    """Returns the peak number of bytes allocated while calling f.
+
+    Returns None if tracemalloc is not available.
+
+    """
+    if tracemalloc is None:
+        return None
+    arg = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        f(arg)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def exponent(points):
+    """Returns the least-squares slope of log(seconds) against log(size).
+
+    Arguments:
+    points -- a list of (size, seconds) pairs
+
+    """
+    xs = [log(s) for (s, t) in points]
+    ys = [log(max(t, 1e-9)) for (s, t) in points]
+    n = float(len(xs))
+    mx = sum(xs) / n
+    my = sum(ys) / n
+    sxx = sum([(x - mx) ** 2 for x in xs])
+    if sxx == 0:
+        return None
+    return sum([(x - mx) * (y - my) for (x, y) in zip(xs, ys)]) / sxx
+
+
+def sweeps(quick=False):
+    """Returns the curves to measure as (dimension, sizes, settings).
+
+    Each curve varies one of rows, cols and cardinality over sizes while
+    the others keep their value in settings.
+
+    """
+    if quick:
+        return [
+            ('rows', [250, 500, 1000, 2000],
+                {'rows': None, 'cols': 10, 'cardinality': 10}),
+            ('cols', [5, 10, 20, 40],
+                {'rows': 500, 'cols': None, 'cardinality': 10}),
+            ('cardinality', [4, 16, 64, 256, 1024],
+                {'rows': 2000, 'cols': 4, 'cardinality': None})]
+    return [
+        ('rows', [1000, 2000, 4000, 8000, 16000],
+            {'rows': None, 'cols': 20, 'cardinality': 10}),
+        ('cols', [5, 10, 20, 40, 80],
+            {'rows': 2000, 'cols': None, 'cardinality': 10}),
+        ('cardinality', [4, 16, 64, 256, 1024, 4096],
+            {'rows': 10000, 'cols': 4, 'cardinality': None})]
+
+
+def run(quick=False, repeat=3, memory=True, verbose=True):
+    """Runs the suite.
+
+    Returns a tuple (results, curves) of result records and curve
+    summaries.
+
+    """
+    results = []
+    curves = []
+    # the sweeps cross at some points, which are only measured once
+    measured = {}
+    tmpdir = tempfile.mkdtemp(prefix='veritable-bench-')
+    try:
+        for (dimension, sizes, settings) in sweeps(quick):
+            for (name, case, max_cardinality) in cases(tmpdir):
+                points = []
+                for size in sizes:
+                    params = dict(settings)
+                    params[dimension] = size
+                    if (max_cardinality is not None and
+                            params['cardinality'] > max_cardinality):
+                        continue
+                    key = (name, tuple(sorted(params.items())))
+                    if key in measured:
+                        points.append((size, measured[key]))
+                        continue
+                    schema = synthetic_schema(params['cols'])
+                    rows = list(synthetic_rows(schema, params['rows'],
+                        cardinality=params['cardinality']))
+                    try:
+                        setup, f = case(schema, rows)
+                        seconds = measure(f, repeat, setup or (lambda: None))
+                    except Exception as e:
+                        # a broken case skips the rest of its curve rather
+                        #   than the whole suite
+                        sys.stderr.write("{0}.{1} failed: {2!r}\n".format(
+                            SUITE, name, e))
+                        break
+                    res = result(SUITE, name, params, seconds,
+                        params['rows'], 'rows/s', dimension=dimension,
+                        peak_memory=peak_memory(f, setup) if memory else None)
+                    results.append(res)
+                    if verbose:
+                        report(res)
+                    measured[key] = seconds
+                    points.append((size, seconds))
+                if len(points) < 2:
+                    continue
+                curve = {'suite': SUITE, 'name': name,
+                    'dimension': dimension, 'sizes': [s for (s, t) in points],
+                    'exponent': exponent(points)}
+                curves.append(curve)
+                if verbose:
+                    sys.stderr.write("{0}.{1} over {2}: exponent {3:.2f}\n"
+                        .format(SUITE, name, dimension, curve['exponent']))
+    finally:
+        shutil.rmtree(tmpdir)
+    return results, curves
+
+
+def main(argv=None):
+    parser = make_parser("python -m bench.utils_scaling [options]")
+    parser.add_option('--no-memory', action='store_true', default=False,
+        help="skip the peak memory measurements")
+    parser.add_option('--max-exponent', type='float', default=1.3,
+        help="the largest acceptable scaling exponent")
+    parser.add_option('--strict', action='store_true', default=False,
+        help="exit with status 1 if any curve exceeds --max-exponent")
+    (options, args) = parser.parse_args(argv)
+    results, curves = run(quick=options.quick, repeat=options.repeat,
+        memory=not options.no_memory)
+    superlinear = [c for c in curves if c['exponent'] is not None and
+        c['exponent'] > options.max_exponent]
+    for c in superlinear:
+        sys.stderr.write("Superlinear: {0}.{1} over {2} has exponent " \
+            "{3:.2f}\n".format(c['suite'], c['name'], c['dimension'],
+            c['exponent']))
+    if options.json is not None:
+        write_results(results, options.json, curves=curves)
+    if options.strict and superlinear:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#! usr/bin/python
+# coding=utf-8
+
+from bench.common import result, result_key, measure
+from bench.gate import compare, merge
+from bench.utils_scaling import exponent
+from bench.load import (percentile, parse_mix, summarize, make_load_parser,
+    DEFAULT_MIX)
+from bench import load
+from nose.tools import assert_raises
+
+
+def _baseline(*results):
+    return {'results': list(results),
+        'tolerance': {'rate': 0.2, 'peak_memory': 0.1}}
+
+
+def test_result_key():
+    res = result('suite', 'name', {'b': 2, 'a': 1}, 1.0, 10, 'rows/s')
+    assert result_key(res) == 'suite.name[a=1,b=2]'
+    assert res['rate'] == 10.0
+
+
+def test_measure_min_time():
+    calls = []
+    seconds = measure(lambda: calls.append(1), repeat=2, min_time=0.01)
+    assert len(calls) > 2
+    assert seconds < 0.01
+
+
+def test_measure_setup():
+    args = []
+    measure(lambda arg: args.append(arg), repeat=3, setup=lambda: 'x',
+        min_time=0)
+    assert args == ['x', 'x', 'x']
+
+
+def test_compare_within_tolerance():
+    base = result('s', 'n', {}, 1.0, 100, 'rows/s', peak_memory=1000)
+    res = result('s', 'n', {}, 1.0, 85, 'rows/s', peak_memory=1050)
+    assert compare(_baseline(base), [res]) == ([], [], [])
+
+
+def test_compare_rate_regression():
+    base = result('s', 'n', {}, 1.0, 100, 'rows/s')
+    res = result('s', 'n', {}, 1.0, 75, 'rows/s')
+    regressions, missing, improvements = compare(_baseline(base), [res])
+    assert regressions == [('s.n[]', 'rate', 100.0, 75.0)]
+
+
+def test_compare_memory_regression():
+    base = result('s', 'n', {}, 1.0, 100, 'rows/s', peak_memory=1000)
+    res = result('s', 'n', {}, 1.0, 100, 'rows/s', peak_memory=1200)
+    regressions, missing, improvements = compare(_baseline(base), [res])
+    assert regressions == [('s.n[]', 'peak_memory', 1000, 1200)]
+
+
+def test_compare_no_memory():
+    base = result('s', 'n', {}, 1.0, 100, 'rows/s', peak_memory=None)
+    res = result('s', 'n', {}, 1.0, 100, 'rows/s', peak_memory=5000)
+    assert compare(_baseline(base), [res]) == ([], [], [])
+
+
+def test_compare_missing():
+    base = result('s', 'n', {'rows': 10}, 1.0, 100, 'rows/s')
+    res = result('s', 'n', {'rows': 20}, 1.0, 100, 'rows/s')
+    regressions, missing, improvements = compare(_baseline(base), [res])
+    assert missing == ['s.n[rows=10]']
+
+
+def test_compare_improvement():
+    base = result('s', 'n', {}, 1.0, 100, 'rows/s')
+    res = result('s', 'n', {}, 1.0, 150, 'rows/s')
+    regressions, missing, improvements = compare(_baseline(base), [res])
+    assert regressions == []
+    assert len(improvements) == 1
+
+
+def test_compare_explicit_tolerance():
+    base = result('s', 'n', {}, 1.0, 100, 'rows/s')
+    res = result('s', 'n', {}, 1.0, 75, 'rows/s')
+    regressions, missing, improvements = compare(_baseline(base), [res],
+        tolerance={'rate': 0.5, 'peak_memory': 0.5})
+    assert regressions == []
+
+
+def test_merge_keeps_best():
+    a = result('s', 'n', {}, 1.0, 100, 'rows/s', peak_memory=1000)
+    b = result('s', 'n', {}, 0.5, 100, 'rows/s', peak_memory=2000)
+    merged = merge([a], [b])
+    assert len(merged) == 1
+    assert merged[0]['rate'] == 200.0
+    assert merged[0]['peak_memory'] == 1000
+
+
+def test_exponent():
+    linear = [(n, n * 1e-6) for n in [100, 200, 400, 800]]
+    quadratic = [(n, n * n * 1e-9) for n in [100, 200, 400, 800]]
+    assert abs(exponent(linear) - 1.0) < 1e-6
+    assert abs(exponent(quadratic) - 2.0) < 1e-6
+    assert exponent([(100, 1.0), (100, 2.0)]) is None
+
+
+def test_percentile():
+    values = list(range(101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([], 50) is None
+
+
+def test_parse_mix():
+    assert parse_mix('get_row=3, scan=1') == {'get_row': 3.0, 'scan': 1.0}
+    assert_raises(ValueError, parse_mix, 'delete=1')
+
+
+def test_summarize():
+    samples = [('get_row', 0.1, None), ('get_row', 0.3, '503'),
+        ('scan', 0.2, None)]
+    results = dict([(r['name'], r) for r in summarize(samples, 2.0, {})])
+    assert sorted(results.keys()) == ['all', 'get_row', 'scan']
+    assert results['get_row']['rate'] == 1.0
+    assert results['get_row']['error_rate'] == 0.5
+    assert results['get_row']['errors'] == {'503': 1}
+    assert results['all']['items'] == 3
+    assert results['all']['max'] == 0.3
+
+
+def test_load_over_http():
+    # a short run of the load harness against a stand-in served over HTTP
+    parser = make_load_parser()
+    (options, args) = parser.parse_args(['--transport', 'http',
+        '--workers', '2', '--duration', '0.3', '--rows', '20'])
+    options.mix = DEFAULT_MIX
+    results = load.run(options, verbose=False)
+    total = [r for r in results if r['name'] == 'all'][0]
+    assert total['items'] > 0
+    assert total['error_rate'] == 0.0
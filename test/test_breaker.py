@@ -0,0 +1,116 @@
+#! usr/bin/python
+# coding=utf-8
+
+import time
+from nose.tools import assert_raises, assert_true, assert_equal
+from veritable.exceptions import VeritableError
+from veritable.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def _fail(breaker, n, duration=0.0):
+    for i in range(n):
+        breaker.admit()
+        breaker.record(False, duration)
+
+
+def _succeed(breaker, n, duration=0.0):
+    for i in range(n):
+        breaker.admit()
+        breaker.record(True, duration)
+
+
+def test_invalid_arguments():
+    assert_raises(VeritableError, CircuitBreaker, window=0)
+    assert_raises(VeritableError, CircuitBreaker, half_open_calls=0)
+
+
+def test_opens_on_failure_rate():
+    b = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4)
+    _succeed(b, 2)
+    _fail(b, 1)
+    assert_equal(b.state, CLOSED)
+    _fail(b, 1)
+    assert_equal(b.state, OPEN)
+    try:
+        b.admit()
+    except VeritableError as e:
+        assert_equal(e.code, 'circuit_open')
+    else:
+        assert False, "breaker did not fail fast"
+
+
+def test_min_calls():
+    b = CircuitBreaker(window=10, min_calls=5)
+    _fail(b, 4)
+    assert_equal(b.state, CLOSED)
+    _fail(b, 1)
+    assert_equal(b.state, OPEN)
+
+
+def test_window_forgets_old_failures():
+    b = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4)
+    _fail(b, 1)
+    _succeed(b, 3)
+    _succeed(b, 1)
+    _fail(b, 1)
+    assert_equal(b.state, CLOSED)
+
+
+def test_opens_on_slow_calls():
+    b = CircuitBreaker(slow_call_duration=1.0, slow_call_rate=0.5, window=4,
+        min_calls=4)
+    _succeed(b, 2, duration=0.1)
+    _succeed(b, 2, duration=2.0)
+    assert_equal(b.state, OPEN)
+
+
+def test_slow_calls_ignored_without_threshold():
+    b = CircuitBreaker(window=4, min_calls=4)
+    _succeed(b, 4, duration=100.0)
+    assert_equal(b.state, CLOSED)
+
+
+def test_half_open_probe_success():
+    changes = []
+    b = CircuitBreaker(window=2, min_calls=2, reset_timeout=0.1,
+        on_state_change=lambda old, new: changes.append((old, new)))
+    _fail(b, 2)
+    time.sleep(0.15)
+    b.admit()
+    assert_equal(b.state, HALF_OPEN)
+    assert_raises(VeritableError, b.admit)
+    b.record(True)
+    assert_equal(b.state, CLOSED)
+    assert_equal(changes, [(CLOSED, OPEN), (OPEN, HALF_OPEN),
+        (HALF_OPEN, CLOSED)])
+
+
+def test_half_open_probe_failure():
+    b = CircuitBreaker(window=2, min_calls=2, reset_timeout=0.1)
+    _fail(b, 2)
+    time.sleep(0.15)
+    b.admit()
+    b.record(False)
+    assert_equal(b.state, OPEN)
+    assert_raises(VeritableError, b.admit)
+
+
+def test_cancel_returns_probe():
+    b = CircuitBreaker(window=2, min_calls=2, reset_timeout=0.1)
+    _fail(b, 2)
+    time.sleep(0.15)
+    b.admit()
+    b.cancel()
+    b.admit()
+    b.record(True)
+    assert_equal(b.state, CLOSED)
+
+
+def test_reset_and_listener():
+    changes = []
+    b = CircuitBreaker(window=2, min_calls=2)
+    b.add_listener(lambda old, new: changes.append(new))
+    _fail(b, 2)
+    b.reset()
+    assert_equal(b.state, CLOSED)
+    assert_equal(changes, [OPEN, CLOSED])
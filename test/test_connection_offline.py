@@ -0,0 +1,325 @@
+#! usr/bin/python
+# coding=utf-8
+
+# Exercises the Connection machinery offline, against a fake session that
+# stands in for the requests session.
+
+import json
+import threading
+import time
+from nose.tools import assert_raises, assert_true, assert_equal
+from veritable.exceptions import VeritableError
+from veritable.connection import Connection
+from veritable.ratelimit import RateLimiter
+from veritable.scheduler import RequestScheduler, INTERACTIVE, BULK
+from veritable.breaker import CircuitBreaker
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content='{}', headers={}):
+        self.status_code = status_code
+        self.content = content.encode('utf-8')
+        self.headers = headers
+
+    def raise_for_status(self):
+        raise VeritableError("HTTP Error {0}".format(self.status_code),
+            status=self.status_code)
+
+
+class FakeSession:
+    def __init__(self, handler=None, delay=0):
+        self.handler = handler or (lambda method, url, kwargs: FakeResponse(
+            content=json.dumps({'url': url})))
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _request(self, method, url, kwargs):
+        with self.lock:
+            self.calls.append((method, url, kwargs))
+        if self.delay:
+            time.sleep(self.delay)
+        return self.handler(method, url, kwargs)
+
+    def get(self, url, **kwargs):
+        return self._request('get', url, kwargs)
+
+    def post(self, url, **kwargs):
+        return self._request('post', url, kwargs)
+
+    def put(self, url, **kwargs):
+        return self._request('put', url, kwargs)
+
+    def delete(self, url, **kwargs):
+        return self._request('delete', url, kwargs)
+
+
+class FakeConnection(Connection):
+    def __init__(self, session=None, **kwargs):
+        self._fake_session = session or FakeSession()
+        Connection.__init__(self, 'key', 'http://localhost', **kwargs)
+
+    def _create_session(self):
+        return self._fake_session
+
+
+def _run_threads(n, f):
+    results = [None] * n
+    def run(i):
+        results[i] = f()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class TestSingleFlight:
+    def test_concurrent_gets_coalesced(self):
+        conn = FakeConnection(FakeSession(delay=0.2), coalesce_gets=True)
+        results = _run_threads(8, lambda: conn.get('tables/t1'))
+        assert_equal(len(conn.session.calls), 1)
+        for r in results:
+            assert_equal(r, {'url': 'http://localhost/tables/t1'})
+        assert_equal(len(set(id(r) for r in results)), 8)
+
+    def test_gets_with_timeouts_coalesced(self):
+        conn = FakeConnection(FakeSession(delay=0.2), coalesce_gets=True)
+        results = _run_threads(2, lambda: conn.get('tables/t1', timeout=5,
+            deadline=time.time() + 5))
+        assert_equal(len(conn.session.calls), 1)
+        assert_equal(results, [{'url': 'http://localhost/tables/t1'}] * 2)
+
+    def test_distinct_params_not_coalesced(self):
+        conn = FakeConnection(FakeSession(delay=0.2), coalesce_gets=True)
+        _run_threads(4, lambda: conn.get('tables',
+            params={'start': str(threading.current_thread().name)}))
+        assert_equal(len(conn.session.calls), 4)
+
+    def test_sequential_gets_not_coalesced(self):
+        conn = FakeConnection(coalesce_gets=True)
+        conn.get('tables/t1')
+        conn.get('tables/t1')
+        assert_equal(len(conn.session.calls), 2)
+
+    def test_errors_fan_out(self):
+        session = FakeSession(delay=0.2, handler=lambda m, u, k: FakeResponse(
+            status_code=404, content=json.dumps({'code': 'not_found',
+                'message': 'missing'})))
+        conn = FakeConnection(session, coalesce_gets=True)
+        def get():
+            try:
+                conn.get('tables/t1')
+            except VeritableError as e:
+                return e.status
+        assert_equal(_run_threads(4, get), [404] * 4)
+        assert_equal(len(session.calls), 1)
+
+    def test_coalescing_disabled_by_default(self):
+        conn = FakeConnection(FakeSession(delay=0.1))
+        _run_threads(4, lambda: conn.get('tables/t1'))
+        assert_equal(len(conn.session.calls), 4)
+
+
+class TestRateLimiting:
+    def test_retry_after(self):
+        responses = [FakeResponse(status_code=429, headers={'Retry-After':
+            '0.2'}), FakeResponse(content='"ok"')]
+        session = FakeSession(handler=lambda m, u, k: responses.pop(0))
+        conn = FakeConnection(session, rate_limiter=RateLimiter())
+        start = time.time()
+        assert_equal(conn.get('tables'), 'ok')
+        assert_true(time.time() - start > 0.15)
+        assert_equal(len(session.calls), 2)
+
+    def test_retry_limit(self):
+        session = FakeSession(handler=lambda m, u, k: FakeResponse(
+            status_code=429, headers={'Retry-After': '0'}))
+        conn = FakeConnection(session,
+            rate_limiter=RateLimiter(max_retries=2))
+        assert_raises(Exception, conn.get, 'tables')
+        assert_equal(len(session.calls), 3)
+
+    def test_no_retry_without_limiter(self):
+        session = FakeSession(handler=lambda m, u, k: FakeResponse(
+            status_code=429, headers={'Retry-After': '0'}))
+        conn = FakeConnection(session)
+        assert_raises(Exception, conn.get, 'tables')
+        assert_equal(len(session.calls), 1)
+
+    def test_cells_limited(self):
+        conn = FakeConnection(rate_limiter=RateLimiter(cells_per_second=100))
+        start = time.time()
+        for i in range(3):
+            conn.post('tables/t/rows', {'action': 'put',
+                'rows': [{'_id': str(j), 'a': j} for j in range(25)]})
+        assert_true(time.time() - start > 0.3)
+
+
+class TestTimeouts:
+    def test_default_timeout(self):
+        conn = FakeConnection(timeout=(1, 5))
+        conn.get('tables')
+        assert_equal(conn.session.calls[0][2]['timeout'], (1, 5))
+
+    def test_no_timeout(self):
+        conn = FakeConnection()
+        conn.get('tables')
+        assert_true('timeout' not in conn.session.calls[0][2])
+
+    def test_call_timeout_overrides_default(self):
+        conn = FakeConnection(timeout=10)
+        conn.post('tables', {}, timeout=2)
+        assert_equal(conn.session.calls[0][2]['timeout'], 2)
+
+    def test_deadline_caps_timeout(self):
+        conn = FakeConnection(timeout=(1, 60))
+        conn.get('tables', deadline=time.time() + 5)
+        connect, read = conn.session.calls[0][2]['timeout']
+        assert_equal(connect, 1)
+        assert_true(4 < read <= 5)
+
+    def test_deadline_exceeded(self):
+        conn = FakeConnection()
+        assert_raises(VeritableError, conn.get, 'tables',
+            deadline=time.time() - 1)
+        assert_equal(len(conn.session.calls), 0)
+
+
+class TestHedging:
+    def _slow_first_session(self, delay):
+        state = {'n': 0}
+        lock = threading.Lock()
+        def handler(method, url, kwargs):
+            with lock:
+                state['n'] += 1
+                n = state['n']
+            if n == 1:
+                time.sleep(delay)
+            return FakeResponse(content=json.dumps(n))
+        return FakeSession(handler=handler)
+
+    def test_hedged_get(self):
+        conn = FakeConnection(self._slow_first_session(1.0), hedge=True,
+            hedge_delay=0.05)
+        start = time.time()
+        assert_equal(conn.get('tables'), 2)
+        assert_true(time.time() - start < 0.5)
+
+    def test_fast_request_not_hedged(self):
+        conn = FakeConnection(hedge=True, hedge_delay=0.5)
+        conn.get('tables')
+        time.sleep(0.1)
+        assert_equal(len(conn.session.calls), 1)
+
+    def test_idempotent_post_hedged(self):
+        conn = FakeConnection(self._slow_first_session(1.0), hedge=True,
+            hedge_delay=0.05)
+        assert_equal(conn.post('predict', {}, idempotent=True), 2)
+
+    def test_post_not_hedged(self):
+        conn = FakeConnection(self._slow_first_session(0.3), hedge=True,
+            hedge_delay=0.05)
+        assert_equal(conn.post('rows', {}), 1)
+        assert_equal(len(conn.session.calls), 1)
+
+    def test_hedge_waits_for_latency_history(self):
+        conn = FakeConnection(self._slow_first_session(0.3), hedge=True)
+        assert_equal(conn.get('tables'), 1)
+        assert_equal(len(conn.session.calls), 1)
+
+    def test_hedge_delay_from_percentile(self):
+        conn = FakeConnection(hedge=True)
+        for i in range(30):
+            conn.get('tables')
+        assert_true(conn._latencies['get'].percentile(95) is not None)
+        assert_true(conn._latencies['post'].percentile(95) is None)
+
+
+class TestScheduling:
+    def test_priority_passed_to_scheduler(self):
+        seen = []
+        class RecordingScheduler(RequestScheduler):
+            def acquire(self, priority, timeout=None):
+                seen.append(priority)
+                RequestScheduler.acquire(self, priority, timeout)
+        scheduler = RecordingScheduler()
+        conn = FakeConnection(scheduler=scheduler)
+        conn.get('tables')
+        conn.post('tables/t/rows', {'action': 'put', 'rows': []},
+            priority=BULK)
+        assert_equal(seen, [INTERACTIVE, BULK])
+        assert_equal(scheduler.stats()[BULK]['active'], 0)
+
+    def test_deadline_bounds_queueing(self):
+        scheduler = RequestScheduler({INTERACTIVE: 1, BULK: 1})
+        conn = FakeConnection(scheduler=scheduler)
+        scheduler.acquire(INTERACTIVE)
+        start = time.time()
+        assert_raises(VeritableError, conn.get, 'tables',
+            deadline=time.time() + 0.05)
+        assert_true(time.time() - start < 1)
+        assert_equal(scheduler.stats()[INTERACTIVE],
+            {'active': 1, 'waiting': 0})
+
+    def test_slot_released_on_error(self):
+        def handler(method, url, kwargs):
+            raise IOError("connection reset")
+        scheduler = RequestScheduler({INTERACTIVE: 1, BULK: 1})
+        conn = FakeConnection(FakeSession(handler=handler),
+            scheduler=scheduler)
+        assert_raises(IOError, conn.get, 'tables')
+        assert_equal(scheduler.stats()[INTERACTIVE]['active'], 0)
+
+    def test_bulk_limit(self):
+        scheduler = RequestScheduler({INTERACTIVE: 4, BULK: 1})
+        conn = FakeConnection(FakeSession(delay=0.1), scheduler=scheduler)
+        start = time.time()
+        _run_threads(3, lambda: conn.get('tables/t/rows', priority=BULK))
+        assert_true(time.time() - start > 0.25)
+
+
+class TestCircuitBreaking:
+    def test_fail_fast_when_open(self):
+        session = FakeSession(handler=lambda m, u, k: FakeResponse(
+            status_code=500))
+        breaker = CircuitBreaker(window=3, min_calls=3, reset_timeout=60)
+        conn = FakeConnection(session, breaker=breaker)
+        for i in range(3):
+            assert_raises(VeritableError, conn.get, 'tables')
+        assert_equal(breaker.state, 'open')
+        try:
+            conn.get('tables')
+        except VeritableError as e:
+            assert_equal(e.code, 'circuit_open')
+        assert_equal(len(session.calls), 3)
+
+    def test_network_errors_count(self):
+        def handler(method, url, kwargs):
+            raise IOError("connection refused")
+        breaker = CircuitBreaker(window=2, min_calls=2)
+        conn = FakeConnection(FakeSession(handler=handler), breaker=breaker)
+        for i in range(2):
+            assert_raises(IOError, conn.get, 'tables')
+        assert_equal(breaker.state, 'open')
+
+    def test_client_errors_do_not_count(self):
+        session = FakeSession(handler=lambda m, u, k: FakeResponse(
+            status_code=404, content=json.dumps({'code': 'not_found',
+                'message': 'missing'})))
+        breaker = CircuitBreaker(window=2, min_calls=2)
+        conn = FakeConnection(session, breaker=breaker)
+        for i in range(4):
+            assert_raises(VeritableError, conn.get, 'tables/missing')
+        assert_equal(breaker.state, 'closed')
+
+    def test_unsent_request_cancelled(self):
+        breaker = CircuitBreaker(window=1, min_calls=1, reset_timeout=0)
+        breaker.admit()
+        breaker.record(False)
+        conn = FakeConnection(breaker=breaker)
+        assert_raises(VeritableError, conn.get, 'tables',
+            deadline=time.time() - 1)
+        assert_equal(conn.get('tables'), {'url': 'http://localhost/tables'})
+        assert_equal(breaker.state, 'closed')
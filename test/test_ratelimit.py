@@ -0,0 +1,143 @@
+#! usr/bin/python
+# coding=utf-8
+
+import os
+import time
+import threading
+import multiprocessing
+from tempfile import mkstemp
+from nose.tools import assert_raises, assert_true, assert_equal
+from veritable.exceptions import VeritableError
+from veritable.ratelimit import (RateLimiter, TokenBucket, LocalBackend,
+    FileBackend, SharedMemoryBackend, _retry_after, _count_cells)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers={}):
+        self.status_code = status_code
+        self.headers = headers
+
+
+def test_count_cells_rows():
+    assert_equal(_count_cells({'action': 'put', 'rows': [{'_id': '1',
+        'a': 1}, {'_id': '2'}]}), 3)
+
+
+def test_count_cells_predictions():
+    assert_equal(_count_cells({'data': {'a': 1, 'b': None, 'c': None},
+        'count': 10, 'return_fixed': False}), 20)
+    assert_equal(_count_cells({'data': [{'a': None}, {'a': None, 'b': None}],
+        'count': 5}), 15)
+
+
+def test_count_cells_other():
+    assert_equal(_count_cells({'_id': 'foo', 'description': ''}), 0)
+    assert_equal(_count_cells(None), 0)
+
+
+def test_retry_after_seconds():
+    assert_equal(_retry_after(FakeResponse(429, {'Retry-After': '2'})), 2.0)
+    assert_equal(_retry_after(FakeResponse(503, {'Retry-After': '0.5'})), 0.5)
+
+
+def test_retry_after_date():
+    delay = _retry_after(FakeResponse(429,
+        {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}))
+    assert_equal(delay, 0.0)
+
+
+def test_retry_after_ignored():
+    assert_true(_retry_after(FakeResponse(200, {'Retry-After': '2'})) is None)
+    assert_true(_retry_after(FakeResponse(429)) is None)
+    assert_true(_retry_after(FakeResponse(429, {'Retry-After': 'x'})) is None)
+
+
+def test_bucket_invalid_rate():
+    assert_raises(VeritableError, TokenBucket, 'requests', 0)
+
+
+def test_bucket_burst_then_rate():
+    bucket = TokenBucket('requests', 100, capacity=10)
+    start = time.time()
+    for i in range(10):
+        bucket.acquire()
+    assert_true(time.time() - start < 0.05)
+    for i in range(20):
+        bucket.acquire()
+    elapsed = time.time() - start
+    assert_true(0.15 < elapsed < 0.5)
+
+
+def test_bucket_oversized_acquire():
+    bucket = TokenBucket('cells', 100, capacity=10)
+    bucket.acquire(50)
+    start = time.time()
+    bucket.acquire(1)
+    assert_true(time.time() - start > 0.3)
+
+
+def test_limiter_shared_across_threads():
+    limiter = RateLimiter(requests_per_second=100, burst=0.1)
+    start = time.time()
+    threads = [threading.Thread(target=lambda: [limiter.acquire()
+        for j in range(10)]) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert_true(time.time() - start > 0.25)
+
+
+def test_limiter_pause():
+    limiter = RateLimiter()
+    limiter.pause(0.2)
+    start = time.time()
+    limiter.acquire()
+    assert_true(time.time() - start > 0.15)
+
+
+def test_limiter_cells():
+    limiter = RateLimiter(cells_per_second=1000)
+    limiter.acquire(1000)
+    start = time.time()
+    limiter.acquire(200)
+    assert_true(time.time() - start > 0.15)
+
+
+def test_file_backend_shared():
+    handle, filename = mkstemp()
+    os.close(handle)
+    a = RateLimiter(requests_per_second=50, burst=0.1,
+        backend=FileBackend(filename))
+    b = RateLimiter(requests_per_second=50, burst=0.1,
+        backend=FileBackend(filename))
+    start = time.time()
+    for i in range(5):
+        a.acquire()
+        b.acquire()
+    assert_true(time.time() - start > 0.08)
+    os.remove(filename)
+
+
+def _acquire_n(limiter, n):
+    for i in range(n):
+        limiter.acquire()
+
+
+def test_shared_memory_backend():
+    limiter = RateLimiter(requests_per_second=100, burst=0.1,
+        backend=SharedMemoryBackend())
+    start = time.time()
+    procs = [multiprocessing.Process(target=_acquire_n, args=(limiter, 10))
+        for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert_true(time.time() - start > 0.2)
+
+
+def test_shared_memory_backend_unknown_slot():
+    backend = SharedMemoryBackend(names=('requests',))
+    assert_raises(VeritableError, backend.transact, 'cells',
+        lambda s: (s, None))
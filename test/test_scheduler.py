@@ -0,0 +1,124 @@
+#! usr/bin/python
+# coding=utf-8
+
+import time
+import threading
+from nose.tools import assert_raises, assert_true, assert_equal
+from veritable.exceptions import VeritableError
+from veritable.scheduler import RequestScheduler, INTERACTIVE, BULK
+
+
+def _start(f, *args):
+    t = threading.Thread(target=f, args=args)
+    t.start()
+    return t
+
+
+def _wait_for(scheduler, priority, waiting):
+    for i in range(200):
+        if scheduler.stats()[priority]['waiting'] == waiting:
+            return
+        time.sleep(0.005)
+    assert False, "timed out waiting for queued requests"
+
+
+def test_default_order():
+    s = RequestScheduler()
+    assert_equal(s.order, [INTERACTIVE, BULK])
+    assert_equal(s.max_concurrent, 10)
+    s = RequestScheduler({BULK: 1, 'background': 1, INTERACTIVE: 1})
+    assert_equal(s.order, [INTERACTIVE, 'background', BULK])
+
+
+def test_invalid_limits():
+    assert_raises(VeritableError, RequestScheduler, {INTERACTIVE: 0})
+    assert_raises(VeritableError, RequestScheduler, {INTERACTIVE: 1},
+        order=[INTERACTIVE, BULK])
+
+
+def test_unknown_priority():
+    s = RequestScheduler()
+    assert_raises(VeritableError, s.acquire, 'urgent')
+
+
+def test_class_limit():
+    s = RequestScheduler({INTERACTIVE: 2, BULK: 1})
+    s.acquire(BULK)
+    done = []
+    t = _start(lambda: (s.acquire(BULK), done.append(BULK)))
+    _wait_for(s, BULK, 1)
+    s.acquire(INTERACTIVE)
+    s.acquire(INTERACTIVE)
+    assert_equal(done, [])
+    s.release(BULK)
+    t.join()
+    assert_equal(done, [BULK])
+    assert_equal(s.stats(), {INTERACTIVE: {'active': 2, 'waiting': 0},
+        BULK: {'active': 1, 'waiting': 0}})
+
+
+def test_interactive_jumps_queue():
+    s = RequestScheduler({INTERACTIVE: 1, BULK: 1}, max_concurrent=1)
+    order = []
+    def run(priority, name):
+        s.acquire(priority)
+        order.append(name)
+        s.release(priority)
+    s.acquire(BULK)
+    threads = [_start(run, BULK, 'bulk1')]
+    _wait_for(s, BULK, 1)
+    threads.append(_start(run, BULK, 'bulk2'))
+    _wait_for(s, BULK, 2)
+    threads.append(_start(run, INTERACTIVE, 'interactive'))
+    _wait_for(s, INTERACTIVE, 1)
+    s.release(BULK)
+    for t in threads:
+        t.join()
+    assert_equal(order, ['interactive', 'bulk1', 'bulk2'])
+
+
+def test_timed_out_waiter_gives_up_its_ticket():
+    s = RequestScheduler({INTERACTIVE: 1, BULK: 1})
+    s.acquire(BULK)
+    assert_raises(VeritableError, s.acquire, BULK, timeout=0.01)
+    assert_equal(s.stats()[BULK], {'active': 1, 'waiting': 0})
+    done = []
+    t = _start(lambda: (s.acquire(BULK), done.append(BULK)))
+    _wait_for(s, BULK, 1)
+    s.release(BULK)
+    t.join()
+    assert_equal(done, [BULK])
+
+
+def test_interrupted_waiter_gives_up_its_ticket():
+    s = RequestScheduler({INTERACTIVE: 1, BULK: 1})
+    s.acquire(BULK)
+    errors = []
+    done = []
+    wait = s._cond.wait
+    def interruptible_wait(*args):
+        if threading.current_thread().name == 'interrupted':
+            raise KeyboardInterrupt()
+        return wait(*args)
+    def interrupted():
+        try:
+            s.acquire(BULK)
+        except KeyboardInterrupt as e:
+            errors.append(e)
+    # the first waiter queues, then the second is interrupted behind it and
+    #   the third queues behind that
+    first = _start(lambda: (s.acquire(BULK), done.append(1), s.release(BULK)))
+    _wait_for(s, BULK, 1)
+    s._cond.wait = interruptible_wait
+    second = threading.Thread(target=interrupted, name='interrupted')
+    second.start()
+    second.join()
+    assert_equal(len(errors), 1)
+    assert_equal(s.stats()[BULK]['waiting'], 1)
+    third = _start(lambda: (s.acquire(BULK), done.append(3), s.release(BULK)))
+    _wait_for(s, BULK, 2)
+    s.release(BULK)
+    first.join()
+    third.join()
+    assert_equal(done, [1, 3])
+    assert_equal(s.stats()[BULK], {'active': 0, 'waiting': 0})
@@ -0,0 +1,249 @@
+#! usr/bin/python
+# coding=utf-8
+
+import json
+import threading
+from gzip import GzipFile
+from io import BytesIO
+from nose.tools import assert_raises, assert_true, assert_equal
+from veritable.standin import StandinServer, make_standin_server
+try:
+    from urllib2 import urlopen, Request
+except ImportError:
+    from urllib.request import urlopen, Request
+
+BASE = 'http://standin'
+SCHEMA = {'cat': {'type': 'categorical'}, 'ct': {'type': 'count'},
+    'real': {'type': 'real'}, 'bool': {'type': 'boolean'}}
+ROWS = [
+    {'_id': 'row1', 'cat': 'a', 'ct': 0, 'real': 1.02394, 'bool': True},
+    {'_id': 'row2', 'cat': 'b', 'ct': 0, 'real': 0.92131, 'bool': False},
+    {'_id': 'row3', 'cat': 'c', 'ct': 1, 'real': 1.82812, 'bool': True},
+    {'_id': 'row4', 'cat': 'c', 'ct': 1, 'real': 0.81271, 'bool': True},
+    {'_id': 'row5', 'cat': 'd', 'ct': 2, 'real': 1.14561, 'bool': False},
+    {'_id': 'row6', 'cat': 'a', 'ct': 5, 'real': 1.03412, 'bool': False}]
+
+
+def call(server, method, path, data=None, params=None, expect=200):
+    body = json.dumps(data).encode('utf-8') if data is not None else b''
+    status, headers, content = server.handle(method, path, params, body,
+        base_url=BASE)
+    assert_equal(status, expect)
+    return json.loads(content.decode('utf-8'))
+
+
+def populated(**kwargs):
+    server = StandinServer(seed=0, **kwargs)
+    call(server, 'POST', '/tables', {'_id': 't', 'description': ''})
+    call(server, 'POST', '/tables/t/rows', {'action': 'put', 'rows': ROWS})
+    call(server, 'POST', '/tables/t/analyses', {'_id': 'a', 'schema': SCHEMA,
+        'description': '', 'type': 'veritable'})
+    return server
+
+
+def follow(server, path, key, params):
+    # reads every page of a collection, following next links
+    res = call(server, 'GET', path, params=params)
+    items = list(res[key])
+    while 'next' in res['links']:
+        url, query = res['links']['next'][len(BASE):].split('?')
+        res = call(server, 'GET', url, params=dict([p.split('=')
+            for p in query.split('&')]))
+        items.extend(res[key])
+    return items
+
+
+def test_root_and_limits():
+    server = StandinServer()
+    res = call(server, 'GET', '/')
+    assert_equal(res['status'], 'SUCCESS')
+    assert_true(isinstance(res['entropy'], float))
+    assert_true('predictions_max_response_cells' in
+        call(server, 'GET', '/user/limits'))
+
+
+def test_table_lifecycle():
+    server = StandinServer()
+    doc = call(server, 'POST', '/tables', {'_id': 't', 'description': 'd'})
+    assert_equal(doc['links']['rows'], BASE + '/tables/t/rows')
+    call(server, 'POST', '/tables', {'_id': 't'}, expect=400)
+    assert_equal(call(server, 'GET', '/tables/t')['description'], 'd')
+    call(server, 'DELETE', '/tables/t')
+    call(server, 'GET', '/tables/t', expect=404)
+
+
+def test_rows():
+    server = populated()
+    assert_equal(call(server, 'GET', '/tables/t/rows/row3'), ROWS[2])
+    call(server, 'PUT', '/tables/t/rows/row7', {'_id': 'row7', 'cat': 'z'})
+    call(server, 'POST', '/tables/t/rows', {'action': 'delete',
+        'rows': [{'_id': 'row1'}]})
+    call(server, 'GET', '/tables/t/rows/row1', expect=404)
+    call(server, 'DELETE', '/tables/t/rows/row7')
+    assert_equal(len(follow(server, '/tables/t/rows', 'rows', {})), 5)
+
+
+def test_row_batch_limit():
+    server = StandinServer(limits={'max_row_batch_count': 2})
+    call(server, 'POST', '/tables', {'_id': 't'})
+    call(server, 'POST', '/tables/t/rows', {'action': 'put', 'rows': ROWS},
+        expect=400)
+
+
+def test_pagination():
+    server = populated()
+    for per_page in [1, 2, 4, 10]:
+        rows = follow(server, '/tables/t/rows', 'rows',
+            {'per_page': per_page})
+        assert_equal([r['_id'] for r in rows], [r['_id'] for r in ROWS])
+    rows = follow(server, '/tables/t/rows', 'rows', {'per_page': 4,
+        'start': 'row2'})
+    assert_equal(rows[0]['_id'], 'row2')
+    assert_equal(len(rows), 5)
+
+
+def test_pagination_after_updates():
+    # the sorted id index follows puts, re-puts and deletes
+    server = StandinServer()
+    call(server, 'POST', '/tables', {'_id': 't'})
+    ids = ['r{0:03d}'.format(i) for i in range(200)]
+    call(server, 'POST', '/tables/t/rows', {'action': 'put',
+        'rows': [{'_id': i} for i in reversed(ids)]})
+    call(server, 'POST', '/tables/t/rows', {'action': 'put',
+        'rows': [{'_id': i, 'x': 1} for i in ids[:10]]})
+    call(server, 'POST', '/tables/t/rows', {'action': 'delete',
+        'rows': [{'_id': i} for i in ids[::3]] + [{'_id': 'missing'}]})
+    call(server, 'DELETE', '/tables/t/rows/r001')
+    call(server, 'PUT', '/tables/t/rows/r000', {'x': 2})
+    expected = sorted(set(ids) - set(ids[::3]) - set(['r001'])) + ['r000']
+    rows = follow(server, '/tables/t/rows', 'rows', {'per_page': 7})
+    assert_equal([r['_id'] for r in rows], sorted(expected))
+    rows = follow(server, '/tables/t/rows', 'rows', {'per_page': 7,
+        'start': 'r100'})
+    assert_equal([r['_id'] for r in rows],
+        [i for i in sorted(expected) if i >= 'r100'])
+
+
+def test_page_size_limit():
+    server = populated(limits={'max_page_size': 2})
+    res = call(server, 'GET', '/tables/t/rows', params={'per_page': 100})
+    assert_equal(len(res['rows']), 2)
+
+
+def test_analysis():
+    server = populated()
+    doc = call(server, 'GET', '/tables/t/analyses/a')
+    assert_equal(doc['state'], 'succeeded')
+    assert_equal(call(server, 'GET', '/tables/t/analyses/a/schema'), SCHEMA)
+    call(server, 'POST', '/tables/t/analyses', {'_id': 'b',
+        'schema': {'x': {'type': 'bogus'}}}, expect=400)
+
+
+def test_analysis_running():
+    server = populated(analysis_time=60)
+    doc = call(server, 'GET', '/tables/t/analyses/a')
+    assert_equal(doc['state'], 'running')
+    assert_true('percent' in doc['progress'])
+    call(server, 'POST', '/tables/t/analyses/a/predict',
+        {'data': {'cat': None}, 'count': 1}, expect=400)
+
+
+def test_predict():
+    server = populated()
+    res = call(server, 'POST', '/tables/t/analyses/a/predict',
+        {'data': {'cat': 'a', 'real': None}, 'count': 10,
+         'return_fixed': False})
+    assert_equal(len(res), 10)
+    values = set([r['real'] for r in ROWS])
+    for r in res:
+        assert_equal(list(r.keys()), ['real'])
+        assert_true(r['real'] in values)
+
+
+def test_batch_predict():
+    server = populated()
+    res = call(server, 'POST', '/tables/t/analyses/a/predict',
+        {'data': [{'_request_id': 'x', 'ct': None},
+                  {'_request_id': 'y', 'bool': None}], 'count': 3})
+    assert_equal([r['_request_id'] for r in res], ['x'] * 3 + ['y'] * 3)
+
+
+def test_predict_cell_limit():
+    server = populated(limits={'predictions_max_response_cells': 10})
+    call(server, 'POST', '/tables/t/analyses/a/predict',
+        {'data': {'real': None, 'ct': None}, 'count': 6}, expect=400)
+
+
+def test_similar():
+    server = populated()
+    res = call(server, 'POST', '/tables/t/analyses/a/similar',
+        {'data': {'_id': 'row3'}, 'column': 'cat', 'max_rows': 2,
+         'return_data': False})['data']
+    assert_equal(len(res), 2)
+    assert_equal(res[0], {'_id': 'row4', '_similarity': 1.0})
+
+
+def test_related():
+    server = populated()
+    res = follow(server, '/tables/t/analyses/a/related/cat', 'data',
+        {'per_page': 3})
+    assert_equal(len(res), 4)
+    assert_equal(res[0], {'name': 'cat', 'related_score': 1.0})
+
+
+def test_grouping():
+    server = populated()
+    res = call(server, 'POST', '/tables/t/analyses/a/group',
+        {'columns': ['cat']})
+    doc = res['groupings'][0]
+    assert_equal(doc['column_name'], 'cat')
+    path = doc['links']['self'][len(BASE):]
+    assert_equal(call(server, 'GET', path), doc)
+    groups = follow(server, path + '/groups', 'groups', {'per_page': 3})
+    assert_equal(len(groups), 4)
+    rows = follow(server, path + '/rows', 'rows', {'per_page': 4,
+        'return_data': False})
+    assert_equal([r['_id'] for r in rows], [r['_id'] for r in ROWS])
+    assert_equal(set(rows[0].keys()), set(['_id', '_group_id',
+        '_confidence']))
+    group = follow(server, path + '/groups/' + str(rows[2]['_group_id']),
+        'data', {})
+    assert_equal([r['_id'] for r in group], ['row3', 'row4'])
+    row = call(server, 'GET', path + '/rows/row3')['row']
+    assert_equal(row['cat'], 'c')
+
+
+def test_gzip_request():
+    server = StandinServer()
+    buf = BytesIO()
+    z = GzipFile(mode='wb', fileobj=buf)
+    z.write(json.dumps({'_id': 't'}).encode('utf-8'))
+    z.close()
+    status, headers, content = server.handle('POST', '/tables', {},
+        buf.getvalue(), {'Content-Encoding': 'gzip'})
+    assert_equal(status, 200)
+
+
+def test_error_injection():
+    server = StandinServer(error_rate=1.0, error_status=429, retry_after=2)
+    status, headers, content = server.handle('GET', '/')
+    assert_equal(status, 429)
+    assert_equal(headers['Retry-After'], '2')
+
+
+def test_http():
+    httpd = make_standin_server(port=0)
+    t = threading.Thread(target=httpd.serve_forever)
+    t.daemon = True
+    t.start()
+    try:
+        base = 'http://127.0.0.1:{0}'.format(httpd.server_port)
+        req = Request(base + '/tables', json.dumps({'_id': 't'}).encode(
+            'utf-8'), {'Content-Type': 'application/json'})
+        doc = json.loads(urlopen(req).read().decode('utf-8'))
+        assert_equal(doc['links']['self'], base + '/tables/t')
+        res = json.loads(urlopen(base + '/tables?per_page=1').read().decode(
+            'utf-8'))
+        assert_equal(res['tables'][0]['_id'], 't')
+    finally:
+        httpd.shutdown()
@@ -0,0 +1,166 @@
+#! usr/bin/python
+# coding=utf-8
+
+# Exercises the client end to end against an in-process stand-in server.
+
+import os
+import veritable
+from tempfile import mkstemp
+from nose.tools import assert_raises, assert_true, assert_equal
+from veritable.exceptions import VeritableError
+from veritable.api import Prediction
+from veritable.standin import StandinServer
+from veritable.transport import InProcessTransport, InProcessResponse
+from veritable.utils import (iter_csv, read_csv, write_csv,
+    write_predictions_csv, iter_clean_data, hash_split, UploadSink)
+
+ROWS = [
+    {'_id': 'row1', 'cat': 'a', 'ct': 0, 'real': 1.02394, 'bool': True},
+    {'_id': 'row2', 'cat': 'b', 'ct': 0, 'real': 0.92131, 'bool': False},
+    {'_id': 'row3', 'cat': 'c', 'ct': 1, 'real': 1.82812, 'bool': True},
+    {'_id': 'row4', 'cat': 'c', 'ct': 1, 'real': 0.81271, 'bool': True},
+    {'_id': 'row5', 'cat': 'd', 'ct': 2, 'real': 1.14561, 'bool': False},
+    {'_id': 'row6', 'cat': 'a', 'ct': 5, 'real': 1.03412, 'bool': False}]
+SCHEMA = {'cat': {'type': 'categorical'}, 'ct': {'type': 'count'},
+    'real': {'type': 'real'}, 'bool': {'type': 'boolean'}}
+
+
+def test_connect_hedge_delay():
+    api = veritable.connect('key', 'http://standin', hedge=True,
+        hedge_delay=0.25, transport=InProcessTransport(StandinServer()))
+    assert_true(api._conn.hedge)
+    assert_equal(api._conn.hedge_delay, 0.25)
+
+
+def test_response_raise_for_status():
+    InProcessResponse(200, {}, b'{}').raise_for_status()
+    assert_raises(Exception, InProcessResponse(500, {}, b'{}').raise_for_status)
+
+
+class TestInProcess:
+    @classmethod
+    def setup_class(self):
+        self.server = StandinServer(seed=0)
+        self.API = veritable.connect('key', 'http://standin',
+            transport=InProcessTransport(self.server))
+        self.t = self.API.create_table('t')
+        self.t.batch_upload_rows([dict(r) for r in ROWS], per_page=4)
+        self.a = self.t.create_analysis(SCHEMA, analysis_id='a')
+
+    def test_default_handler(self):
+        API = veritable.connect('key', 'http://standin',
+            transport=InProcessTransport(), enable_gzip=False)
+        assert_equal(list(API.get_tables()), [])
+
+    def test_rows(self):
+        assert_equal(self.t.get_row('row2'), ROWS[1])
+        assert_equal([r['_id'] for r in self.t.get_rows()],
+            [r['_id'] for r in ROWS])
+        assert_equal([r['_id'] for r in self.t.get_rows(start='row3',
+            limit=2)], ['row3', 'row4'])
+
+    def test_cursor_pages(self):
+        rows = list(veritable.cursor.Cursor(self.t._conn, self.t._link('rows'),
+            per_page=4))
+        assert_equal(len(rows), 6)
+
+    def test_missing_table(self):
+        assert_raises(VeritableError, self.API.get_table, 'nope')
+        assert_true(not self.API.table_exists('nope'))
+
+    def test_predict(self):
+        p = self.a.predict({'cat': 'a', 'real': None}, count=10)
+        assert_true(isinstance(p, Prediction))
+        assert_equal(len(p.distribution), 10)
+        assert_equal(p['cat'], 'a')
+
+    def test_batch_predict_count_batched(self):
+        preds = list(self.a._predict([{'_request_id': str(i), 'real': None,
+            'ct': None} for i in range(5)], 10, maxcells=30, maxcols=10))
+        assert_equal([p.request_id for p in preds], [str(i) for i in range(5)])
+        for p in preds:
+            assert_equal(len(p.distribution), 10)
+
+    def test_similar_related(self):
+        similar = list(self.a.similar_to('row3', 'cat', max_rows=2))
+        assert_equal(similar[0]['_id'], 'row4')
+        related = list(self.a.related_to('cat'))
+        assert_equal(related[0]['name'], 'cat')
+
+    def test_grouping(self):
+        g = self.a.get_grouping('cat')
+        assert_equal(g.state, 'succeeded')
+        assert_equal(len(list(g.get_groups())), 4)
+        rows = list(g.get_rows(return_data=False))
+        assert_equal(set(rows[0].keys()), set(['_id', '_group_id',
+            '_confidence']))
+        assert_equal(g.get_row({'_id': 'row4'})['cat'], 'c')
+        group_id = g.get_row({'_id': 'row3'})['_group_id']
+        assert_equal([r['_id'] for r in g.get_rows(group_id)],
+            ['row3', 'row4'])
+
+    def test_delete(self):
+        t = self.API.create_table('t2')
+        t.batch_upload_rows([dict(r) for r in ROWS])
+        t.batch_delete_rows([{'_id': 'row1'}])
+        a = t.create_analysis(SCHEMA, analysis_id='a')
+        a.delete()
+        assert_true(not t.analysis_exists('a'))
+        t.delete()
+        assert_true(not self.API.table_exists('t2'))
+
+    def test_upload_from_iter_csv(self):
+        handle, filename = mkstemp()
+        write_csv(ROWS, filename)
+        t = self.API.create_table('t3')
+        t.batch_upload_rows(iter_csv(filename), per_page=4)
+        assert_equal([r['_id'] for r in t.get_rows()],
+            [r['_id'] for r in ROWS])
+        assert_equal(t.get_row('row5')['cat'], 'd')
+        t.delete()
+        os.remove(filename)
+
+    def test_upload_from_iter_clean_data(self):
+        handle, filename = mkstemp()
+        write_csv(ROWS, filename)
+        t = self.API.create_table('t4')
+        t.batch_upload_rows(iter_clean_data(lambda: iter_csv(filename),
+            SCHEMA), per_page=4)
+        assert_equal(t.get_row('row3'), ROWS[2])
+        t.delete()
+        os.remove(filename)
+
+    def test_split_to_upload_sinks(self):
+        train = self.API.create_table('t5')
+        test = self.API.create_table('t6')
+        counts = hash_split(iter([dict(r) for r in ROWS]), sinks=[
+            UploadSink(train, per_page=4), UploadSink(test, per_page=4)])
+        assert_equal(counts, tuple([len(p) for p in hash_split(ROWS)]))
+        assert_equal(len(list(train.get_rows())), counts[0])
+        assert_equal(len(list(test.get_rows())), counts[1])
+        train.delete()
+        test.delete()
+
+    def test_upload_columnar(self):
+        t = self.API.create_table('t7')
+        columns = {'_id': [r['_id'] for r in ROWS],
+            'cat': [r['cat'] for r in ROWS], 'ct': [r['ct'] for r in ROWS],
+            'real': [r['real'] for r in ROWS],
+            'bool': [r['bool'] for r in ROWS]}
+        columns['ct'][1] = None
+        t.batch_upload_rows(columns, per_page=4)
+        assert_equal(t.get_row('row3'), ROWS[2])
+        assert_true('ct' not in t.get_row('row2'))
+        t.delete()
+
+    def test_write_predictions_from_batch_predict(self):
+        handle, filename = mkstemp()
+        self.a.wait()
+        requests = [{'_request_id': str(i), 'cat': None, 'real': None,
+            'ct': i} for i in range(5)]
+        write_predictions_csv(self.a.batch_predict(requests, count=20),
+            filename, quantiles=[0.05, 0.95])
+        rows = read_csv(filename, id_col='_request_id')
+        assert_equal([r['_id'] for r in rows], [str(i) for i in range(5)])
+        assert_true(float(rows[0]['real_p5']) <= float(rows[0]['real_p95']))
+        os.remove(filename)
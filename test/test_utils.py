@@ -1,12 +1,18 @@
 #! usr/bin/python
 # coding=utf-8
 
-from veritable.utils import (write_csv, read_csv, make_schema,
+from veritable.utils import (write_csv, read_csv, iter_csv,
+    iter_csv_parallel, write_predictions_csv, make_schema,
     validate_data, validate_predictions, _format_url, clean_data,
-    clean_predictions, _validate_schema)
+    clean_predictions, iter_clean_data, ValidationState, _validate_schema,
+    ColumnProfile, infer_schema, validate_schema, _first_repeated_id,
+    split_rows, hash_split, kfold_split, reservoir_split, stratified_split,
+    CsvSink, iter_columnar_rows)
 from veritable.exceptions import VeritableError
+from veritable.api import Prediction
 from nose.tools import raises, assert_raises
 from tempfile import mkstemp
+import array
 import csv
 import json
 import os
@@ -93,6 +99,255 @@ def test_read_csv_assign_id():
     os.remove(filename)
 
 
+def test_iter_csv():
+    handle, filename = mkstemp()
+    refrows = [{'_id': '7', 'ColInt':3, 'ColFloat':3.1, 'ColCat': 'a'},
+               {'_id': '8', 'ColInt':4, 'ColCat': 'b', 'ColBool':False},
+               {'_id': '9'}]
+    write_csv(refrows, filename, dialect=csv.excel)
+    rows = iter_csv(filename, dialect=csv.excel)
+    assert not isinstance(rows, list)
+    assert next(rows) == {'_id': '7', 'ColInt': '3', 'ColFloat': '3.1',
+        'ColCat': 'a'}
+    assert list(rows) == read_csv(filename, dialect=csv.excel)[1:]
+    os.remove(filename)
+
+
+def test_iter_csv_na_vals():
+    handle, filename = mkstemp()
+    with open(filename, 'w') as f:
+        f.write("a,b\nNA,1\n2,\n")
+    rows = list(iter_csv(filename, na_vals=['NA']))
+    assert rows == [{'_id': '1', 'b': '1'}, {'_id': '2', 'a': '2', 'b': ''}]
+    os.remove(filename)
+
+
+def test_iter_csv_missing_id():
+    handle, filename = mkstemp()
+    with open(filename, 'w') as f:
+        f.write("myID,a\nx,1\n,2\n")
+    rows = iter_csv(filename, id_col='myID')
+    assert next(rows) == {'_id': 'x', 'a': '1'}
+    assert_raises(VeritableError, next, rows)
+    os.remove(filename)
+
+
+def _write_tricky_csv():
+    # quoted fields with embedded newlines, delimiters and quotes, NA values
+    #   and short records, so that chunks must split at record boundaries
+    handle, filename = mkstemp()
+    with open(filename, 'w') as f:
+        f.write('a,b,c\n')
+        for i in range(200):
+            if i % 7 == 0:
+                f.write('"multi\nline {0}","x, ""y""",{0}\n'.format(i))
+            elif i % 5 == 0:
+                f.write(',{0}\n'.format(i))
+            else:
+                f.write(' v{0} ,w,{0}\n'.format(i))
+    return filename
+
+
+def test_iter_csv_parallel():
+    filename = _write_tricky_csv()
+    ref = read_csv(filename)
+    for processes in [1, 3]:
+        rows = list(iter_csv_parallel(filename, processes=processes,
+            chunk_bytes=64))
+        assert rows == ref
+    os.remove(filename)
+
+
+def test_iter_csv_parallel_columnar():
+    filename = _write_tricky_csv()
+    ref = read_csv(filename)
+    blocks = list(iter_csv_parallel(filename, processes=2, chunk_bytes=256,
+        columnar=True))
+    assert len(blocks) > 1
+    rows = []
+    for block in blocks:
+        assert sorted(block.keys()) == ['_id', 'a', 'b', 'c']
+        for i in range(len(block['_id'])):
+            rows.append(dict([(c, v[i]) for (c, v) in block.items()
+                if v[i] is not None]))
+    assert rows == ref
+    os.remove(filename)
+
+
+def test_iter_csv_parallel_id_col():
+    handle, filename = mkstemp()
+    with open(filename, 'w') as f:
+        f.write('myID,a\n')
+        for i in range(50):
+            f.write('r{0},{0}\n'.format(i))
+        f.write(',50\n')
+    rows = iter_csv_parallel(filename, id_col='myID', processes=2,
+        chunk_bytes=32)
+    for i in range(50):
+        assert next(rows) == {'_id': 'r{0}'.format(i), 'a': str(i)}
+    try:
+        next(rows)
+    except VeritableError as e:
+        assert e.row == 50
+    else:
+        assert False
+    os.remove(filename)
+
+
+def test_iter_csv_parallel_empty():
+    handle, filename = mkstemp()
+    assert list(iter_csv_parallel(filename)) == []
+    with open(filename, 'w') as f:
+        f.write('a,b')
+    assert list(iter_csv_parallel(filename)) == []
+    os.remove(filename)
+
+
+def test_read_csv_schema():
+    handle, filename = mkstemp()
+    refrows = [{'_id': '7', 'ColInt':3, 'ColFloat':3.1, 'ColCat': 'a'},
+               {'_id': '8', 'ColInt':4, 'ColCat': 'b', 'ColBool':False},
+               {'_id': '9'}]
+    cschema = {
+        'ColInt': {'type': 'count'},
+        'ColFloat': {'type': 'real'},
+        'ColCat': {'type': 'categorical'},
+        'ColBool': {'type': 'boolean'}
+        }
+    write_csv(refrows, filename, dialect=csv.excel)
+    assert read_csv(filename, schema=cschema) == refrows
+    assert list(iter_csv(filename, schema=cschema)) == refrows
+    os.remove(filename)
+
+
+def test_read_csv_schema_invalids():
+    handle, filename = mkstemp()
+    with open(filename, 'w') as f:
+        f.write("ct,real,bool,cat,extra\n")
+        f.write("-1,nan,maybe,x,1\n")
+        f.write("1.5,inf,2,3,y\n")
+        f.write("100001,1e3,Yes,,\n")
+        f.write("5,,,,\n")
+    schema = {'ct': {'type': 'count'}, 'real': {'type': 'real'},
+        'bool': {'type': 'boolean'}, 'cat': {'type': 'categorical'}}
+    rows = read_csv(filename, schema=schema)
+    assert rows == [{'_id': '1', 'cat': 'x', 'extra': '1'},
+        {'_id': '2', 'bool': True, 'cat': '3', 'extra': 'y'},
+        {'_id': '3', 'real': 1000.0, 'bool': True}, {'_id': '4', 'ct': 5}]
+    # the same as reading strings and cleaning them
+    strings = read_csv(filename)
+    clean_data(strings, schema)
+    assert strings == rows
+    os.remove(filename)
+
+
+def test_read_csv_schema_parallel():
+    filename = _write_tricky_csv()
+    schema = {'a': {'type': 'categorical'}, 'b': {'type': 'categorical'},
+        'c': {'type': 'count'}}
+    ref = read_csv(filename, schema=schema)
+    assert ref[3]['c'] == 3
+    rows = list(iter_csv_parallel(filename, schema=schema, processes=2,
+        chunk_bytes=128))
+    assert rows == ref
+    os.remove(filename)
+
+
+@raises(VeritableError)
+def test_read_csv_invalid_schema():
+    handle, filename = mkstemp()
+    with open(filename, 'w') as f:
+        f.write("a\n1\n")
+    try:
+        read_csv(filename, schema={'a': {'type': 'integer'}})
+    finally:
+        os.remove(filename)
+
+
+def test_write_csv_stream():
+    handle, filename = mkstemp()
+    refrows = [{'_id': str(i), 'a': i, 'b': None, 'c': 'x'} for i in range(5)]
+    consumed = []
+    def rows():
+        for r in refrows:
+            consumed.append(r['_id'])
+            yield r
+    write_csv(rows(), filename, headers=['_id', 'a', 'b'])
+    assert len(consumed) == 5
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == '_id,a,b'
+    assert lines[3] == '2,2,'
+    assert read_csv(filename) == [{'_id': str(i), 'a': str(i)}
+        for i in range(5)]
+    os.remove(filename)
+
+
+def test_write_csv_schema_headers():
+    handle, filename = mkstemp()
+    schema = {'b': {'type': 'count'}, 'a': {'type': 'real'}}
+    write_csv(iter([{'_id': '1', 'a': 1.5, 'b': 2, 'extra': 'x'}]), filename,
+        schema=schema, dialect=csv.excel_tab)
+    with open(filename) as f:
+        assert f.read().splitlines() == ['_id\ta\tb', '1\t1.5\t2']
+    os.remove(filename)
+
+
+def test_write_csv_iterator_no_headers():
+    handle, filename = mkstemp()
+    refrows = [{'_id': '1', 'a': 'x'}, {'_id': '2', 'b': 'y'}]
+    write_csv(iter(refrows), filename)
+    assert read_csv(filename) == refrows
+    os.remove(filename)
+
+
+def _predictions():
+    schema = {'real': {'type': 'real'}, 'cat': {'type': 'categorical'},
+        'ct': {'type': 'count'}}
+    distribution = [{'real': float(i), 'cat': 'a' if i < 7 else 'b'}
+        for i in range(11)]
+    return [Prediction({'real': None, 'cat': None, 'ct': 3}, distribution,
+        schema, request_id=str(j)) for j in range(3)]
+
+
+def test_write_predictions_csv():
+    handle, filename = mkstemp()
+    write_predictions_csv(iter(_predictions()), filename,
+        quantiles=[0.1, 0.5, 0.9])
+    rows = read_csv(filename, id_col='_request_id')
+    assert len(rows) == 3
+    # quantiles of categorical columns are NA
+    assert sorted(rows[0].keys()) == ['_id', 'cat', 'cat_uncertainty', 'ct', 'ct_p10', 'ct_p50', 'ct_p90',
+        'ct_uncertainty', 'real', 'real_p10', 'real_p50', 'real_p90',
+        'real_uncertainty']
+    assert rows[2]['_id'] == '2'
+    assert rows[0]['real'] == '5.0'
+    assert rows[0]['real_p10'] == '1.0'
+    assert rows[0]['real_p90'] == '9.0'
+    assert rows[0]['cat'] == 'a'
+    assert rows[0]['ct'] == '3'
+    assert rows[0]['ct_p50'] == '3'
+    assert rows[0]['ct_uncertainty'] == '0.0'
+    os.remove(filename)
+
+
+def test_write_predictions_csv_columns():
+    handle, filename = mkstemp()
+    write_predictions_csv(_predictions(), filename, columns=['real'],
+        uncertainty=False)
+    with open(filename) as f:
+        assert f.read().splitlines()[:2] == ['_request_id,real', '0,5.0']
+    write_predictions_csv([], filename)
+    with open(filename) as f:
+        assert f.read().splitlines() == ['_request_id']
+    os.remove(filename)
+
+
+@raises(VeritableError)
+def test_write_predictions_csv_bad_quantile():
+    write_predictions_csv(_predictions(), 'unused.csv', quantiles=[95])
+
+
 def test_make_schema_headers():
     refSchema = {'CatA': {'type': 'categorical'},
                  'CatB': {'type': 'categorical'},
@@ -1086,3 +1341,717 @@ def test_data_empty_col_fail():
         assert e.col == 'ColCat'
 
 
+
+
+# typed rows are checked a column at a time; these cover its fallbacks to
+#   the row by row checks
+TYPED_SCHEMA = {'ct': {'type': 'count'}, 'real': {'type': 'real'},
+    'bool': {'type': 'boolean'}, 'cat': {'type': 'categorical'}}
+
+
+def _typed_rows():
+    return [{'_id': str(i), 'ct': i, 'real': i / 2.0, 'bool': i % 2 == 0,
+        'cat': 'c{0}'.format(i % 3)} for i in range(10)]
+
+
+def test_validate_typed_rows():
+    rows = _typed_rows()
+    validate_data(rows, TYPED_SCHEMA)
+    clean_data(rows, TYPED_SCHEMA)
+    assert rows == _typed_rows()
+
+
+def test_validate_typed_bool_in_count():
+    rows = _typed_rows()
+    rows[4]['ct'] = True
+    clean_data(rows, TYPED_SCHEMA)
+    assert rows[4]['ct'] == 1 and type(rows[4]['ct']) is int
+    rows[4]['ct'] = True
+    validate_data(rows, TYPED_SCHEMA)
+
+
+def test_validate_typed_nan():
+    rows = _typed_rows()
+    rows[3]['real'] = float('nan')
+    try:
+        validate_data(rows, TYPED_SCHEMA)
+    except VeritableError as e:
+        assert e.row == 3 and e.col == 'real'
+    else:
+        assert False
+    clean_data(rows, TYPED_SCHEMA)
+    assert 'real' not in rows[3]
+
+
+def test_validate_typed_out_of_range():
+    rows = _typed_rows()
+    rows[5]['ct'] = 100001
+    clean_data(rows, TYPED_SCHEMA)
+    assert 'ct' not in rows[5]
+
+
+def test_validate_typed_duplicate_id():
+    rows = _typed_rows()
+    rows[7]['_id'] = '2'
+    try:
+        validate_data(rows, TYPED_SCHEMA)
+    except VeritableError as e:
+        assert e.row == 7 and e.col == '_id'
+    else:
+        assert False
+
+
+def test_validate_typed_empty_extra_column():
+    rows = _typed_rows()
+    for r in rows:
+        r['extra'] = None
+    assert_raises(VeritableError, clean_data, rows, TYPED_SCHEMA)
+    rows[6]['extra'] = 'x'
+    clean_data(rows, TYPED_SCHEMA)
+    assert rows[6]['extra'] == 'x'
+
+
+def test_validate_typed_predictions_nones():
+    rows = _typed_rows()
+    for r in rows:
+        r['real'] = None
+    clean_predictions(rows, TYPED_SCHEMA)
+    assert [r['_request_id'] for r in rows] == [str(i) for i in range(10)]
+    assert rows[0]['real'] is None
+
+
+# clean_data and validate_data in a pool of processes should behave as they
+#   do in this one
+def _string_rows(n):
+    return [{'_id': str(i), 'ct': str(i), 'real': str(i / 2.0),
+        'bool': ['yes', 'no'][i % 2], 'cat': i % 3} for i in range(n)]
+
+
+def test_clean_data_processes():
+    rows = _string_rows(50)
+    expected = _string_rows(50)
+    clean_data(expected, TYPED_SCHEMA)
+    ids = [id(r) for r in rows]
+    clean_data(rows, TYPED_SCHEMA, processes=2)
+    assert rows == expected
+    assert [id(r) for r in rows] == ids
+    validate_data(rows, TYPED_SCHEMA, processes=2)
+
+
+def test_clean_data_processes_assign_ids():
+    rows = _string_rows(50)
+    for r in rows:
+        del r['_id']
+    clean_data(rows, TYPED_SCHEMA, assign_ids=True, processes=3)
+    assert [r['_id'] for r in rows] == [str(i) for i in range(50)]
+
+
+def test_clean_data_processes_duplicate_id():
+    rows = _string_rows(50)
+    rows[45]['_id'] = '3'
+    try:
+        clean_data(rows, TYPED_SCHEMA, processes=2)
+    except VeritableError as e:
+        assert e.row == 45 and e.col == '_id'
+        assert "conflicts with Row:'3'" in e.value
+    else:
+        assert False
+
+
+def test_clean_data_processes_first_error():
+    rows = _string_rows(50)
+    rows[40]['ct'] = 'x'
+    rows[45]['_id'] = '3'
+    for f in [lambda p: clean_data(rows, TYPED_SCHEMA,
+            remove_invalids=False, processes=p),
+            lambda p: validate_data(rows, TYPED_SCHEMA, processes=p)]:
+        try:
+            f(2)
+        except VeritableError as e:
+            assert e.row == 40 and e.col == 'ct'
+        else:
+            assert False
+
+
+def test_clean_data_processes_too_many_cats():
+    eschema = {'ColCat': {'type': 'categorical'}}
+    testrows = [{'_id': str(i), 'ColCat': str(i // 2)} for i in range(510)]
+    testrows.append({'_id': '510', 'ColCat': '255'})
+    testrows.append({'_id': '511', 'ColCat': '256'})
+    assert_raises(VeritableError, validate_data, testrows, eschema,
+        processes=2)
+    clean_data(testrows, eschema, processes=2)
+    assert testrows[510]['ColCat'] == 'Other'
+    assert testrows[511]['ColCat'] == 'Other'
+    validate_data(testrows, eschema, processes=2)
+
+
+def _many_cats_rows():
+    testrows = [{'_id': str(i), 'cat': str(i // 2)} for i in range(510)]
+    testrows.append({'_id': '510', 'cat': '255'})
+    testrows.append({'_id': '511', 'cat': '256'})
+    return testrows
+
+
+def test_iter_clean_data():
+    eschema = {'cat': {'type': 'categorical'}}
+    expected = _many_cats_rows()
+    clean_data(expected, eschema)
+    for rows in [_many_cats_rows(), iter(_many_cats_rows()),
+            lambda: iter(_many_cats_rows())]:
+        assert list(iter_clean_data(rows, eschema, chunk_rows=100)) == \
+            expected
+
+
+def test_iter_clean_data_types():
+    rows = _string_rows(25)
+    expected = _string_rows(25)
+    clean_data(expected, TYPED_SCHEMA)
+    assert list(iter_clean_data(iter(rows), TYPED_SCHEMA,
+        chunk_rows=10)) == expected
+
+
+def test_iter_clean_data_errors_first():
+    rows = _string_rows(25)
+    rows[22]['_id'] = '3'
+    it = iter_clean_data(rows, TYPED_SCHEMA, chunk_rows=10)
+    try:
+        next(it)
+    except VeritableError as e:
+        assert e.row == 22 and e.col == '_id'
+    else:
+        assert False
+    rows = _string_rows(25)
+    for r in rows:
+        r['extra'] = None
+    assert_raises(VeritableError, next, iter_clean_data(iter(rows),
+        TYPED_SCHEMA))
+
+
+def test_iter_clean_data_category_counts():
+    eschema = {'cat': {'type': 'categorical'}}
+    counts = {'cat': dict([(str(i), 2) for i in range(255)])}
+    counts['cat']['255'] = 1
+    counts['cat']['256'] = 1
+    rows = list(iter_clean_data(_many_cats_rows() + [{'_id': '512',
+        'cat': 'new'}], eschema, category_counts=counts))
+    assert [r['cat'] for r in rows[510:]] == ['Other', 'Other', 'Other']
+    assert rows[0]['cat'] == '0'
+    it = iter_clean_data(_many_cats_rows(), eschema, category_counts={})
+    assert_raises(VeritableError, list, it)
+
+
+def test_iter_clean_data_from_csv():
+    handle, filename = mkstemp()
+    write_csv(_string_rows(25), filename)
+    expected = _string_rows(25)
+    clean_data(expected, TYPED_SCHEMA)
+    assert list(iter_clean_data(iter_csv(filename, id_col='_id'),
+        TYPED_SCHEMA, chunk_rows=10)) == expected
+    os.remove(filename)
+
+
+def test_validation_state_batches():
+    state = ValidationState(TYPED_SCHEMA)
+    rows = _string_rows(30)
+    expected = _string_rows(30)
+    clean_data(expected, TYPED_SCHEMA)
+    clean_data(rows[:10], TYPED_SCHEMA, state=state)
+    clean_data(rows[10:], TYPED_SCHEMA, state=state)
+    assert rows == expected
+    assert state.nrows == 30
+    assert state.field_fill['ct'] == 30
+    assert state.category_counts['cat'] == {'0': 10, '1': 10, '2': 10}
+
+
+def test_validation_state_duplicate_id():
+    state = ValidationState(TYPED_SCHEMA)
+    clean_data(_string_rows(10), TYPED_SCHEMA, state=state)
+    batch = _string_rows(12)[10:] + [{'_id': '4', 'ct': 1}]
+    try:
+        clean_data(batch, TYPED_SCHEMA, state=state)
+    except VeritableError as e:
+        assert e.row == 2 and e.col == '_id'
+    else:
+        assert False
+    # a failed batch leaves the state as it was
+    assert state.nrows == 10 and '10' not in state.ids
+
+
+def test_validation_state_assign_ids():
+    state = ValidationState(TYPED_SCHEMA)
+    batches = [_string_rows(5), _string_rows(5)]
+    for batch in batches:
+        clean_data(batch, TYPED_SCHEMA, assign_ids=True,
+            remove_extra_fields=True, state=state)
+    assert [r['_id'] for r in batches[1]] == ['5', '6', '7', '8', '9']
+
+
+def test_validation_state_empty_column():
+    state = ValidationState(TYPED_SCHEMA)
+    assert_raises(VeritableError, clean_data, [{'_id': '0', 'ct': 1}],
+        TYPED_SCHEMA, state=state)
+    clean_data(_string_rows(5), TYPED_SCHEMA, state=state)
+    clean_data([{'_id': '5', 'ct': 1}], TYPED_SCHEMA, state=state)
+
+
+def test_validation_state_categories():
+    eschema = {'cat': {'type': 'categorical'}}
+    state = ValidationState(eschema)
+    first = [{'_id': str(i), 'cat': 'a' + str(i)} for i in range(250)]
+    clean_data(first, eschema, state=state)
+    second = [{'_id': str(250 + i), 'cat': 'b' + str(i % 10)}
+        for i in range(20)] + [{'_id': '270', 'cat': 'a0'}, {'_id': '271',
+        'cat': 'b0'}]
+    clean_data(second, eschema, state=state)
+    # the earlier categories and the 5 largest new ones are kept
+    assert second[-2]['cat'] == 'a0'
+    assert second[-1]['cat'] == 'b0'
+    assert len([r for r in second if r['cat'] == 'Other']) == 10
+    assert len(state.category_counts['cat']) == 256
+    third = [{'_id': '272', 'cat': 'c'}, {'_id': '273', 'cat': 'a1'}]
+    clean_data(third, eschema, state=state)
+    assert [r['cat'] for r in third] == ['Other', 'a1']
+    assert_raises(VeritableError, clean_data, [{'_id': '274', 'cat': 'd'}],
+        eschema, reduce_categories=False, state=state)
+
+
+def test_validation_state_save_load():
+    handle, filename = mkstemp()
+    state = ValidationState(TYPED_SCHEMA)
+    clean_data(_string_rows(10), TYPED_SCHEMA, state=state)
+    state.save(filename)
+    loaded = ValidationState.load(filename)
+    assert loaded.nrows == 10
+    assert loaded.ids == state.ids
+    assert loaded.category_counts == state.category_counts
+    assert_raises(VeritableError, clean_data, _string_rows(1),
+        TYPED_SCHEMA, state=loaded)
+    assert_raises(VeritableError, clean_data, _string_rows(12)[10:],
+        {'ct': {'type': 'count'}}, state=loaded)
+    os.remove(filename)
+
+
+def test_validation_state_compact_ids():
+    state = ValidationState(TYPED_SCHEMA, compact_ids=True)
+    clean_data(_string_rows(10), TYPED_SCHEMA, state=state)
+    assert '4' in state.ids and '10' not in state.ids
+    batch = _string_rows(12)[10:] + [{'_id': '4', 'ct': 1}]
+    try:
+        clean_data(batch, TYPED_SCHEMA, state=state)
+    except VeritableError as e:
+        assert e.row == 2 and e.col == '_id'
+    else:
+        assert False
+    assert state.nrows == 10 and '10' not in state.ids
+    # the filter grows as batches outnumber it
+    for k in range(3):
+        rows = [{'_id': str(i), 'ct': 1, 'cat': 'a'} for i in
+            range(1000 + 1500 * k, 2500 + 1500 * k)]
+        clean_data(rows, TYPED_SCHEMA, state=state)
+    assert len(state.ids.filters) == 3
+    assert all([str(i) in state.ids for i in range(5500)
+        if i < 10 or i >= 1000])
+    assert len([i for i in range(10, 1000) if str(i) in state.ids]) == 0
+
+
+def test_validation_state_compact_ids_save_load():
+    handle, filename = mkstemp()
+    state = ValidationState(TYPED_SCHEMA, compact_ids=True)
+    clean_data(_string_rows(10), TYPED_SCHEMA, state=state)
+    state.save(filename)
+    loaded = ValidationState.load(filename)
+    assert loaded.nrows == 10
+    assert all([str(i) in loaded.ids for i in range(10)])
+    assert_raises(VeritableError, clean_data, _string_rows(1),
+        TYPED_SCHEMA, state=loaded)
+    clean_data(_string_rows(12)[10:], TYPED_SCHEMA, state=loaded)
+    assert loaded.nrows == 12 and '11' in loaded.ids
+    os.remove(filename)
+
+
+def _repeated_id_error(f, rows, **kwargs):
+    try:
+        f(rows, TYPED_SCHEMA, **kwargs)
+    except VeritableError as e:
+        return (e.value, e.row, e.col)
+
+
+def test_compact_ids():
+    for (rows, f) in [(_typed_rows, clean_data), (_typed_rows, validate_data),
+            (lambda: _string_rows(10), clean_data)]:
+        r = rows()
+        r[7]['_id'] = '2'
+        r[9]['_id'] = '2'
+        expected = _repeated_id_error(f, [dict(x) for x in r])
+        assert expected[1] == 7
+        assert _repeated_id_error(f, r, compact_ids=True) == expected
+
+
+def test_compact_ids_first_error():
+    rows = _string_rows(10)
+    rows[4]['ct'] = 'x'
+    rows[6]['_id'] = '1'
+    expected = _repeated_id_error(clean_data, [dict(r) for r in rows],
+        remove_invalids=False)
+    assert expected[1] == 4
+    assert _repeated_id_error(clean_data, rows, remove_invalids=False,
+        compact_ids=True) == expected
+    rows = _string_rows(10)
+    rows[4]['ct'] = 'x'
+    rows[3]['_id'] = '1'
+    assert _repeated_id_error(clean_data, rows, remove_invalids=False,
+        compact_ids=True)[1:] == (3, '_id')
+
+
+def test_compact_ids_processes():
+    rows = _string_rows(50)
+    rows[45]['_id'] = '3'
+    assert _repeated_id_error(clean_data, rows, processes=2,
+        compact_ids=True)[1:] == (45, '_id')
+
+
+def test_first_repeated_id():
+    # false positives of the filter are checked and ignored
+    rows = [{'_id': str(i)} for i in range(20000)]
+    assert _first_repeated_id(rows, len(rows), '_id') is None
+    rows.append({'_id': '15'})
+    rows.append({'_id': '15'})
+    assert _first_repeated_id(rows, len(rows), '_id') == (20000, 15)
+    assert _first_repeated_id(rows, 20000, '_id') is None
+
+
+def test_reduce_categories_columns():
+    eschema = {'a': {'type': 'categorical'}, 'b': {'type': 'categorical'}}
+    testrows = [{'_id': str(i), 'a': str(i), 'b': str(i % 300)}
+        for i in range(600)]
+    testrows.append({'_id': '600', 'a': '0'})
+    clean_data(testrows, eschema)
+    # '0' is the largest category in a; ties go to those counted last
+    assert testrows[0]['a'] == '0'
+    assert testrows[1]['a'] == 'Other'
+    assert testrows[599]['a'] == '599'
+    assert testrows[0]['b'] == 'Other'
+    assert testrows[299]['b'] == '299'
+    assert testrows[45]['b'] == '45'
+    assert testrows[44]['b'] == 'Other'
+    assert len(set([r['a'] for r in testrows])) == 256
+    assert len(set([r['b'] for r in testrows if 'b' in r])) == 256
+
+
+def test_column_profile():
+    rows = [{'_id': str(i), 'ct': i, 'real': i / 2.0, 'cat': 'c' + str(i % 3),
+        'mixed': [1, 'a', None][i % 3]} for i in range(30)]
+    rows.append({'_id': '30', 'extra': [1, 2]})
+    profile = ColumnProfile(rows, sample_size=10, seed=0)
+    assert profile.nrows == 31
+    assert profile.columns == ['_id', 'ct', 'real', 'cat', 'mixed', 'extra']
+    assert profile.present['ct'] == 30
+    assert profile.fill['mixed'] == 20
+    assert profile.types['mixed'] == {int: 10, str: 10}
+    assert (profile.minimum['ct'], profile.maximum['ct']) == (0, 29)
+    assert (profile.minimum['real'], profile.maximum['real']) == (0.0, 14.5)
+    assert 'cat' not in profile.minimum
+    assert profile.cardinality('cat') == 3
+    assert profile.cardinality('extra') is None
+    assert profile.cardinality('missing') == 0
+    assert len(profile.values('ct')) == 10
+    assert set(profile.values('ct')) <= set(range(30))
+    assert ColumnProfile(rows, max_distinct=5).cardinality('ct') is None
+    assert ColumnProfile(rows, sample_size=None).values('mixed') == \
+        [r['mixed'] for r in rows if 'mixed' in r]
+
+
+def test_column_profile_update():
+    rows = [{'a': i} for i in range(10)]
+    profile = ColumnProfile(rows[:5])
+    profile.update(rows[5:])
+    assert profile.nrows == 10
+    assert profile.maximum['a'] == 9
+    assert profile.counts['a'] == dict([(i, 1) for i in range(10)])
+
+
+def test_column_profile_category_counts():
+    schema = {'cat': {'type': 'categorical'}, 'ct': {'type': 'count'}}
+    profile = ColumnProfile([{'cat': 1, 'ct': 1}, {'cat': '1', 'ct': 2},
+        {'cat': 'b'}, {'cat': None}])
+    assert profile.category_counts(schema) == {'cat': {'1': 2, 'b': 1}}
+    assert profile.category_counts(schema, convert_types=False) == {
+        'cat': {'1': 1, 'b': 1}}
+
+
+def test_make_schema_profile():
+    rows = [{'IntA': i, 'CatA': 'a', 'Foo': None} for i in range(5)]
+    schemaRule = [[lambda h, v: all([isinstance(x, int) for x in v]),
+                   {'type': 'count'}],
+                  ['Cat.*', {'type': 'categorical'}]]
+    refSchema = {'IntA': {'type': 'count'}, 'CatA': {'type': 'categorical'}}
+    assert make_schema(schemaRule, rows=rows) == refSchema
+    assert make_schema(schemaRule, profile=ColumnProfile(rows)) == refSchema
+    assert make_schema(schemaRule, headers=['IntA'],
+        profile=ColumnProfile(rows)) == {'IntA': {'type': 'count'}}
+
+
+def test_clean_data_profile():
+    eschema = {'cat': {'type': 'categorical'}}
+    rows = _many_cats_rows()
+    profile = ColumnProfile(rows)
+    # a part of the dataset keeps the categories kept in the whole of it
+    part = [dict(r) for r in rows[500:]]
+    clean_data(part, eschema, profile=profile)
+    assert [r['cat'] for r in part] == ['250', '250', '251', '251', '252',
+        '252', '253', '253', '254', '254', 'Other', 'Other']
+    assert list(iter_clean_data(iter(rows), eschema,
+        profile=profile))[500:] == part
+    assert_raises(VeritableError, clean_data, part, eschema,
+        profile=profile, state=ValidationState(eschema))
+
+
+def test_clean_data_stale_profile():
+    eschema = {'cat': {'type': 'categorical'}}
+    rows = _many_cats_rows()
+    # a profile of a few of the rows has too few categories to reduce them
+    profile = ColumnProfile(rows[:10])
+    cleaned = [dict(r) for r in rows]
+    clean_data(cleaned, eschema, profile=profile)
+    assert len(set([r['cat'] for r in cleaned])) == 256
+    assert [r['cat'] for r in cleaned[:10]] == [r['cat'] for r in rows[:10]]
+    assert_raises(VeritableError, list, iter_clean_data(iter(rows), eschema,
+        profile=profile))
+
+
+def test_infer_schema():
+    rows = [{'_id': str(i), 'ct': i, 'neg': i - 50, 'real': i / 2.0,
+        'bool': i % 2 == 0, 'cat': 'c' + str(i % 3), 'none': None}
+        for i in range(100)]
+    schema = infer_schema(rows)
+    assert schema == {'ct': {'type': 'count'}, 'neg': {'type': 'real'},
+        'real': {'type': 'real'}, 'bool': {'type': 'boolean'},
+        'cat': {'type': 'categorical'}}
+    assert validate_schema(schema)
+    clean_data(rows, schema, remove_extra_fields=True)
+
+
+def test_infer_schema_column_names():
+    rows = [{'_id': str(i), '_rid': str(i), 'a.b': i, 'x$': i, 'ct': i}
+        for i in range(10)]
+    schema = infer_schema(rows)
+    assert schema == {'ct': {'type': 'count'}}
+    assert validate_schema(schema)
+
+
+def test_infer_schema_unhashable():
+    rows = [{'ct': i, 'lst': [i], 'mixed': i} for i in range(100)]
+    rows[0]['mixed'] = {'a': 1}
+    (schema, fractions) = infer_schema(rows, return_fractions=True)
+    assert schema == {'ct': {'type': 'count'}, 'lst': {'type': 'categorical'},
+        'mixed': {'type': 'count'}}
+    assert fractions == {'ct': 1.0, 'lst': 1.0, 'mixed': 0.99}
+
+
+def test_infer_schema_csv():
+    handle, filename = mkstemp()
+    rows = [{'_id': str(i), 'ct': i, 'real': i / 2.0,
+        'bool': ['Yes', 'no'][i % 2], 'cat': 'c' + str(i % 3)}
+        for i in range(100)]
+    write_csv(rows, filename)
+    assert infer_schema(iter_csv(filename, id_col='_id'),
+        sample_size=20, seed=0) == TYPED_SCHEMA
+    os.remove(filename)
+
+
+def test_infer_schema_confidence():
+    rows = [{'ct': str(i)} for i in range(100)]
+    rows[7]['ct'] = 'n/a'
+    rows[8]['ct'] = '2.5'
+    assert infer_schema(rows, sample_size=None) == {'ct': {'type': 'count'}}
+    assert infer_schema(rows, sample_size=None, confidence=0.985) == \
+        {'ct': {'type': 'real'}}
+    assert infer_schema(rows, sample_size=None, confidence=1.0) == \
+        {'ct': {'type': 'categorical'}}
+
+
+def test_infer_schema_max_rows():
+    rows = iter([{'a': i} for i in range(10)] + [{'a': 'x'}] * 10)
+    assert infer_schema(rows, max_rows=10) == {'a': {'type': 'count'}}
+    assert next(rows) == {'a': 'x'}
+
+
+def test_infer_schema_profile():
+    rows = [{'a': 1.5, 'b': 'x'} for i in range(10)]
+    assert infer_schema(ColumnProfile(rows)) == {'a': {'type': 'real'},
+        'b': {'type': 'categorical'}}
+
+
+def test_split_rows():
+    rows = [{'_id': str(i)} for i in range(10)]
+    (train, test) = split_rows(rows, frac=0.3)
+    assert len(train) == 3 and len(test) == 7
+    assert sorted([r['_id'] for r in train + test]) == \
+        sorted([r['_id'] for r in rows])
+
+
+def test_hash_split():
+    rows = [{'_id': str(i)} for i in range(1000)]
+    (train, test) = hash_split(iter(rows), frac=0.8)
+    assert len(train) + len(test) == 1000
+    assert 700 < len(train) < 900
+    # the same rows in another order are split the same way
+    (train2, test2) = hash_split(reversed(rows), frac=0.8)
+    assert sorted([r['_id'] for r in train]) == \
+        sorted([r['_id'] for r in train2])
+    (train3, test3) = hash_split(rows, frac=0.8, salt='other')
+    assert train3 != train
+    assert_raises(VeritableError, hash_split, [{'a': 1}])
+
+
+def test_kfold_split():
+    rows = [{'_id': str(i)} for i in range(500)]
+    folds = kfold_split(rows, k=5)
+    assert len(folds) == 5
+    assert sum([len(f) for f in folds]) == 500
+    assert min([len(f) for f in folds]) > 50
+    assert folds[0] == hash_split(rows, frac=0.2)[0]
+    assert_raises(VeritableError, kfold_split, rows, k=5, sinks=[[].append])
+
+
+def test_reservoir_split():
+    rows = [{'_id': str(i)} for i in range(1000)]
+    (rest, holdout) = reservoir_split(iter(rows), 50, seed=0)
+    assert len(holdout) == 50 and len(rest) == 950
+    assert sorted([r['_id'] for r in rest + holdout]) == \
+        sorted([r['_id'] for r in rows])
+    assert reservoir_split(rows, 50, seed=0) == (rest, holdout)
+    (rest, holdout) = reservoir_split(rows[:10], 50)
+    assert rest == [] and holdout == rows[:10]
+
+
+def test_stratified_split():
+    rows = [{'_id': str(i), 'cat': ['a', 'b', 'c'][i % 3] if i < 90 else
+        'rare'} for i in range(100)]
+    rows.append({'_id': 'x'})
+    (train, test) = stratified_split(rows, 'cat', frac=0.7, seed=0)
+    for (v, n) in [('a', 30), ('b', 30), ('c', 30), ('rare', 10), (None, 1)]:
+        k = len([r for r in train if r.get('cat') == v])
+        assert k in (int(n * 0.7), int(n * 0.7) + 1)
+    assert len(train) + len(test) == 101
+
+
+def test_split_to_csv_sinks():
+    (h1, train_file) = mkstemp()
+    (h2, test_file) = mkstemp()
+    rows = [{'_id': str(i), 'ct': i, 'cat': 'c' + str(i % 3)}
+        for i in range(100)]
+    schema = {'ct': {'type': 'count'}, 'cat': {'type': 'categorical'}}
+    counts = hash_split(iter(rows), frac=0.75, sinks=[
+        CsvSink(train_file, schema=schema), CsvSink(test_file, schema=schema)])
+    (train, test) = hash_split(rows, frac=0.75)
+    assert counts == (len(train), len(test))
+    assert read_csv(train_file, id_col='_id', schema=schema) == train
+    assert read_csv(test_file, id_col='_id', schema=schema) == test
+    assert_raises(VeritableError, CsvSink, train_file)
+    os.remove(train_file)
+    os.remove(test_file)
+
+
+def _columnar_table():
+    return {'_id': [str(i) for i in range(6)],
+        'ct': [1, '2', None, -1, 4, 5],
+        'real': array.array('d', [1.0, 2.5, 2, 0.5, 3.5, 1]),
+        'bool': [True, 'yes', 0, None, False, True],
+        'cat': ['a', 1, None, 'b', 'a', 'c'],
+        'extra': [1] * 6}
+
+
+def test_iter_columnar_rows():
+    columns = _columnar_table()
+    rows = list(iter_columnar_rows(columns, chunk_rows=4))
+    assert len(rows) == 6
+    assert rows[2] == {'_id': '2', 'real': 2.0, 'bool': 0, 'extra': 1}
+    assert rows == list(iter_columnar_rows(columns))
+    assert_raises(VeritableError, list,
+        iter_columnar_rows({'a': [1, 2], 'b': [1]}))
+
+
+def test_clean_columnar_matches_rows():
+    columns = _columnar_table()
+    rows = list(iter_columnar_rows(columns))
+    clean_data(columns, TYPED_SCHEMA)
+    clean_data(rows, TYPED_SCHEMA)
+    assert columns['ct'] == [1, 2, None, None, 4, 5]
+    assert columns['cat'] == ['a', '1', None, 'b', 'a', 'c']
+    assert list(iter_columnar_rows(columns)) == rows
+    validate_data(columns, TYPED_SCHEMA)
+
+
+def test_clean_columnar_typed_arrays():
+    nan = float('nan')
+    columns = {'_id': [str(i) for i in range(4)],
+        'ct': array.array('l', [0, 1, 2, 3]),
+        'real': array.array('d', [0.5, nan, 1.5, nan]),
+        'bool': [True, False, True, False],
+        'cat': ['a', 'b', 'a', 'b'],
+        'extra': array.array('d', [nan, 1.0, nan, nan])}
+    ct = columns['ct']
+    real = columns['real']
+    clean_data(columns, TYPED_SCHEMA)
+    # arrays that already have the column type are left as they are
+    assert columns['ct'] is ct and columns['real'] is real
+    rows = list(iter_columnar_rows(columns))
+    assert rows[1] == {'_id': '1', 'ct': 1, 'bool': False, 'cat': 'b',
+        'extra': 1.0}
+    # those that don't are cleaned as lists
+    columns['ct'] = array.array('l', [0, 1, -1, 100001])
+    columns['real'] = array.array('d', [0.5, float('inf'), 1.5, nan])
+    clean_data(columns, TYPED_SCHEMA)
+    assert columns['ct'] == [0, 1, None, None]
+    assert columns['real'] == [0.5, None, 1.5, None]
+    assert_raises(VeritableError, validate_data, {'_id': ['a', 'b'],
+        'ct': array.array('l', [1, -1])}, {'ct': {'type': 'count'}})
+
+
+def test_clean_columnar_remove_extra_fields_assign_ids():
+    columns = _columnar_table()
+    del columns['_id']
+    clean_data(columns, TYPED_SCHEMA, assign_ids=True,
+        remove_extra_fields=True)
+    assert sorted(columns.keys()) == ['_id', 'bool', 'cat', 'ct', 'real']
+    assert columns['_id'] == ['0', '1', '2', '3', '4', '5']
+
+
+def test_validate_columnar_errors():
+    schema = {'ct': {'type': 'count'}}
+    for compact_ids in (False, True):
+        try:
+            validate_data({'_id': ['a', 'b', 'a'], 'ct': [1, 2, 3]}, schema,
+                compact_ids=compact_ids)
+        except VeritableError as e:
+            assert e.row == 2 and e.col == '_id'
+        else:
+            assert False
+    try:
+        validate_data({'_id': ['a', 'b'], 'ct': [1, '2']}, schema)
+    except VeritableError as e:
+        assert e.row == 1 and e.col == 'ct'
+    else:
+        assert False
+    assert_raises(VeritableError, validate_data, {'_id': ['a', None],
+        'ct': [1, 2]}, schema)
+    assert_raises(VeritableError, validate_data, {'_id': ['a', 'b'],
+        'ct': [None, None]}, schema)
+    assert_raises(VeritableError, clean_data, {'_id': ['a'], 'ct': [1]},
+        schema, state=ValidationState(schema))
+    assert_raises(VeritableError, clean_predictions, {'ct': [None]}, schema)
+
+
+def test_clean_columnar_reduce_categories():
+    columns = {'_id': [str(i) for i in range(600)],
+        'cat': ['c' + str(i % 300) for i in range(600)]}
+    columns['cat'][0] = None
+    schema = {'cat': {'type': 'categorical'}}
+    assert_raises(VeritableError, validate_data, columns, schema)
+    rows = list(iter_columnar_rows(columns))
+    clean_data(columns, schema)
+    clean_data(rows, schema)
+    assert len(set(columns['cat'])) == 257
+    assert list(iter_columnar_rows(columns)) == rows
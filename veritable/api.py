@@ -10,9 +10,10 @@ import time
 import copy
 from .cursor import Cursor
 from .connection import Connection
+from .scheduler import BULK
 from .exceptions import VeritableError
 from .utils import (_make_table_id, _make_analysis_id, _check_id,
-    _format_url, _handle_unicode_id, _is_str)
+    _format_url, _handle_unicode_id, _is_str, iter_columnar_rows)
 
 # ensure map returns an iterator (as in python 3) not a generator (as in 2)
 try:
@@ -27,8 +28,17 @@ except ImportError:
 BASE_URL = "https://api.priorknowledge.com/"
 
 
+def _deadline(timeout):
+    # converts a timeout in seconds from now into an absolute deadline
+    if timeout is None:
+        return None
+    return time.time() + timeout
+
+
 def connect(api_key=None, api_base_url=None, ssl_verify=True,
-        enable_gzip=True, debug=False):
+        enable_gzip=True, debug=False, coalesce_gets=False,
+        rate_limiter=None, timeout=None, hedge=False, hedge_delay=None,
+        scheduler=None, breaker=None, transport=None):
     """Entry point to the Veritable API.
 
     Returns a veritable.api.API instance.
@@ -43,6 +53,34 @@ def connect(api_key=None, api_base_url=None, ssl_verify=True,
     enable_gzip -- controls whether requests to and from the API server are
         gzipped. (default: True)
     debug -- controls the production of debug messages. (default: False)
+    coalesce_gets -- controls whether identical GET requests issued
+        concurrently from several threads (for instance, for the same table or
+        analysis state) are merged into a single request. (default: False)
+    rate_limiter -- a veritable.ratelimit.RateLimiter throttling requests to
+        the server, which may be shared with other connections. (default:
+        None) If None, requests are not throttled.
+    timeout -- the default timeout for requests to the server, either a
+        number of seconds or a (connect, read) tuple. (default: None) If None,
+        requests wait indefinitely.
+    hedge -- controls whether idempotent requests (GETs, predictions and
+        similar rows) that are slower than the 95th percentile of recent
+        requests are duplicated, taking whichever response arrives first.
+        (default: False)
+    hedge_delay -- the number of seconds to wait for a response before
+        hedging a request. (default: None) If None, the 95th percentile of
+        the latencies of recent requests with the same method.
+    scheduler -- a veritable.scheduler.RequestScheduler with separate
+        concurrency limits for interactive requests (the default) and bulk
+        requests (row uploads and row cursors), so that interactive requests
+        jump ahead of queued bulk ones. (default: None) If None, requests are
+        not scheduled.
+    breaker -- a veritable.breaker.CircuitBreaker which, once too many
+        requests have failed or been slow, makes further requests fail fast
+        with a VeritableError until the server recovers. (default: None)
+    transport -- the veritable.transport object that carries requests to the
+        server. (default: None) If None, requests are sent over HTTP. Pass a
+        veritable.transport.InProcessTransport to talk to an in-process
+        stand-in server.
 
     See also: https://dev.priorknowledge.com/docs/client/python
 
@@ -55,7 +93,10 @@ def connect(api_key=None, api_base_url=None, ssl_verify=True,
         api_base_url = os.getenv("VERITABLE_URL") or BASE_URL
     abbrev_key = '{0}...'.format(api_key[:6])
     connection = Connection(api_key=api_key, api_base_url=api_base_url,
-            ssl_verify=ssl_verify, enable_gzip=enable_gzip, debug=debug)
+            ssl_verify=ssl_verify, enable_gzip=enable_gzip, debug=debug,
+            coalesce_gets=coalesce_gets, rate_limiter=rate_limiter,
+            timeout=timeout, hedge=hedge, hedge_delay=hedge_delay,
+            scheduler=scheduler, breaker=breaker, transport=transport)
     try:
         connection_test = connection.get("/")
     except Exception as e:
@@ -359,7 +400,7 @@ class Table:
         """
         collection = self._link("rows")
         return Cursor(self._conn, collection, start=start,
-            limit=limit)
+            limit=limit, priority=BULK)
 
     def upload_row(self, row):
         """Adds a row to the table or updates an existing row.
@@ -397,13 +438,18 @@ class Table:
         rows - a iterable of row data dicts representing the rows to upload. Each dict
             must contain an '_id' key whose value is a string containing only
             alphanumerics, underscores, and hyphens, and is unique in the
-            table.
+            table. Rows may instead be given as a columnar table, a dict
+            mapping each column to a list or array of its values, in which
+            case the row dicts are built a page at a time, as by
+            veritable.utils.iter_columnar_rows.
         per_page - the number of rows to upload per HTTP request
             (default: 100)
 
         See also: https://dev.priorknowledge.com/docs/client/python
 
         """
+        if isinstance(rows, dict):  # a columnar table
+            rows = iter_columnar_rows(rows, chunk_rows=per_page)
         self._batch_modify_rows('put', rows, per_page)
 
     def _batch_modify_rows(self, action, rows, per_page):
@@ -423,12 +469,12 @@ class Table:
             i = i+1
             if i == per_page:
                 data = {'action': action, 'rows': batch}
-                self._conn.post(self._link('rows'), data)
+                self._conn.post(self._link('rows'), data, priority=BULK)
                 i = 0
                 batch = []
         if len(batch) > 0:
             data = {'action': 'put', 'rows': batch}
-            self._conn.post(self._link('rows'), data)
+            self._conn.post(self._link('rows'), data, priority=BULK)
 
     def delete_row(self, row_id):
         """Deletes a row from the table by its id.
@@ -737,7 +783,7 @@ class Analysis:
                     "exceeded".format(max_time))
             self.update()
 
-    def predict(self, row, count=100):
+    def predict(self, row, count=100, timeout=None):
         """Makes predictions from the analysis.
 
         Returns a veritable.api.Prediction instance.
@@ -748,6 +794,9 @@ class Analysis:
         count -- the number of samples from the joint predictive distribution
             to return. The number of samples allowed by the API is limited on
             a per-user basis.
+        timeout -- the number of seconds within which all the requests needed
+            to make the prediction must complete. (default: None) If None,
+            only the connection's per-request timeout applies.
 
         See also: https://dev.priorknowledge.com/docs/client/python
 
@@ -755,9 +804,10 @@ class Analysis:
         if not isinstance(row, dict):
             raise VeritableError("Must provide a row dict to make "\
                 "predictions!")
-        return list(self._predict([row], count))[0]
+        return list(self._predict([row], count,
+            deadline=_deadline(timeout)))[0]
 
-    def batch_predict(self, rows, count=100):
+    def batch_predict(self, rows, count=100, timeout=None):
         """Makes predictions from the analysis for multiple rows at a time.
 
         Returns an iterator over veritable.api.Prediction instances.
@@ -768,10 +818,15 @@ class Analysis:
         count -- the number of samples from the joint predictive distribution
             to return. The number of samples allowed by the API is limited on
             a per-user basis.
+        timeout -- the number of seconds, from the time of the call, within
+            which all the requests needed to make the predictions must
+            complete. (default: None) If None, only the connection's
+            per-request timeout applies.
 
         See also: https://dev.priorknowledge.com/docs/client/python
 
         """
+        deadline = _deadline(timeout)
         def rowcheck():
             for row in rows:         
                 if not isinstance(row, dict):
@@ -782,9 +837,10 @@ class Analysis:
                         "contain a '_request_id' field: {0}".format(row))
                 _check_id(row['_request_id'])
                 yield row
-        return self._predict(rowcheck(), count)
+        return self._predict(rowcheck(), count, deadline=deadline)
 
-    def _predict(self, rows, count, maxcells=None, maxcols=None):
+    def _predict(self, rows, count, maxcells=None, maxcols=None,
+                 deadline=None):
         """ Encapsulate prediction logic for single and multi-row predictions.
 
         Users should not call directly. Use Analysis.predict and
@@ -805,10 +861,12 @@ class Analysis:
                 while len(res) < count:
                     batch_count = min(max_batch_count,count-len(res))
                     res = res + self._conn.post(self._link('predict'),
-                        data={'data': data, 'count': batch_count, 'return_fixed': False})
+                        data={'data': data, 'count': batch_count, 'return_fixed': False},
+                        deadline=deadline, idempotent=True)
             else:
                 res = self._conn.post(self._link('predict'),
-                    data={'data': batch, 'count': count, 'return_fixed': False})
+                    data={'data': batch, 'count': count, 'return_fixed': False},
+                    deadline=deadline, idempotent=True)
                 
             if not isinstance(res, list):
                 raise VeritableError("Error making "\
@@ -927,7 +985,8 @@ class Analysis:
             raise VeritableError("Analysis with id {0} has failed and " \
             "cannot get relateds: {1}".format(self.id, self.error))
 
-    def similar_to(self, row, column_id, max_rows=10, return_data=True):
+    def similar_to(self, row, column_id, max_rows=10, return_data=True,
+                   timeout=None):
         """Returns rows which are similar to a target row in the context
         of a particular column of interest. 
 
@@ -943,6 +1002,9 @@ class Analysis:
             number of similar rows returned will be less than or equal to max_rows.
         return_data -- if True (default), the full row content will be returned.
             If False, only the '_id' field for each row will be returned.
+        timeout -- the number of seconds within which the request must
+            complete. (default: None) If None, the connection's default
+            timeout applies.
 
         See also: https://dev.priorknowledge.com/docs/client/python
 
@@ -962,7 +1024,8 @@ class Analysis:
         if self.state == 'succeeded':
             res = self._conn.post(self._link('similar'),
               data={'data': row, 'column': column_id,
-                    'max_rows': max_rows, 'return_data': return_data})
+                    'max_rows': max_rows, 'return_data': return_data},
+              deadline=_deadline(timeout), idempotent=True)
             for r in res['data']:
                 yield r
         elif self.state == 'running':
@@ -1290,7 +1353,7 @@ class Grouping:
                 collection = self._link('rows')
             extra_args = {'return_data': return_data}
             return Cursor(self._conn, collection, start=start, limit=limit, 
-                          extra_args=extra_args)
+                          extra_args=extra_args, priority=BULK)
         elif self.state == 'running':
             raise VeritableError("Grouping for column_id {0} is still running " \
             "and not yet ready to get groups".format(self.column_id))
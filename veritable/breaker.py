@@ -0,0 +1,189 @@
+"""Circuit breaking for requests to a failing Veritable server.
+
+See also: https://dev.priorknowledge.com/docs/client/python
+
+"""
+
+import threading
+import time
+from collections import deque
+from .exceptions import VeritableError
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+
+    """Fails requests fast while the Veritable server is failing or slow.
+
+    The breaker watches the outcomes of the most recent requests. While
+    closed, requests pass through. When the proportion of failed requests
+    (network errors and 5xx or 429 responses) or of slow requests in the
+    window reaches its threshold, the breaker opens, and requests fail
+    immediately with a VeritableError whose code is 'circuit_open'. After
+    reset_timeout seconds the breaker becomes half-open and lets a few probe
+    requests through: if they succeed it closes again, otherwise it reopens.
+
+    Arguments:
+    failure_rate -- the proportion of failed requests in the window at
+        which the breaker opens (default: 0.5)
+    slow_call_duration -- the number of seconds after which a request counts
+        as slow (default: None) If None, latency is not considered.
+    slow_call_rate -- the proportion of slow requests in the window at which
+        the breaker opens (default: 0.5)
+    window -- the number of most recent requests considered (default: 20)
+    min_calls -- the number of requests that must be in the window before
+        the breaker may open (default: 10)
+    reset_timeout -- the number of seconds the breaker stays open before
+        probing the server (default: 30)
+    half_open_calls -- the number of probe requests allowed, and required to
+        succeed, while half-open (default: 1)
+    on_state_change -- a function called as f(old_state, new_state) when the
+        breaker changes state (default: None) More functions can be added
+        with add_listener.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, failure_rate=0.5, slow_call_duration=None,
+                 slow_call_rate=0.5, window=20, min_calls=10, reset_timeout=30,
+                 half_open_calls=1, on_state_change=None):
+        if not isinstance(window, int) or not window > 0:
+            raise VeritableError("Window must be an int greater than 0")
+        if not isinstance(half_open_calls, int) or not half_open_calls > 0:
+            raise VeritableError("Half-open calls must be an int greater " \
+            "than 0")
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min(min_calls, window)
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._listeners = []
+        if on_state_change is not None:
+            self._listeners.append(on_state_change)
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes = 0
+        self._probe_successes = 0
+
+    def __str__(self):
+        return "<veritable.CircuitBreaker state='{0}'>".format(self.state)
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def state(self):
+        """The state of the breaker: 'closed', 'open' or 'half_open'."""
+        with self._lock:
+            return self._state
+
+    def add_listener(self, f):
+        """Adds a function called as f(old_state, new_state) on changes."""
+        self._listeners.append(f)
+
+    def _transition(self, state):
+        # changes state; must be called with the lock held. Returns the
+        #   change for _notify, or None if the state is unchanged.
+        if state == self._state:
+            return None
+        old = self._state
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.time()
+        elif state == HALF_OPEN:
+            self._probes = 0
+            self._probe_successes = 0
+        elif state == CLOSED:
+            self._outcomes.clear()
+        return (old, state)
+
+    def _notify(self, change):
+        if change is not None:
+            for f in self._listeners:
+                f(*change)
+
+    def _tripped(self):
+        # whether the outcomes in the window call for opening the breaker
+        n = len(self._outcomes)
+        if n < self.min_calls:
+            return False
+        failures = sum([1 for (ok, slow) in self._outcomes if not ok])
+        if float(failures) / n >= self.failure_rate:
+            return True
+        if self.slow_call_duration is not None:
+            slow = sum([1 for (ok, slow) in self._outcomes if slow])
+            if float(slow) / n >= self.slow_call_rate:
+                return True
+        return False
+
+    def admit(self):
+        """Admits a request, or raises a VeritableError if the breaker is open.
+
+        Every admitted request must be followed by a call to record, or to
+        cancel if it was not sent after all.
+
+        """
+        change = None
+        with self._lock:
+            if self._state == OPEN:
+                if time.time() - self._opened_at >= self.reset_timeout:
+                    change = self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    state = self._state
+                else:
+                    self._probes += 1
+                    state = None
+            else:
+                state = None if self._state == CLOSED else self._state
+        self._notify(change)
+        if state is not None:
+            raise VeritableError("Circuit breaker is {0}: failing fast " \
+            "without contacting the server".format(state.replace('_', '-')),
+                code='circuit_open')
+
+    def record(self, success, duration=0.0):
+        """Records the outcome of an admitted request.
+
+        Arguments:
+        success -- whether the request succeeded
+        duration -- the number of seconds the request took (default: 0.0)
+
+        """
+        slow = (self.slow_call_duration is not None and
+            duration >= self.slow_call_duration)
+        change = None
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if not success or slow:
+                    change = self._transition(OPEN)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        change = self._transition(CLOSED)
+            elif self._state == CLOSED:
+                self._outcomes.append((success, slow))
+                if self._tripped():
+                    change = self._transition(OPEN)
+        self._notify(change)
+
+    def cancel(self):
+        """Withdraws an admitted request that was never sent."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def reset(self):
+        """Closes the breaker and forgets the outcomes of past requests."""
+        with self._lock:
+            change = self._transition(CLOSED)
+            self._outcomes.clear()
+        self._notify(change)
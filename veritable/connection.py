@@ -4,16 +4,27 @@ See also: https://dev.priorknowledge.com/docs/client/python
 
 """
 
+import copy
 import logging
 import requests
 import json
 import sys
+import threading
+import time
+from collections import deque
 from gzip import GzipFile
 from io import BytesIO
 from requests.auth import HTTPBasicAuth
 from .exceptions import VeritableError
+from .ratelimit import _retry_after, _count_cells
+from .scheduler import INTERACTIVE
+from .transport import HTTPTransport
 from .utils import _url_has_scheme, _format_url
 from .version import __version__
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 
 USER_AGENT = "veritable-python " + __version__
 
@@ -75,6 +86,116 @@ def _mgzip(buf):
     return result
 
 
+# arguments that bound how long a caller waits rather than what it requests;
+#   the leader's govern a shared call
+_UNKEYED_ARGS = ('timeout', 'deadline')
+
+
+def _request_key(url, kwargs):
+    # builds a hashable key identifying a request by its url and arguments
+    return (url, json.dumps(dict([(k, v) for (k, v) in kwargs.items()
+        if k not in _UNKEYED_ARGS]), sort_keys=True, default=str))
+
+
+class _Call:
+    # a request in flight, shared by the callers waiting on its result
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class _SingleFlight:
+    # coalesces concurrent identical calls into a single call. The first
+    # caller for a key does the work; callers arriving while it is in
+    # flight block until it finishes and then receive their own copy of the
+    # decoded result (or the same exception).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, f):
+        self._lock.acquire()
+        try:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+        finally:
+            self._lock.release()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = f()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._lock.acquire()
+            try:
+                del self._calls[key]
+                shared = call.waiters > 0
+            finally:
+                self._lock.release()
+            call.done.set()
+        if shared:
+            # waiters copy from call.result, so the leader must not hand out
+            # the object they are copying from
+            return copy.deepcopy(call.result)
+        return call.result
+
+
+def _server_ok(r):
+    # whether a response shows the server to be healthy: client errors such
+    #   as 404 count, server errors and throttling do not
+    return r.status_code < 500 and r.status_code != 429
+
+
+def _timeout_for(timeout, deadline):
+    # caps a timeout (a number of seconds or a (connect, read) tuple) at the
+    #   time remaining before deadline, raising if the deadline has passed
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise VeritableError("Deadline exceeded", deadline=deadline)
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple([remaining if t is None else min(t, remaining)
+            for t in timeout])
+    return min(timeout, remaining)
+
+
+class _LatencyTracker:
+    # keeps the most recent request latencies to estimate percentiles
+    def __init__(self, size=200, min_samples=20):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p):
+        # returns the p-th percentile of the recorded latencies, or None if
+        #   there are too few samples to say
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))]
+
+
 class Connection:
 
     """Wraps the raw HTTP connection to the Veritable server.
@@ -93,7 +214,10 @@ class Connection:
     """
 
     def __init__(self, api_key, api_base_url, ssl_verify=None,
-                 enable_gzip=True, debug=False):
+                 enable_gzip=True, debug=False, coalesce_gets=False,
+                 rate_limiter=None, timeout=None, hedge=False,
+                 hedge_delay=None, scheduler=None,
+                 default_priority=INTERACTIVE, breaker=None, transport=None):
         """Initializes a connection to a Veritable server.
 
         Users should not invoke directly -- use veritable.connect as the
@@ -108,6 +232,35 @@ class Connection:
         enable_gzip -- controls whether requests to and from the API server are
             gzipped. (default: True)
         debug -- controls the production of debug messages. (default: False)
+        coalesce_gets -- controls whether identical GET requests issued
+            concurrently from several threads are merged into a single
+            request whose result is shared by all callers. (default: False)
+        rate_limiter -- a veritable.ratelimit.RateLimiter throttling the
+            requests made through this connection. (default: None) If None,
+            requests are not throttled.
+        timeout -- the default timeout for requests, either a number of
+            seconds or a (connect, read) tuple. (default: None) If None,
+            requests wait indefinitely. Individual calls may pass their own
+            timeout, and a deadline (an absolute time.time() value) that caps
+            it.
+        hedge -- controls whether idempotent requests are hedged: if no
+            response has arrived after hedge_delay, a duplicate request is
+            sent and whichever answers first is used. (default: False)
+        hedge_delay -- the number of seconds to wait before hedging a
+            request. (default: None) If None, the 95th percentile of recent
+            latencies of requests with the same method; requests are not
+            hedged until enough latencies have been observed.
+        scheduler -- a veritable.scheduler.RequestScheduler limiting the
+            concurrency of requests by priority class. (default: None) If
+            None, requests are not scheduled.
+        default_priority -- the priority class of requests that do not
+            specify one. (default: 'interactive')
+        breaker -- a veritable.breaker.CircuitBreaker that fails requests
+            fast while the server is failing or slow. (default: None) If
+            None, every request is sent.
+        transport -- the veritable.transport object that carries requests to
+            the server. (default: None) If None, requests are sent over HTTP
+            with a requests session.
 
         See also: https://dev.priorknowledge.com/docs/client/python
 
@@ -124,7 +277,22 @@ class Connection:
         self.ssl_verify = ssl_verify
         self.disable_gzip = not(enable_gzip)
         self.debug = debug
-        self.session = self._create_session()
+        if transport is None:
+            self.session = self._create_session()
+            transport = HTTPTransport(self.session)
+        else:
+            self.session = None
+        self.transport = transport
+        self._single_flight = _SingleFlight() if coalesce_gets else None
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.scheduler = scheduler
+        self.default_priority = default_priority
+        self.breaker = breaker
+        self._latencies = dict([(m, _LatencyTracker()) for m in
+            ['get', 'post', 'put', 'delete']])
         if self.debug:
             self.logger = logging.getLogger(__name__)
             ch = logging.StreamHandler()
@@ -140,14 +308,111 @@ class Connection:
 
     def _create_session(self):
         # Creates a requests session
-        headers = {'User-Agent': USER_AGENT}
-        return requests.session(auth=self.auth, headers=headers)
+        session = requests.Session()
+        session.auth = self.auth
+        session.headers.update({'User-Agent': USER_AGENT})
+        return session
 
     def _debug_log(self, x):
         """Debug logging."""
         if self.debug:
             self.logger.debug(x)
 
+    def _send(self, method, url, cells=0, deadline=None, idempotent=False,
+              priority=None, **kwargs):
+        # sends a request through the transport, hedging it if it is
+        #   idempotent and hedging is enabled
+        timeout = kwargs.pop('timeout', self.timeout)
+        if priority is None:
+            priority = self.default_priority
+        send = lambda: self._send_once(method, url, cells, timeout, deadline,
+            priority, kwargs)
+        if self.hedge and (idempotent or method == 'get'):
+            return self._hedged(method, send)
+        return send()
+
+    def _send_once(self, method, url, cells, timeout, deadline, priority,
+                   kwargs):
+        # sends a request, guarded by the circuit breaker, throttled by the
+        #   rate limiter and queued by the scheduler if there are any.
+        #   Responses asking us to retry later pause the limiter and are
+        #   retried, up to its max_retries, as long as the deadline allows.
+        retries = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.admit()
+            start = None
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire(cells)
+                if self.scheduler is not None:
+                    self.scheduler.acquire(priority, timeout=None if
+                        deadline is None else max(deadline - time.time(), 0))
+                try:
+                    t = _timeout_for(timeout, deadline)
+                    if t is not None:
+                        kwargs = dict(kwargs, timeout=t)
+                    start = time.time()
+                    r = self.transport.request(method, url, **kwargs)
+                    duration = time.time() - start
+                    self._latencies[method].record(duration)
+                finally:
+                    if self.scheduler is not None:
+                        self.scheduler.release(priority)
+            except Exception:
+                if self.breaker is not None:
+                    if start is None:
+                        self.breaker.cancel()
+                    else:
+                        self.breaker.record(False, time.time() - start)
+                raise
+            if self.breaker is not None:
+                self.breaker.record(_server_ok(r), duration)
+            if self.rate_limiter is None:
+                return r
+            delay = _retry_after(r)
+            if delay is None or retries >= self.rate_limiter.max_retries:
+                return r
+            self._debug_log("Retrying {0} {1} after {2}s".format(
+                method.upper(), url, delay))
+            self.rate_limiter.pause(delay)
+            retries += 1
+
+    def _hedged(self, method, send):
+        # calls send, and calls it again if it has not returned after the
+        #   hedge delay. Returns the first result, or raises the first error
+        #   if both attempts fail.
+        delay = self.hedge_delay
+        if delay is None:
+            delay = self._latencies[method].percentile(95)
+            if delay is None:
+                return send()
+        results = Queue()
+        def attempt():
+            try:
+                results.put((True, send()))
+            except Exception as e:
+                results.put((False, e))
+        def start():
+            t = threading.Thread(target=attempt)
+            t.daemon = True
+            t.start()
+        start()
+        try:
+            ok, value = results.get(timeout=delay)
+            pending = 0
+        except Empty:
+            start()
+            ok, value = results.get()
+            pending = 1
+        if not ok and pending:
+            ok2, value2 = results.get()
+            if ok2:
+                ok, value = ok2, value2
+        if not ok:
+            raise value
+        return value
+
     @property
     def limits(self):
         try:
@@ -165,9 +430,28 @@ class Connection:
         Arguments:
         url -- the URL of the resource to GET
 
+        Keyword arguments:
+        timeout -- the timeout for this request (default: the connection's)
+        deadline -- an absolute time.time() value by which the request must
+            complete
+        priority -- the priority class of the request, if the connection
+            has a scheduler (default: the connection's default_priority)
+
+        If the connection was created with coalesce_gets=True, concurrent
+        calls with the same url and arguments share a single request. Their
+        timeouts and deadlines may differ; those of the first call govern
+        the shared request.
+
         See also: https://dev.priorknowledge.com/docs/client/python
 
         """
+        if self._single_flight is not None:
+            return self._single_flight.do(_request_key(url, kwargs),
+                lambda: self._get(url, **kwargs))
+        return self._get(url, **kwargs)
+
+    def _get(self, url, **kwargs):
+        # performs the GET request for a fully qualified url
         kwargs.update({'headers': {}, 'prefetch': True})
         if self.ssl_verify is not None:
             kwargs['verify'] = self.ssl_verify
@@ -175,7 +459,7 @@ class Connection:
             kwargs['headers']['Accept-Encoding'] = 'gzip'
         if self.debug:
             kwargs['config'] = {'verbose': sys.stderr}
-        r = self.session.get(url, **kwargs)
+        r = self._send('get', url, **kwargs)
         return _get_response_data(r, self._debug_log)
 
     @_fully_qualify_url
@@ -187,6 +471,15 @@ class Connection:
         Arguments:
         url -- the URL of the resource to POST to
         data -- the data to POST (as a Python object)
+
+        Keyword arguments:
+        timeout -- the timeout for this request (default: the connection's)
+        deadline -- an absolute time.time() value by which the request must
+            complete
+        idempotent -- marks the request as safe to send more than once, so
+            that it may be hedged (default: False)
+        priority -- the priority class of the request, if the connection
+            has a scheduler (default: the connection's default_priority)
         
         See also: https://dev.priorknowledge.com/docs/client/python
 
@@ -202,7 +495,7 @@ class Connection:
             kwargs['data'] = json.dumps(data)
         if self.debug:
             kwargs['config'] = {'verbose': sys.stderr}
-        r = self.session.post(url, **kwargs)
+        r = self._send('post', url, _count_cells(data), **kwargs)
         return _get_response_data(r, self._debug_log)
 
     @_fully_qualify_url
@@ -229,7 +522,7 @@ class Connection:
             kwargs['data'] = json.dumps(data)
         if self.debug:
             kwargs['config'] = {'verbose': sys.stderr}
-        r = self.session.put(url, **kwargs)
+        r = self._send('put', url, _count_cells(data), **kwargs)
         return _get_response_data(r, self._debug_log)
 
     @_fully_qualify_url
@@ -249,7 +542,7 @@ class Connection:
             kwargs['verify'] = self.ssl_verify
         if self.debug:
             kwargs['config'] = {'verbose': sys.stderr}
-        r = self.session.delete(url, **kwargs)
+        r = self._send('delete', url, **kwargs)
         try:
             res = _get_response_data(r, self._debug_log)
         except VeritableError as e:
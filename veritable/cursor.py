@@ -15,13 +15,14 @@ class Cursor:
 
     """
     def __init__(self, connection, collection, key=lambda x: x, start=None,
-                 per_page=100, limit=None, extra_args={}):        
+                 per_page=100, limit=None, extra_args={}, priority=None):
         self.__limit = limit
         self.__start = start
         self.__per_page = per_page
         self.__connection = connection
         self.__collection = collection
         self.__f = key
+        self.__priority = priority
         collection_key = collection.split("/")[-1]
         params = {}
         if self.__per_page is not None:
@@ -29,7 +30,7 @@ class Cursor:
         if self.__start is not None:
             params['start'] = self.__start
         params.update(extra_args)
-        res = self.__connection.get(self.__collection, params=params)
+        res = self._get(self.__collection, params=params)
         if collection_key in res:
             self.__key = collection_key
         else:
@@ -50,11 +51,17 @@ class Cursor:
     def collection(self):
         return self.__collection
 
+    def _get(self, url, **kwargs):
+        # fetches a page, at the cursor's priority if it has one
+        if self.__priority is not None:
+            kwargs['priority'] = self.__priority
+        return self.__connection.get(url, **kwargs)
+
     def _refresh(self):
         if len(self.__data):
             return len(self.__data)
         if self.__next:
-            res = self.__connection.get(self.__next)
+            res = self._get(self.__next)
         elif self.__last:
             return 0
         else:
@@ -63,7 +70,7 @@ class Cursor:
                 params['count'] = self.__per_page
             if self.__start is not None:
                 params['start'] = self.__start
-            res = self.__connection.get(self.__collection, params=params)
+            res = self._get(self.__collection, params=params)
         if 'links' in res and 'next' in res['links']:
             self.__next = res['links']['next']
         else:
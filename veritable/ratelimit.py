@@ -0,0 +1,295 @@
+"""Client-side rate limiting for requests to the Veritable API.
+
+A RateLimiter holds token buckets for requests per second and cells per
+second. Bucket state lives in a backend, which may be private to the process
+(LocalBackend), shared with forked worker processes (SharedMemoryBackend), or
+shared with any process on the machine through a state file (FileBackend).
+
+See also: https://dev.priorknowledge.com/docs/client/python
+
+"""
+
+import json
+import os
+import threading
+import time
+import multiprocessing
+from email.utils import parsedate_tz, mktime_tz
+from .exceptions import VeritableError
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# responses carrying a Retry-After header with these status codes pause the
+#   limiter and are retried
+RETRY_STATUS_CODES = (429, 503)
+
+
+def _retry_after(r):
+    # returns the number of seconds the server asked us to wait before
+    #   retrying a response, or None if it did not ask
+    if r.status_code not in RETRY_STATUS_CODES:
+        return None
+    headers = getattr(r, 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - time.time())
+
+
+def _count_cells(data):
+    # estimates the number of cells a request body asks the server to handle:
+    #   the cells of uploaded rows, or the cells of requested predictions
+    if not isinstance(data, dict):
+        return 0
+    if isinstance(data.get('rows'), list):
+        return sum([len(r) for r in data['rows'] if isinstance(r, dict)])
+    if 'data' in data and 'count' in data:
+        rows = data['data'] if isinstance(data['data'], list) else [data['data']]
+        ncols = sum([sum([v is None for v in r.values()]) for r in rows
+            if isinstance(r, dict)])
+        return ncols * data['count']
+    return 0
+
+
+class LocalBackend:
+
+    """Keeps bucket state in memory, shared by the threads of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def transact(self, name, f):
+        # atomically replaces the state of slot name with f(state)[0], and
+        #   returns f(state)[1]
+        with self._lock:
+            state, result = f(self._slots.get(name))
+            self._slots[name] = state
+            return result
+
+
+class SharedMemoryBackend:
+
+    """Keeps bucket state in shared memory.
+
+    The backend must be created before worker processes are started, and
+    passed to them (directly or as part of a RateLimiter), so that all of
+    them share the same buckets.
+
+    Arguments:
+    names -- the names of the slots to allocate
+        (default: ('requests', 'cells', 'pause'))
+
+    """
+
+    def __init__(self, names=('requests', 'cells', 'pause')):
+        self._index = dict([(n, i) for (i, n) in enumerate(names)])
+        self._lock = multiprocessing.Lock()
+        self._values = multiprocessing.RawArray('d', 4 * len(names))
+
+    def transact(self, name, f):
+        if name not in self._index:
+            raise VeritableError("No shared memory slot for bucket "
+                "'{0}'".format(name))
+        base = 4 * self._index[name]
+        with self._lock:
+            if self._values[base] == 0.0:
+                state = None
+            else:
+                state = list(self._values[base + 1:base + 4])
+            state, result = f(state)
+            self._values[base] = 1.0
+            self._values[base + 1:base + 4] = state
+            return result
+
+
+class FileBackend:
+
+    """Keeps bucket state in a local file, locked with flock.
+
+    Any process on the machine that uses a FileBackend with the same path
+    shares the same buckets. Only available on platforms providing fcntl.
+
+    Arguments:
+    path -- the path of the state file. It is created if it does not exist.
+
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise VeritableError("File-backed rate limiting requires fcntl, "
+                "which is not available on this platform.")
+        self.path = path
+        self._lock = threading.Lock()
+
+    def transact(self, name, f):
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                content = b''
+                while True:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        break
+                    content += chunk
+                try:
+                    slots = json.loads(content.decode('utf-8'))
+                except ValueError:
+                    slots = {}
+                state, result = f(slots.get(name))
+                slots[name] = state
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(slots).encode('utf-8'))
+                return result
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+
+class TokenBucket:
+
+    """A token bucket refilled at a constant rate.
+
+    Tokens accumulate at rate per second up to capacity. Acquiring more
+    tokens than the bucket can ever hold is allowed once the bucket is full,
+    and leaves it in debt, so that oversized requests are delayed rather
+    than rejected.
+
+    Arguments:
+    name -- the name of the bucket in its backend
+    rate -- the number of tokens added per second
+    capacity -- the maximum number of tokens held (default: None) If None,
+        one second's worth of tokens.
+    backend -- the backend holding the bucket state (default: None) If None,
+        a new LocalBackend.
+
+    """
+
+    def __init__(self, name, rate, capacity=None, backend=None):
+        if not rate > 0:
+            raise VeritableError("Rate must be greater than 0")
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.backend = backend if backend is not None else LocalBackend()
+
+    def _take(self, n, now):
+        # returns a function for backend.transact that takes n tokens if it
+        #   can, returning the number of seconds to wait otherwise
+        def f(state):
+            if state is None:
+                state = [self.capacity, now, 0.0]
+            tokens = min(self.capacity,
+                state[0] + max(0.0, now - state[1]) * self.rate)
+            if tokens >= n or tokens >= self.capacity:
+                return [tokens - n, now, 0.0], 0.0
+            return [tokens, now, 0.0], (min(n, self.capacity) - tokens) / self.rate
+        return f
+
+    def acquire(self, n=1):
+        """Blocks until n tokens have been taken from the bucket.
+
+        Returns the total number of seconds spent waiting.
+
+        """
+        waited = 0.0
+        while True:
+            wait = self.backend.transact(self.name, self._take(n, time.time()))
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+
+    """Throttles requests to the Veritable API.
+
+    Pass a RateLimiter to veritable.connect (or share one between several
+    connections) to keep the aggregate request and cell rates under the
+    server limits. Responses with status 429 or 503 and a Retry-After header
+    pause every request through the limiter (and through any limiter sharing
+    its backend) for the requested time, after which the request is retried.
+
+    Arguments:
+    requests_per_second -- the maximum sustained request rate (default: None)
+        If None, requests are not limited.
+    cells_per_second -- the maximum sustained rate of cells uploaded or
+        predicted (default: None) If None, cells are not limited.
+    burst -- the number of seconds' worth of tokens that may be spent at
+        once (default: 1.0)
+    backend -- the backend shared by the buckets (default: None) If None,
+        a LocalBackend, shared by the threads of this process only.
+    max_retries -- the maximum number of times a request is retried after
+        being asked to wait by the server (default: 5)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, requests_per_second=None, cells_per_second=None,
+                 burst=1.0, backend=None, max_retries=5):
+        if backend is None:
+            backend = LocalBackend()
+        self.backend = backend
+        self.max_retries = max_retries
+        self.buckets = {}
+        if requests_per_second is not None:
+            self.buckets['requests'] = TokenBucket('requests',
+                requests_per_second, requests_per_second * burst, backend)
+        if cells_per_second is not None:
+            self.buckets['cells'] = TokenBucket('cells', cells_per_second,
+                cells_per_second * burst, backend)
+
+    def __str__(self):
+        return "<veritable.RateLimiter {0}>".format(", ".join([
+            "{0}={1}/s".format(k, v.rate) for (k, v) in
+            sorted(self.buckets.items())]))
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _wait_for_pause(self):
+        # sleeps until any pause requested by the server has elapsed
+        waited = 0.0
+        while True:
+            now = time.time()
+            wait = self.backend.transact('pause',
+                lambda state: (state or [0.0, 0.0, 0.0],
+                    (state or [0.0])[0] - now))
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def acquire(self, cells=0):
+        """Blocks until a request for the given number of cells may be sent.
+
+        Returns the total number of seconds spent waiting.
+
+        """
+        waited = self._wait_for_pause()
+        if 'requests' in self.buckets:
+            waited += self.buckets['requests'].acquire(1)
+        if cells and 'cells' in self.buckets:
+            waited += self.buckets['cells'].acquire(cells)
+        return waited
+
+    def pause(self, seconds):
+        """Blocks all requests through this limiter for seconds seconds."""
+        until = time.time() + seconds
+        def f(state):
+            state = state or [0.0, 0.0, 0.0]
+            return [max(state[0], until), 0.0, 0.0], None
+        self.backend.transact('pause', f)
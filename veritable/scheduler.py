@@ -0,0 +1,165 @@
+"""Priority scheduling of requests to the Veritable API.
+
+A RequestScheduler gives each priority class its own concurrency limit, and
+lets requests of higher classes jump ahead of queued requests of lower
+classes when the connection as a whole is at capacity.
+
+See also: https://dev.priorknowledge.com/docs/client/python
+
+"""
+
+import threading
+import time
+from .exceptions import VeritableError
+
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+
+class RequestScheduler:
+
+    """Schedules requests by priority class.
+
+    Pass a RequestScheduler to veritable.connect to keep bulk traffic, such
+    as batch row uploads and row cursors, from starving latency-sensitive
+    calls such as predictions. Within a class, requests are served in the
+    order in which they arrive. The client tags its own requests as
+    'interactive' or 'bulk', so a scheduler passed to veritable.connect
+    should define limits for both.
+
+    Arguments:
+    limits -- a dict mapping each priority class to the maximum number of
+        its requests in flight at once (default: None) If None,
+        {'interactive': 8, 'bulk': 2}.
+    order -- the priority classes, from highest to lowest priority (default:
+        None) If None, the classes in limits with 'interactive' first and
+        'bulk' last.
+    max_concurrent -- the maximum number of requests of all classes in
+        flight at once (default: None) If None, the sum of the limits.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, limits=None, order=None, max_concurrent=None):
+        if limits is None:
+            limits = {INTERACTIVE: 8, BULK: 2}
+        if order is None:
+            order = sorted(limits.keys(), key=lambda c:
+                (c != INTERACTIVE, c == BULK, c))
+        for c in order:
+            if c not in limits:
+                raise VeritableError("No concurrency limit for priority " \
+                "class '{0}'".format(c))
+            if not isinstance(limits[c], int) or not limits[c] > 0:
+                raise VeritableError("Concurrency limit for priority class " \
+                "'{0}' must be an int greater than 0".format(c))
+        self.limits = dict(limits)
+        self.order = list(order)
+        if max_concurrent is None:
+            max_concurrent = sum(self.limits.values())
+        self.max_concurrent = max_concurrent
+        self._cond = threading.Condition()
+        self._active = dict([(c, 0) for c in self.order])
+        self._total = 0
+        # per-class ticket counters, so that each class is served in order
+        self._next_ticket = dict([(c, 0) for c in self.order])
+        self._serving = dict([(c, 0) for c in self.order])
+        # tickets whose holders gave up waiting before their turn came
+        self._abandoned = dict([(c, set()) for c in self.order])
+
+    def __str__(self):
+        return "<veritable.RequestScheduler {0}>".format(", ".join([
+            "{0}={1}".format(c, self.limits[c]) for c in self.order]))
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _waiting(self, c):
+        return (self._next_ticket[c] - self._serving[c] -
+            len(self._abandoned[c]))
+
+    def _advance(self, c):
+        # moves class c on to its next ticket, skipping abandoned ones
+        self._serving[c] += 1
+        abandoned = self._abandoned[c]
+        while self._serving[c] in abandoned:
+            abandoned.remove(self._serving[c])
+            self._serving[c] += 1
+
+    def _abandon(self, c, ticket):
+        # gives up a ticket that has not been served, so that the requests
+        #   queued behind it are not held up waiting for it
+        if ticket == self._serving[c]:
+            self._advance(c)
+        else:
+            self._abandoned[c].add(ticket)
+        self._cond.notify_all()
+
+    def _can_run(self, c, ticket):
+        # whether the request holding ticket in class c may start now
+        if ticket != self._serving[c]:
+            return False
+        if self._active[c] >= self.limits[c]:
+            return False
+        if self._total >= self.max_concurrent:
+            return False
+        # leave the free slot to a higher class that could use it
+        for h in self.order:
+            if h == c:
+                return True
+            if self._waiting(h) > 0 and self._active[h] < self.limits[h]:
+                return False
+        return True
+
+    def acquire(self, priority, timeout=None):
+        """Blocks until a request of the given priority class may start.
+
+        Raises a VeritableError if the request can't start within timeout
+        seconds. A request that stops waiting, whether it times out or is
+        interrupted, gives up its place in the queue.
+
+        Arguments:
+        priority -- the priority class of the request
+        timeout -- the longest time to wait, in seconds (default: None) If
+            None, waits for as long as it takes.
+
+        """
+        if priority not in self._active:
+            raise VeritableError("Unknown priority class '{0}'".format(
+                priority))
+        with self._cond:
+            ticket = self._next_ticket[priority]
+            self._next_ticket[priority] += 1
+            end = None if timeout is None else time.time() + timeout
+            try:
+                while not self._can_run(priority, ticket):
+                    if end is None:
+                        self._cond.wait()
+                        continue
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        raise VeritableError("Timed out waiting to start " \
+                        "a request of priority class '{0}'".format(priority))
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._abandon(priority, ticket)
+                raise
+            self._advance(priority)
+            self._active[priority] += 1
+            self._total += 1
+            self._cond.notify_all()
+
+    def release(self, priority):
+        """Marks a request of the given priority class as finished."""
+        with self._cond:
+            self._active[priority] -= 1
+            self._total -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Returns a dict of the requests in flight and waiting per class."""
+        with self._cond:
+            return dict([(c, {'active': self._active[c],
+                'waiting': self._waiting(c)}) for c in self.order])
@@ -0,0 +1,761 @@
+"""A local stand-in for the Veritable API server.
+
+Implements the tables, rows, analyses, predict, similar, related and
+grouping endpoints over an in-memory store, so that the client can be
+exercised and benchmarked without the hosted API. Analyses use a trivial
+sampler that draws predicted values from the values observed in each column;
+its predictions, similarities and groupings have the shape, but not the
+quality, of Veritable's.
+
+Latency, bandwidth and errors can be injected to model a remote server.
+
+To run a stand-in server on port 5000:
+
+    python -m veritable.standin --port 5000
+
+See also: https://dev.priorknowledge.com/docs/client/python
+
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+from gzip import GzipFile
+from io import BytesIO
+try:
+    from urllib import urlencode, unquote_plus
+except ImportError:
+    from urllib.parse import urlencode, unquote_plus
+try:
+    from urlparse import parse_qsl
+except ImportError:
+    from urllib.parse import parse_qsl
+try:
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from socketserver import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+from wsgiref.util import application_uri
+from .utils import _validate_schema
+from .exceptions import VeritableError
+
+
+DEFAULT_LIMITS = {
+    'predictions_max_response_cells': 100000,
+    'predictions_max_cols': 1000,
+    'predictions_max_count': 100000,
+    'max_row_batch_count': 1000,
+    'max_page_size': 1000
+}
+
+_STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 429: 'Too Many Requests',
+    500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class _HTTPError(Exception):
+    # an error response, raised from within the endpoint handlers
+    def __init__(self, status, code, message):
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def _not_found(what, id):
+    return _HTTPError(404, 'not_found', "{0} {1} not found".format(what, id))
+
+
+def _bad_request(message):
+    return _HTTPError(400, 'bad_request', message)
+
+
+def _timestamp():
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+
+
+def _flag(value, default=True):
+    # interprets a boolean query parameter
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('true', '1', 'yes')
+
+
+class _Analysis:
+    # an analysis of a snapshot of a table, with a trivial sampler that
+    #   draws each predicted value from the values observed in its column
+    def __init__(self, doc, rows, created, ready_at):
+        self.doc = doc
+        self.schema = doc['schema']
+        self.rows = rows
+        self.created = created
+        self.ready_at = ready_at
+        self.values = {}
+        for c in self.schema:
+            self.values[c] = [r[c] for r in rows if c in r]
+        self.groupings = {}
+
+    def default(self, c):
+        return {'real': 0.0, 'count': 0, 'boolean': False,
+            'categorical': ''}[self.schema[c]['type']]
+
+    def sample(self, rng, c):
+        if self.values[c]:
+            return rng.choice(self.values[c])
+        return self.default(c)
+
+    def similarity(self, c, a, b):
+        if self.schema[c]['type'] in ('real', 'count'):
+            return 1.0 / (1.0 + abs(float(a) - float(b)))
+        return 1.0 if a == b else 0.0
+
+
+class StandinServer:
+
+    """An in-memory stand-in for the Veritable API server.
+
+    StandinServer objects are WSGI applications. The handle method serves a
+    single request without any HTTP machinery, for use in-process.
+
+    Arguments:
+    latency -- the number of seconds added to every response (default: 0.0)
+    jitter -- the maximum number of seconds of uniformly distributed random
+        latency added on top of latency (default: 0.0)
+    bandwidth -- the number of bytes per second at which request and
+        response bodies are transferred (default: None) If None, transfer
+        takes no time.
+    error_rate -- the probability that a request fails with error_status
+        instead of being served (default: 0.0)
+    error_status -- the status of injected errors (default: 503)
+    retry_after -- the value of the Retry-After header sent with injected
+        errors (default: None) If None, no header is sent.
+    analysis_time -- the number of seconds an analysis stays running after
+        it is created (default: 0.0)
+    limits -- a dict of API limits overriding DEFAULT_LIMITS (default: None)
+    seed -- the seed of the random number generator used for sampling and
+        error injection (default: None)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, bandwidth=None,
+                 error_rate=0.0, error_status=503, retry_after=None,
+                 analysis_time=0.0, limits=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.analysis_time = analysis_time
+        self.limits = dict(DEFAULT_LIMITS)
+        if limits is not None:
+            self.limits.update(limits)
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._tables = {}
+        self.requests_served = 0
+
+    def __str__(self):
+        return "<veritable.StandinServer tables={0}>".format(len(self._tables))
+
+    def __repr__(self):
+        return self.__str__()
+
+    def reset(self):
+        """Deletes all tables and analyses."""
+        with self._lock:
+            self._tables = {}
+
+    # --- transport ---
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO', '')
+        query = environ.get('QUERY_STRING', '')
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        body = environ['wsgi.input'].read(length) if length > 0 else b''
+        headers = {}
+        for (k, v) in environ.items():
+            if k.startswith('HTTP_'):
+                headers[k[5:].replace('_', '-').title()] = v
+        if 'CONTENT_TYPE' in environ:
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+        status, response_headers, content = self.handle(method, path,
+            dict(parse_qsl(query)), body, headers,
+            base_url=application_uri(environ).rstrip('/'))
+        if 'gzip' in headers.get('Accept-Encoding', ''):
+            buf = BytesIO()
+            z = GzipFile(mode='wb', compresslevel=5, fileobj=buf)
+            z.write(content)
+            z.close()
+            content = buf.getvalue()
+            response_headers['Content-Encoding'] = 'gzip'
+        response_headers['Content-Length'] = str(len(content))
+        start_response("{0} {1}".format(status,
+            _STATUS_TEXT.get(status, 'Unknown')),
+            list(response_headers.items()))
+        return [content]
+
+    def handle(self, method, path, params=None, body=b'', headers=None,
+               base_url=''):
+        """Serves a single request.
+
+        Returns a tuple (status, headers, content) of the integer status
+        code, a dict of response headers and the JSON response body as bytes.
+
+        Arguments:
+        method -- the HTTP method, e.g. 'GET'
+        path -- the path of the resource, relative to the server root
+        params -- a dict of query parameters (default: None)
+        body -- the request body as bytes, gzipped if headers says so
+            (default: b'')
+        headers -- a dict of request headers (default: None)
+        base_url -- the url of the server root, used to build the links in
+            responses (default: '')
+
+        """
+        params = params or {}
+        headers = headers or {}
+        if isinstance(body, str) and not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        if 'gzip' in headers.get('Content-Encoding', ''):
+            body = GzipFile(mode='rb', fileobj=BytesIO(body)).read()
+        delay = self.latency
+        if self.jitter:
+            delay += self._rng.uniform(0, self.jitter)
+        response_headers = {'Content-Type': 'application/json'}
+        if self.error_rate and self._rng.random() < self.error_rate:
+            status = self.error_status
+            result = {'code': 'injected_error',
+                'message': 'Injected error from stand-in server'}
+            if self.retry_after is not None:
+                response_headers['Retry-After'] = str(self.retry_after)
+        else:
+            try:
+                data = json.loads(body.decode('utf-8')) if body else None
+                with self._lock:
+                    self.requests_served += 1
+                    result = self._dispatch(method.upper(), path, params,
+                        data, base_url.rstrip('/'))
+                status = 200
+            except _HTTPError as e:
+                status = e.status
+                result = {'code': e.code, 'message': e.message}
+            except ValueError:
+                status = 400
+                result = {'code': 'bad_request',
+                    'message': 'Request body is not valid JSON'}
+        content = json.dumps(result).encode('utf-8')
+        if self.bandwidth:
+            delay += float(len(body) + len(content)) / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+        return status, response_headers, content
+
+    # --- routing ---
+
+    def _dispatch(self, method, path, params, data, base):
+        parts = [unquote_plus(p) for p in path.strip('/').split('/') if p]
+        if not parts:
+            self._allow(method, ['GET'])
+            return {'status': 'SUCCESS', 'entropy': self._rng.random()}
+        if parts == ['user', 'limits']:
+            self._allow(method, ['GET'])
+            return dict(self.limits)
+        if parts[0] != 'tables':
+            raise _not_found('Resource', path)
+        if len(parts) == 1:
+            if method == 'GET':
+                return self._page('tables', base + '/tables',
+                    [self._table_doc(base, t) for t in
+                        sorted(self._tables)], params)
+            self._allow(method, ['POST'])
+            return self._create_table(base, data)
+        table_id = parts[1]
+        if table_id not in self._tables:
+            raise _not_found('Table', table_id)
+        table = self._tables[table_id]
+        if len(parts) == 2:
+            if method == 'GET':
+                return self._table_doc(base, table_id)
+            self._allow(method, ['DELETE'])
+            del self._tables[table_id]
+            return {}
+        if parts[2] == 'rows':
+            return self._rows(method, parts[3:], params, data, base, table_id,
+                table)
+        if parts[2] == 'analyses':
+            return self._analyses(method, parts[3:], params, data, base,
+                table_id, table)
+        raise _not_found('Resource', path)
+
+    def _allow(self, method, methods):
+        if method not in methods:
+            raise _HTTPError(405, 'method_not_allowed',
+                "Method {0} not allowed".format(method))
+
+    def _page(self, key, url, items, params, ids=None, extra=None):
+        # returns one page of items. If ids is given (the sorted ids of the
+        #   items), items is a function returning the item with an id, start
+        #   is an id and the page begins at the first item whose id is >=
+        #   start, found by bisection; only the items on the page are built.
+        #   Otherwise items is a list and start is an integer offset.
+        try:
+            per_page = int(params.get('per_page', params.get('count', 100)))
+        except ValueError:
+            raise _bad_request("per_page must be an integer")
+        if per_page < 1:
+            raise _bad_request("per_page must be greater than 0")
+        per_page = min(per_page, self.limits['max_page_size'])
+        start = params.get('start')
+        if start is None:
+            i = 0
+        elif ids is not None:
+            i = bisect_left(ids, start)
+        else:
+            try:
+                i = int(start)
+            except ValueError:
+                raise _bad_request("start must be an integer")
+        if ids is not None:
+            page = [items(item_id) for item_id in ids[i:i + per_page]]
+            n = len(ids)
+        else:
+            page = items[i:i + per_page]
+            n = len(items)
+        res = {key: page, 'links': {}}
+        if i + per_page < n:
+            next_params = dict(extra or {})
+            next_params['per_page'] = per_page
+            next_params['start'] = (ids[i + per_page] if ids is not None
+                else i + per_page)
+            res['links']['next'] = url + '?' + urlencode(
+                sorted(next_params.items()))
+        return res
+
+    # --- tables and rows ---
+
+    def _table_doc(self, base, table_id):
+        table = self._tables[table_id]
+        url = base + '/tables/' + table_id
+        return {'_id': table_id, 'description': table['description'],
+            'created_at': table['created_at'],
+            'last_updated': table['last_updated'],
+            'links': {'self': url, 'rows': url + '/rows',
+                'analyses': url + '/analyses'}}
+
+    def _create_table(self, base, data):
+        if not isinstance(data, dict):
+            raise _bad_request("Expected a table description")
+        table_id = data.get('_id') or uuid.uuid4().hex
+        if table_id in self._tables:
+            raise _HTTPError(400, 'table_exists',
+                "Table {0} already exists".format(table_id))
+        now = _timestamp()
+        self._tables[table_id] = {'description': data.get('description', ''),
+            'created_at': now, 'last_updated': now, 'rows': {},
+            'row_ids': [], 'analyses': {}}
+        return self._table_doc(base, table_id)
+
+    def _rows(self, method, parts, params, data, base, table_id, table):
+        rows = table['rows']
+        url = base + '/tables/' + table_id + '/rows'
+        if not parts:
+            if method == 'GET':
+                return self._page('rows', url, rows.get, params,
+                    ids=table['row_ids'])
+            self._allow(method, ['POST'])
+            if not isinstance(data, dict) or not isinstance(
+                    data.get('rows'), list):
+                raise _bad_request("Expected an action and a list of rows")
+            if len(data['rows']) > self.limits['max_row_batch_count']:
+                raise _bad_request("Cannot modify more than {0} rows at " \
+                "once".format(self.limits['max_row_batch_count']))
+            action = data.get('action')
+            if action not in ('put', 'delete'):
+                raise _bad_request("Invalid action {0}".format(action))
+            for r in data['rows']:
+                if not isinstance(r, dict) or '_id' not in r:
+                    raise _bad_request("Rows must contain an _id")
+            for r in data['rows']:
+                if action == 'put':
+                    self._put_row(table, r)
+                else:
+                    self._delete_row(table, r['_id'])
+            table['last_updated'] = _timestamp()
+            return {}
+        row_id = parts[0]
+        if method == 'GET':
+            if row_id not in rows:
+                raise _not_found('Row', row_id)
+            return rows[row_id]
+        if method == 'PUT':
+            if not isinstance(data, dict):
+                raise _bad_request("Expected a row")
+            row = dict(data)
+            row['_id'] = row_id
+            self._put_row(table, row)
+            table['last_updated'] = _timestamp()
+            return {}
+        self._allow(method, ['DELETE'])
+        if row_id not in rows:
+            raise _not_found('Row', row_id)
+        self._delete_row(table, row_id)
+        table['last_updated'] = _timestamp()
+        return {}
+
+    def _put_row(self, table, row):
+        # stores a row, keeping the table's sorted index of row ids
+        if row['_id'] not in table['rows']:
+            insort(table['row_ids'], row['_id'])
+        table['rows'][row['_id']] = row
+
+    def _delete_row(self, table, row_id):
+        if table['rows'].pop(row_id, None) is not None:
+            ids = table['row_ids']
+            del ids[bisect_left(ids, row_id)]
+
+    # --- analyses ---
+
+    def _analysis_doc(self, base, table_id, analysis):
+        doc = dict(analysis.doc)
+        url = base + '/tables/' + table_id + '/analyses/' + doc['_id']
+        if time.time() < analysis.ready_at:
+            doc['state'] = 'running'
+            total = max(analysis.ready_at - analysis.created, 1e-9)
+            doc['progress'] = {'percent': int(100 * (time.time() -
+                analysis.created) / total), 'finished_at_estimate':
+                time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                    time.gmtime(analysis.ready_at))}
+        else:
+            doc['state'] = 'succeeded'
+            doc['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                time.gmtime(analysis.ready_at))
+        del doc['schema']
+        doc['links'] = {'self': url, 'schema': url + '/schema',
+            'predict': url + '/predict', 'related': url + '/related',
+            'similar': url + '/similar', 'group': url + '/group'}
+        return doc
+
+    def _analyses(self, method, parts, params, data, base, table_id, table):
+        analyses = table['analyses']
+        url = base + '/tables/' + table_id + '/analyses'
+        if not parts:
+            if method == 'GET':
+                return self._page('analyses', url,
+                    lambda i: self._analysis_doc(base, table_id,
+                        analyses[i]), params, ids=sorted(analyses))
+            self._allow(method, ['POST'])
+            return self._create_analysis(base, data, table_id, table)
+        analysis_id = parts[0]
+        if analysis_id not in analyses:
+            raise _not_found('Analysis', analysis_id)
+        analysis = analyses[analysis_id]
+        if len(parts) == 1:
+            if method == 'GET':
+                return self._analysis_doc(base, table_id, analysis)
+            self._allow(method, ['DELETE'])
+            del analyses[analysis_id]
+            return {}
+        resource = parts[1]
+        if resource == 'schema':
+            self._allow(method, ['GET'])
+            return analysis.schema
+        if time.time() < analysis.ready_at:
+            raise _bad_request("Analysis {0} is still running".format(
+                analysis_id))
+        if resource == 'predict':
+            self._allow(method, ['POST'])
+            return self._predict(analysis, data)
+        if resource == 'similar':
+            self._allow(method, ['POST'])
+            return self._similar(analysis, data)
+        if resource == 'related' and len(parts) == 3:
+            self._allow(method, ['GET'])
+            return self._related(analysis, parts[2], params,
+                url + '/' + analysis_id + '/related/' + parts[2])
+        if resource == 'group':
+            return self._group(method, parts[2:], params, data,
+                url + '/' + analysis_id + '/group', analysis)
+        raise _not_found('Resource', '/'.join(parts))
+
+    def _create_analysis(self, base, data, table_id, table):
+        if not isinstance(data, dict) or not isinstance(data.get('schema'),
+                dict):
+            raise _bad_request("Expected an analysis with a schema")
+        try:
+            _validate_schema(data['schema'])
+        except VeritableError as e:
+            raise _bad_request(e.value)
+        analysis_id = data.get('_id') or uuid.uuid4().hex
+        if analysis_id in table['analyses']:
+            raise _HTTPError(400, 'analysis_exists',
+                "Analysis {0} already exists".format(analysis_id))
+        doc = {'_id': analysis_id, 'description': data.get('description', ''),
+            'type': data.get('type', 'veritable'), 'schema': data['schema'],
+            'created_at': _timestamp()}
+        rows = [table['rows'][i] for i in table['row_ids']]
+        created = time.time()
+        analysis = _Analysis(doc, rows, created, created + self.analysis_time)
+        table['analyses'][analysis_id] = analysis
+        return self._analysis_doc(base, table_id, analysis)
+
+    def _predict(self, analysis, data):
+        if not isinstance(data, dict) or 'data' not in data:
+            raise _bad_request("Expected prediction data")
+        requests = data['data']
+        if isinstance(requests, dict):
+            requests = [requests]
+        try:
+            count = int(data.get('count', 100))
+        except ValueError:
+            raise _bad_request("count must be an integer")
+        if count < 1 or count > self.limits['predictions_max_count']:
+            raise _bad_request("count must be between 1 and {0}".format(
+                self.limits['predictions_max_count']))
+        ncells = 0
+        for r in requests:
+            if not isinstance(r, dict):
+                raise _bad_request("Expected a row dict")
+            cols = [c for c in r if c != '_request_id']
+            if len(cols) > self.limits['predictions_max_cols']:
+                raise _bad_request("Too many columns in prediction request")
+            for c in cols:
+                if c not in analysis.schema:
+                    raise _bad_request("Column {0} is not in the " \
+                    "schema".format(c))
+            ncells += count * sum([1 for c in cols if r[c] is None])
+        if ncells > self.limits['predictions_max_response_cells']:
+            raise _bad_request("Prediction request of {0} cells exceeds " \
+            "the limit of {1}".format(ncells,
+                self.limits['predictions_max_response_cells']))
+        return_fixed = _flag(data.get('return_fixed'), False)
+        res = []
+        for r in requests:
+            for i in range(count):
+                sample = {}
+                for (c, v) in r.items():
+                    if c == '_request_id':
+                        sample[c] = v
+                    elif v is None:
+                        sample[c] = analysis.sample(self._rng, c)
+                    elif return_fixed:
+                        sample[c] = v
+                res.append(sample)
+        return res
+
+    def _similar(self, analysis, data):
+        if not isinstance(data, dict) or not isinstance(data.get('data'),
+                dict) or '_id' not in data['data']:
+            raise _bad_request("Expected a target row with an _id")
+        c = data.get('column')
+        if c not in analysis.schema:
+            raise _bad_request("Column {0} is not in the schema".format(c))
+        target = None
+        for r in analysis.rows:
+            if r['_id'] == data['data']['_id']:
+                target = r
+                break
+        if target is None:
+            raise _not_found('Row', data['data']['_id'])
+        return_data = _flag(data.get('return_data'), True)
+        scored = []
+        for r in analysis.rows:
+            if r is target:
+                continue
+            if c in r and c in target:
+                score = analysis.similarity(c, target[c], r[c])
+            else:
+                score = 0.0
+            scored.append((score, r))
+        scored.sort(key=lambda x: -x[0])
+        res = []
+        for (score, r) in scored[:int(data.get('max_rows', 10))]:
+            row = dict(r) if return_data else {'_id': r['_id']}
+            row['_similarity'] = score
+            res.append(row)
+        return {'data': res}
+
+    def _related(self, analysis, column, params, url):
+        if column not in analysis.schema:
+            raise _not_found('Column', column)
+        present = set([r['_id'] for r in analysis.rows if column in r])
+        scores = []
+        for c in sorted(analysis.schema):
+            if c == column:
+                score = 1.0
+            elif not present:
+                score = 0.0
+            else:
+                # the fraction of rows with column that also have c
+                both = sum([1 for r in analysis.rows
+                    if c in r and r['_id'] in present])
+                score = float(both) / len(present)
+            scores.append({'name': c, 'related_score': score})
+        scores.sort(key=lambda x: (-x['related_score'], x['name'] != column))
+        return self._page('data', url, scores, params)
+
+    # --- groupings ---
+
+    def _grouping(self, analysis, column):
+        # groups the rows of an analysis by their value of column; rows
+        #   missing the column form a group of their own
+        if column not in analysis.groupings:
+            keys = {}
+            members = []
+            for r in analysis.rows:
+                value = r.get(column)
+                key = json.dumps(value)
+                if key not in keys:
+                    keys[key] = len(keys)
+                    members.append([])
+                members[keys[key]].append(r)
+            confidence = 1.0 / (1.0 + len(keys)) if keys else 0.0
+            rows = []
+            for (group_id, group) in enumerate(members):
+                for r in group:
+                    rows.append((r, group_id, 1.0 - confidence))
+            rows.sort(key=lambda x: x[0]['_id'])
+            analysis.groupings[column] = {'groups': len(members),
+                'rows': rows}
+        return analysis.groupings[column]
+
+    def _grouping_doc(self, url, column):
+        url = url + '/' + column
+        return {'column_name': column, 'state': 'succeeded',
+            'links': {'self': url, 'groups': url + '/groups',
+                'rows': url + '/rows'}}
+
+    def _grouped_row(self, entry, return_data):
+        r, group_id, confidence = entry
+        row = dict(r) if return_data else {'_id': r['_id']}
+        row['_group_id'] = group_id
+        row['_confidence'] = confidence
+        return row
+
+    def _group(self, method, parts, params, data, url, analysis):
+        if not parts:
+            self._allow(method, ['POST'])
+            if not isinstance(data, dict) or not isinstance(
+                    data.get('columns'), list):
+                raise _bad_request("Expected a list of columns")
+            for c in data['columns']:
+                if c not in analysis.schema:
+                    raise _bad_request("Column {0} is not in the " \
+                    "schema".format(c))
+                self._grouping(analysis, c)
+            return {'groupings': [self._grouping_doc(url, c)
+                for c in data['columns']]}
+        self._allow(method, ['GET'])
+        column = parts[0]
+        if column not in analysis.groupings:
+            raise _not_found('Grouping', column)
+        grouping = analysis.groupings[column]
+        if len(parts) == 1:
+            return self._grouping_doc(url, column)
+        url = url + '/' + column
+        return_data = _flag(params.get('return_data'), True)
+        extra = {'return_data': return_data}
+        if parts[1] == 'groups':
+            if len(parts) == 2:
+                return self._page('groups', url + '/groups', [{'group_id': g}
+                    for g in range(grouping['groups'])], params)
+            try:
+                group_id = int(parts[2])
+            except ValueError:
+                raise _not_found('Group', parts[2])
+            if not 0 <= group_id < grouping['groups']:
+                raise _not_found('Group', parts[2])
+            return self._page('data', url + '/groups/' + parts[2],
+                [self._grouped_row(e, return_data) for e in grouping['rows']
+                    if e[1] == group_id], params, extra=extra)
+        if parts[1] == 'rows':
+            if len(parts) == 2:
+                return self._page('rows', url + '/rows',
+                    [self._grouped_row(e, return_data)
+                        for e in grouping['rows']], params, extra=extra)
+            for e in grouping['rows']:
+                if e[0]['_id'] == parts[2]:
+                    return {'row': self._grouped_row(e, return_data)}
+            raise _not_found('Row', parts[2])
+        raise _not_found('Resource', '/'.join(parts))
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def make_standin_server(host='127.0.0.1', port=5000, quiet=True, **kwargs):
+    """Creates a threaded HTTP server running a StandinServer.
+
+    Returns a wsgiref server whose stand-in application is available as its
+    standin attribute. Call serve_forever to start serving, and shutdown
+    (from another thread) to stop. Pass port=0 to pick a free port, which is
+    then available as server.server_port.
+
+    Arguments:
+    host -- the interface to listen on (default: '127.0.0.1')
+    port -- the port to listen on (default: 5000)
+    quiet -- controls whether request logging is suppressed (default: True)
+    Further keyword arguments are passed to StandinServer.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    app = StandinServer(**kwargs)
+    server = make_server(host, port, app, server_class=_ThreadingWSGIServer,
+        handler_class=_QuietHandler if quiet else WSGIRequestHandler)
+    server.standin = app
+    return server
+
+
+def main(argv=None):
+    from optparse import OptionParser
+    parser = OptionParser(usage="python -m veritable.standin [options]")
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=5000)
+    parser.add_option('--latency', type='float', default=0.0,
+        help="seconds added to every response")
+    parser.add_option('--jitter', type='float', default=0.0,
+        help="maximum random seconds added on top of latency")
+    parser.add_option('--bandwidth', type='float', default=None,
+        help="bytes per second for request and response bodies")
+    parser.add_option('--error-rate', type='float', default=0.0,
+        help="probability of an injected error")
+    parser.add_option('--error-status', type='int', default=503)
+    parser.add_option('--retry-after', type='float', default=None)
+    parser.add_option('--analysis-time', type='float', default=0.0,
+        help="seconds an analysis stays running")
+    parser.add_option('--seed', type='int', default=None)
+    parser.add_option('--verbose', action='store_true', default=False)
+    (options, args) = parser.parse_args(argv)
+    server = make_standin_server(options.host, options.port,
+        quiet=not options.verbose, latency=options.latency,
+        jitter=options.jitter, bandwidth=options.bandwidth,
+        error_rate=options.error_rate, error_status=options.error_status,
+        retry_after=options.retry_after,
+        analysis_time=options.analysis_time, seed=options.seed)
+    print("Veritable stand-in server listening on http://{0}:{1}".format(
+        options.host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
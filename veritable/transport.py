@@ -0,0 +1,117 @@
+"""Transports carrying requests from a Connection to a Veritable server.
+
+A transport has a single method, request(method, url, **kwargs), taking the
+lowercase HTTP method, the fully qualified url and the keyword arguments of
+a requests session call (headers, params, data, timeout, ...), and returning
+a response with status_code, content, headers and raise_for_status.
+
+HTTPTransport sends requests over the network. InProcessTransport hands them
+directly to a handler such as veritable.standin.StandinServer, so that
+benchmarks can measure the cost of the client alone.
+
+See also: https://dev.priorknowledge.com/docs/client/python
+
+"""
+
+import requests
+try:
+    from urlparse import urlparse, parse_qsl
+except ImportError:
+    from urllib.parse import urlparse, parse_qsl
+
+# requests 1.0 dropped the prefetch and config arguments: responses are read
+#   in full unless streamed, and verbose output is configured through the
+#   logging module
+_DROPPED_OPTIONS = ('prefetch', 'config')
+_MODERN_REQUESTS = int(requests.__version__.split('.')[0]) >= 1
+
+
+class HTTPTransport:
+
+    """Sends requests over HTTP through a requests session.
+
+    Arguments:
+    session -- the requests session to use
+
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def __str__(self):
+        return "<veritable.HTTPTransport>"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def request(self, method, url, **kwargs):
+        if _MODERN_REQUESTS:
+            for option in _DROPPED_OPTIONS:
+                kwargs.pop(option, None)
+        return getattr(self.session, method)(url, **kwargs)
+
+
+class InProcessResponse:
+
+    """A response served in-process, mimicking a requests response."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError("{0} Error".format(
+                self.status_code), response=self)
+
+
+def _param(value):
+    # formats a query parameter value as requests would
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return str(value)
+
+
+class InProcessTransport:
+
+    """Serves requests in-process, without sockets or HTTP.
+
+    Arguments:
+    handler -- an object with a method handle(method, path, params, body,
+        headers, base_url) returning (status, headers, content), such as a
+        veritable.standin.StandinServer (default: None) If None, a new
+        StandinServer with no injected latency or errors.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, handler=None):
+        if handler is None:
+            from .standin import StandinServer
+            handler = StandinServer()
+        self.handler = handler
+
+    def __str__(self):
+        return "<veritable.InProcessTransport handler={0}>".format(
+            self.handler)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                **kwargs):
+        parsed = urlparse(url)
+        query = dict(parse_qsl(parsed.query))
+        if params:
+            for (k, v) in params.items():
+                query[k] = _param(v)
+        if data is None:
+            data = b''
+        elif not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        status, response_headers, content = self.handler.handle(
+            method.upper(), parsed.path, query, data, headers or {},
+            base_url=parsed.scheme + '://' + parsed.netloc)
+        return InProcessResponse(status, response_headers, content)
@@ -4,9 +4,25 @@ See also: https://dev.priorknowledge.com/docs/client/python
 
 """
 
+import base64
+import io
+import json
+import locale
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
 import uuid
-from math import floor, ceil, log, isnan, isinf
-from random import shuffle
+from collections import deque, Counter
+from itertools import islice
+from operator import eq
+from math import floor, ceil, log, exp, isnan, isinf
+from random import shuffle, Random
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 try:
     from urlparse import urlparse
 except ImportError:
@@ -16,12 +32,21 @@ try:
 except ImportError:
     from urllib.parse import quote_plus
 import csv
+import hashlib
+import heapq
 import re
 from .exceptions import VeritableError
 
 
 _alphanumeric = re.compile("^[-_a-zA-Z0-9]+$")
+try:
+    _NUMERIC_TYPES = (int, long, float)
+    _STRING_TYPES = basestring
+except NameError:
+    _NUMERIC_TYPES = (int, float)
+    _STRING_TYPES = str
 COUNT_LIMIT = 100000
+MAX_CATS = 256
 
 
 def _handle_unicode_id(id):
@@ -111,7 +136,7 @@ def split_rows(rows, frac=0.5):
 
     """
     N = len(rows)
-    inds = range(N)
+    inds = list(range(N))
     shuffle(inds)
     border_ind = int(floor(N * frac))
     train_dataset = [rows[i] for i in inds[0:border_ind]]
@@ -119,6 +144,200 @@ def split_rows(rows, frac=0.5):
     return train_dataset, test_dataset
 
 
+def _split_into(rows, assign, nparts, sinks):
+    # sends each of rows to the sink of the partition that assign(i, row)
+    #   chooses, then closes the sinks. Returns the partitions as lists if
+    #   sinks is None, and otherwise the number of rows sent to each sink.
+    parts = None
+    if sinks is None:
+        parts = [[] for k in range(nparts)]
+        sinks = [part.append for part in parts]
+    elif len(sinks) != nparts:
+        raise VeritableError("Expected {0} sinks but got {1}.".format(nparts,
+            len(sinks)))
+    counts = [0] * nparts
+    try:
+        for (i, r) in enumerate(rows):
+            k = assign(i, r)
+            sinks[k](r)
+            counts[k] = counts[k] + 1
+    finally:
+        _close_sinks(sinks)
+    if parts is not None:
+        return tuple(parts)
+    return tuple(counts)
+
+
+def _close_sinks(sinks):
+    for sink in sinks:
+        close = getattr(sink, 'close', None)
+        if close is not None:
+            close()
+
+
+def _hash_fraction(salt, r, i, id_col):
+    # a number in [0, 1) that depends only on salt and the row's id
+    if id_col not in r:
+        raise VeritableError("Row {0} is missing the id column {1}.".format(i,
+            id_col), row=i, col=id_col)
+    key = u'{0}/{1}'.format(salt, r[id_col]).encode('utf-8')
+    return int(hashlib.md5(key).hexdigest()[:13], 16) / float(16 ** 13)
+
+
+def hash_split(rows, frac=0.5, sinks=None, id_col='_id', salt=''):
+    """Splits rows into two sets by a hash of their ids.
+
+    Each row goes to the first set with probability frac, decided by its id
+    alone, so the split is repeatable: the same row always lands in the same
+    set, whatever the order of the rows or the other rows present. Rows may
+    be any iterable, and are read in a single pass.
+
+    Returns a tuple of two lists of row dicts if sinks is None, and
+    otherwise a tuple of the number of rows sent to each sink.
+
+    Arguments:
+    rows -- the row dicts to split
+    frac -- the expected fraction of rows in the first set (default: 0.5)
+    sinks -- a pair of callables to which the rows of each set are passed one
+        at a time, such as a CsvSink, an UploadSink or the append method of a
+        list (default: None) Sinks with a close method are closed once all the
+        rows have been split.
+    id_col -- the column holding the row ids (default: '_id')
+    salt -- a string mixed into the hash (default: '') Use a different salt
+        to draw a different split of the same rows.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    def assign(i, r):
+        return 0 if _hash_fraction(salt, r, i, id_col) < frac else 1
+    return _split_into(rows, assign, 2, sinks)
+
+
+def kfold_split(rows, k=5, sinks=None, id_col='_id', salt=''):
+    """Splits rows into k folds by a hash of their ids.
+
+    As for hash_split, each row's fold is decided by its id alone, and rows
+    may be any iterable, read in a single pass.
+
+    Returns a tuple of k lists of row dicts if sinks is None, and otherwise a
+    tuple of the number of rows sent to each sink.
+
+    Arguments:
+    rows -- the row dicts to split
+    k -- the number of folds (default: 5)
+    sinks -- a sequence of k callables to which the rows of each fold are
+        passed one at a time (default: None) Sinks with a close method are
+        closed once all the rows have been split.
+    id_col -- the column holding the row ids (default: '_id')
+    salt -- a string mixed into the hash (default: '')
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    if k < 1:
+        raise VeritableError("The number of folds must be positive.")
+    def assign(i, r):
+        return min(int(_hash_fraction(salt, r, i, id_col) * k), k - 1)
+    return _split_into(rows, assign, k, sinks)
+
+
+def reservoir_split(rows, size, sinks=None, seed=None):
+    """Splits a holdout set of a fixed size from rows.
+
+    The holdout is a uniform random sample of size of the rows, or all of
+    them if there are fewer, drawn by reservoir sampling in a single pass
+    over rows, which may be any iterable. Only the holdout is kept in memory:
+    the other rows are passed on as soon as they are known to be left out.
+
+    Returns a tuple (rest, holdout) of lists of row dicts if sinks is None,
+    and otherwise a tuple of the number of rows sent to each sink.
+
+    Arguments:
+    rows -- the row dicts to split
+    size -- the number of rows to hold out
+    sinks -- a pair of callables to which the rest of the rows and the
+        holdout are passed one at a time (default: None) The holdout is only
+        passed on once all the rows have been read. Sinks with a close method
+        are closed once all the rows have been split.
+    seed -- the seed for the random sample (default: None)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    if size < 1:
+        raise VeritableError("The holdout size must be positive.")
+    parts = None
+    if sinks is None:
+        parts = ([], [])
+        sinks = [part.append for part in parts]
+    elif len(sinks) != 2:
+        raise VeritableError("Expected 2 sinks but got {0}.".format(
+            len(sinks)))
+    reservoir = _Reservoir(size, Random(seed))
+    rest = 0
+    try:
+        for r in rows:
+            dropped = reservoir.add(r)
+            if dropped is not None:
+                sinks[0](dropped)
+                rest = rest + 1
+        for r in reservoir.items:
+            sinks[1](r)
+    finally:
+        _close_sinks(sinks)
+    if parts is not None:
+        return parts
+    return (rest, len(reservoir.items))
+
+
+def stratified_split(rows, column, frac=0.5, sinks=None, seed=None):
+    """Splits rows into two sets, in the same proportion for each value of a
+    column.
+
+    Of the n rows with a given value in column (or without column), the first
+    set receives floor(n * frac) or ceil(n * frac), so the distribution of
+    column is the same in both sets. Rows may be any iterable, read in a
+    single pass; only a running count for each value is kept in memory.
+
+    Returns a tuple of two lists of row dicts if sinks is None, and
+    otherwise a tuple of the number of rows sent to each sink.
+
+    Arguments:
+    rows -- the row dicts to split
+    column -- the column to stratify by, typically a categorical or boolean
+        target
+    frac -- the fraction of each stratum in the first set (default: 0.5)
+    sinks -- a pair of callables to which the rows of each set are passed one
+        at a time (default: None) Sinks with a close method are closed once all
+        the rows have been split.
+    seed -- the seed for the random assignment (default: None)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    rng = Random(seed)
+    # each stratum takes every (1 / frac)th row from a random offset, which
+    #   keeps its split within one row of frac whenever it stops
+    strata = {}
+    def assign(i, r):
+        v = r.get(column)
+        if v not in strata:
+            strata[v] = [0, rng.random()]
+        state = strata[v]
+        state[0] = state[0] + 1
+        before = int(floor((state[0] - 1) * frac + state[1]))
+        after = int(floor(state[0] * frac + state[1]))
+        return 0 if after > before else 1
+    return _split_into(rows, assign, 2, sinks)
+
+
+def _valid_column_name(c):
+    # whether _validate_schema accepts c as a column name
+    return (isinstance(c, _STRING_TYPES) and c != '' and c[0] != '_' and
+        '.' not in c and '$' not in c)
+
+
 def _validate_schema(schema):
     # Checks whether a schema is well formed and raises a
     # VeritableError if not.
@@ -179,7 +398,7 @@ def validate_schema(schema):
         return True
 
 
-def make_schema(schema_rule, headers=None, rows=None):
+def make_schema(schema_rule, headers=None, rows=None, profile=None):
     """Constructs an analysis schema from a schema rule.
 
     Returns an analysis schema as a Python dict.
@@ -192,83 +411,713 @@ def make_schema(schema_rule, headers=None, rows=None):
         Earlier rules will match before later rules.
     headers -- a list of column names against which to match. (default: None)
         If headers is not provided, column names will be read from the rows
-        argument. Either headers or rows must be provided, or an Exception
-        will be raised.
+        or profile arguments. One of headers, rows or profile must be
+        provided, or an Exception will be raised.
     rows -- a list of row dicts from which column names will be extracted if
-        headers are not specified. (default: None)
+        headers are not specified. (default: None) Rules that are functions
+        are passed the list of a column's values in the rows. The values are
+        gathered a column at a time, once for all the rules, so that only
+        one column's values are held at once; this trades a pass over the
+        rows for each column for memory on wide tables. For a single pass,
+        pass a ColumnProfile of the rows as profile instead.
+    profile -- a ColumnProfile from which column names will be read if
+        headers and rows are not specified (default: None) Rules that are
+        functions are passed the profile's sample of a column's values.
 
     See also: https://dev.priorknowledge.com/docs/client/python
 
     """
-    if headers is None and rows is None:
+    if headers is None and rows is None and profile is None:
         raise VeritableError("Either headers or rows must be provided!")
-    if headers is None:
-        headers = set()
-        for r in rows:
-            headers = headers.union(r.keys())
-    schema = {}
     for i in range(len(schema_rule)):
         try:
             schema_rule[i][0] = re.compile(schema_rule[i][0])
         except:
             pass
+    values = None
+    if rows is not None:
+        if headers is None:
+            headers = set()
+            for r in rows:
+                headers.update(r.keys())
+    elif profile is not None:
+        values = dict([(c, profile.values(c)) for c in profile.columns])
+        if headers is None:
+            headers = profile.columns
+    schema = {}
     for c in headers:
+        # the column's values in the rows, gathered for the first rule that
+        #   is a function and kept for the rest
+        column = None
         for (r, t) in schema_rule:
             try:
                 if r.match(c):
                     schema[c] = t
                     break
             except AttributeError:
-                if rows is None:
-                    if r(c, None):
-                        schema[c] = t
-                        break
+                if values is not None:
+                    column = values.get(c, [])
+                elif rows is not None and column is None:
+                    column = [row[c] for row in rows if c in row]
+                if r(c, column):
+                    schema[c] = t
+                    break
+    return schema
+
+
+class _Reservoir:
+
+    # a uniform random sample of up to size of the items added to it, or all
+    #   of them if size is None. Skips ahead between replacements, as in Li's
+    #   Algorithm L, so that random numbers are only drawn for the items
+    #   that enter the sample.
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+        self._next = None
+        self._w = None
+
+    def _skip(self):
+        # draws the number of the next item to enter the full sample
+        self._w = self._w * exp(log(self._random()) / self.size)
+        self._next = self._next + int(floor(log(self._random()) /
+            log(1 - self._w))) + 1
+
+    def _random(self):
+        # a random number in (0, 1)
+        x = self.rng.random()
+        while x == 0.0:
+            x = self.rng.random()
+        return x
+
+    def add(self, item):
+        # returns the item that is left out of the sample, if any: either
+        #   the one replaced or item itself
+        self.seen = self.seen + 1
+        if self.size is None or len(self.items) < self.size:
+            self.items.append(item)
+            if self.seen == self.size:
+                self._w = 1.0
+                self._next = self.seen
+                self._skip()
+            return None
+        if self.seen == self._next:
+            j = self.rng.randint(0, self.size - 1)
+            dropped = self.items[j]
+            self.items[j] = item
+            self._skip()
+            return dropped
+        return item
+
+
+class ColumnProfile:
+
+    """A summary of the values in each column of a dataset.
+
+    Built in a single pass over the rows, or over a sample of them, and
+    consumed by make_schema, infer_schema, clean_data and iter_clean_data so
+    that they need not walk the rows again. For each column, the profile
+    records how many rows have it and how many of those have a value other
+    than None, the types of its values, the range of its numeric values, the
+    counts of its distinct values, and a uniform sample of its values.
+
+    Arguments:
+    rows -- an iterable of row dicts to profile (default: None) More rows
+        can be added with update.
+    sample_size -- the number of each column's values to keep as a uniform
+        random sample (default: 1000) If None, every value is kept.
+    max_distinct -- the number of distinct values of a column to count
+        (default: 10000) Once a column has more distinct values than this,
+        its counts are dropped and its cardinality is unknown.
+    seed -- the seed for sampling values (default: None)
+
+    Attributes:
+    nrows -- the number of rows profiled
+    columns -- the column names, in the order they were first seen
+    present -- a dict mapping each column to the number of rows having it
+    fill -- a dict mapping each column to its number of values other than
+        None
+    types -- a dict mapping each column to a dict mapping the types of its
+        values, other than None, to their counts
+    minimum, maximum -- dicts mapping each column with numeric values (int,
+        long or float, but not bool) to the smallest and largest of them
+    counts -- a dict mapping each column to a dict mapping its values, other
+        than None, to their counts, or to None if it has more than
+        max_distinct distinct values, or values that can't be counted
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, rows=None, sample_size=1000, max_distinct=10000,
+                 seed=None):
+        self.sample_size = sample_size
+        self.max_distinct = max_distinct
+        self.nrows = 0
+        self.columns = []
+        self.present = {}
+        self.fill = {}
+        self.types = {}
+        self.minimum = {}
+        self.maximum = {}
+        self.counts = {}
+        self._samples = {}
+        self._rng = Random(seed)
+        if rows is not None:
+            self.update(rows)
+
+    def __str__(self):
+        return "<veritable.ColumnProfile rows={0} columns={1}>".format(
+            self.nrows, len(self.columns))
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _add_column(self, c):
+        self.columns.append(c)
+        self.present[c] = 0
+        self.fill[c] = 0
+        self.types[c] = {}
+        self.counts[c] = {}
+        self._samples[c] = _Reservoir(self.sample_size, self._rng)
+
+    def update(self, rows):
+        """Adds an iterable of row dicts to the profile."""
+        present = self.present
+        fill = self.fill
+        types = self.types
+        counts = self.counts
+        samples = self._samples
+        minimum = self.minimum
+        maximum = self.maximum
+        for r in rows:
+            self.nrows = self.nrows + 1
+            for (c, v) in r.items():
+                if c not in present:
+                    self._add_column(c)
+                present[c] = present[c] + 1
+                samples[c].add(v)
+                if v is None:
+                    continue
+                fill[c] = fill[c] + 1
+                t = type(v)
+                types[c][t] = types[c].get(t, 0) + 1
+                if t in _NUMERIC_TYPES and not (t is float and isnan(v)):
+                    if c not in minimum:
+                        minimum[c] = maximum[c] = v
+                    elif v < minimum[c]:
+                        minimum[c] = v
+                    elif v > maximum[c]:
+                        maximum[c] = v
+                column_counts = counts[c]
+                if column_counts is not None:
+                    try:
+                        column_counts[v] = column_counts.get(v, 0) + 1
+                    except TypeError:  # unhashable values
+                        counts[c] = None
+                        continue
+                    if len(column_counts) > self.max_distinct:
+                        counts[c] = None
+
+    def cardinality(self, column):
+        """Returns the number of distinct values in a column, or None if
+        they were not all counted."""
+        column_counts = self.counts.get(column, {})
+        return None if column_counts is None else len(column_counts)
+
+    def values(self, column):
+        """Returns the sample of a column's values, including any None
+        values, in no particular order."""
+        sample = self._samples.get(column)
+        return [] if sample is None else list(sample.items)
+
+    def category_counts(self, schema, convert_types=True):
+        """Returns the counts of the categories of each categorical column
+        of schema, as clean_data would count them after cleaning them.
+        Columns whose counts were dropped are left out.
+
+        Arguments:
+        schema -- an analysis schema
+        convert_types -- as for clean_data (default: True) If True, values
+            that are not strings are counted as the strings clean_data
+            converts them to, so that 1 and '1' are one category; if False,
+            they are left out, as clean_data would reject them.
+
+        """
+        category_counts = {}
+        for c in schema:
+            if schema[c]['type'] != 'categorical':
+                continue
+            column_counts = self.counts.get(c)
+            if column_counts is None:
+                continue
+            cats = {}
+            for (v, n) in column_counts.items():
+                if type(v) is not str:
+                    if not convert_types:
+                        continue
+                    v = str(v)
+                cats[v] = cats.get(v, 0) + n
+            category_counts[c] = cats
+        return category_counts
+
+
+def _value_kinds(v):
+    # returns (boolean, count, real): whether clean_data would take v, not
+    #   None, as a value of each column type without losing information
+    t = type(v)
+    if t is bool:
+        return (True, False, False)
+    if t in _NUMERIC_TYPES:
+        if t is float:
+            return (False, False, not (isnan(v) or isinf(v)))
+        return (False, 0 <= v <= COUNT_LIMIT, True)
+    if not isinstance(v, _STRING_TYPES):
+        return (False, False, False)
+    if v.strip().lower() in _BOOLEAN_STRINGS:
+        return (True, False, False)
+    try:
+        _convert_count(v)
+        return (False, True, True)
+    except ValueError:
+        pass
+    try:
+        _convert_real(v)
+        return (False, False, True)
+    except ValueError:
+        return (False, False, False)
+
+
+def infer_schema(rows, sample_size=1000, confidence=0.95, max_rows=None,
+    seed=None, return_fractions=False):
+    """Infers an analysis schema from the values in the rows.
+
+    Looks at a uniform random sample of the rows, drawn in a single pass
+    holding only the sample in memory, and gives each column the first of
+    the types boolean, count and real that fits at least a fraction
+    confidence of its sampled values, or else categorical. Values fit
+    boolean if they are bools or strings such as 'true' or 'no', count if
+    they are ints, or strings of ints, between 0 and COUNT_LIMIT, and real
+    if they are finite numbers or strings of them, so rows read from a .csv
+    are inferred as well as typed rows. Columns of 0s and 1s are inferred as
+    counts. Values that can't be hashed, such as lists and dicts, fit none
+    of these types.
+
+    Returns an analysis schema as a Python dict, which passes
+    validate_schema. Columns whose names validate_schema rejects, such as
+    '_id' and other names beginning with an underscore or containing '.' or
+    '$', and columns with no values other than None in the sample, are left
+    out.
+
+    Arguments:
+    rows -- an iterable of row dicts, such as a list or the iterator
+        returned by iter_csv, or a ColumnProfile, whose samples of values
+        are then used
+    sample_size -- the number of rows to sample (default: 1000) If None,
+        every row is used.
+    confidence -- the fraction of a column's sampled values that must fit a
+        type for the column to be given that type (default: 0.95) Values
+        that don't fit are left for clean_data to remove.
+    max_rows -- the number of rows to read at most (default: None) If given,
+        only the first max_rows rows are sampled, which bounds the time taken
+        on huge inputs. If None, all the rows are read.
+    seed -- the seed for sampling (default: None)
+    return_fractions -- controls whether the fraction of each column's
+        sampled values that fit its type is returned too (default: False)
+        If True, returns a tuple (schema, fractions), where fractions is a
+        dict mapping each column of the schema to the fraction of its
+        sampled values, other than None, that fit its type; every value
+        fits categorical.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    if isinstance(rows, ColumnProfile):
+        columns = rows.columns
+        values = dict([(c, rows.values(c)) for c in columns])
+    else:
+        sample = _Reservoir(sample_size, Random(seed))
+        for r in rows:
+            if max_rows is not None and sample.seen >= max_rows:
+                break
+            sample.add(r)
+        # gather the sampled values of every column in one pass
+        columns = []
+        values = {}
+        for r in sample.items:
+            for (c, v) in r.items():
+                if c in values:
+                    values[c].append(v)
                 else:
-                    v = []
-                    for row in rows:
-                        if c in row:
-                            v.append(row[c])
-                    if r(c, v):
-                        schema[c] = t
-                        break
+                    columns.append(c)
+                    values[c] = [v]
+    schema = {}
+    fractions = {}
+    for c in columns:
+        if not _valid_column_name(c):
+            continue
+        # each distinct value is only classified once
+        (counts, unhashable) = _count_values(values[c])
+        counts.pop(None, None)
+        total = sum(counts.values()) + unhashable
+        if not total:
+            continue
+        fits = [0, 0, 0]
+        for (v, n) in counts.items():
+            kinds = _value_kinds(v)
+            for k in range(3):
+                if kinds[k]:
+                    fits[k] = fits[k] + n
+        threshold = confidence * total
+        for (k, t) in enumerate(['boolean', 'count', 'real']):
+            if fits[k] >= threshold:
+                schema[c] = {'type': t}
+                fractions[c] = fits[k] / float(total)
+                break
+        else:
+            schema[c] = {'type': 'categorical'}
+            fractions[c] = 1.0
+    if return_fractions:
+        return (schema, fractions)
     return schema
 
 
+def _count_values(values):
+    # returns (counts, unhashable): a Counter of the values that can be
+    #   hashed, and the number of those, such as lists, that can't
+    try:
+        return (Counter(values), 0)
+    except TypeError:
+        counts = Counter()
+        unhashable = 0
+        for v in values:
+            try:
+                counts[v] = counts[v] + 1
+            except TypeError:
+                unhashable = unhashable + 1
+        return (counts, unhashable)
+
+
+def _create_csv(filename):
+    # opens a .csv for writing, leaving line endings to the csv writer on
+    #   Python 3
+    if sys.version_info[0] < 3:
+        return open(filename, 'w')
+    return open(filename, 'w', newline='')
+
+
+def _csv_value(v, na_val):
+    return na_val if v is None else str(v)
+
+
 # Dialects: csv.excel_tab, csv.excel
-def write_csv(rows, filename, dialect=csv.excel, na_val=''):
-    """Writes a list of row dicts to disk as .csv
+def write_csv(rows, filename, dialect=csv.excel, na_val='', headers=None,
+    schema=None):
+    """Writes row dicts to disk as .csv
+
+    If the headers are given, or derived from a schema, rows may be any
+    iterable, including a generator, and are written in a single pass as
+    they are produced. Otherwise the headers are collected from the rows
+    first, and rows which are not a list are read into one.
 
     Does not support Unicode values in row dicts.
 
     Arguments:
-    rows -- the list of row dicts to write
+    rows -- the row dicts to write
     filename -- the filename to which to write
-    dialect -- a subclass of csv.Dialect (default: csv.excel)
+    dialect -- a subclass of csv.Dialect (default: csv.excel) Use
+        csv.excel_tab to write a tab-separated file.
     na_val -- columns that are missing in a row or that are set to None will
         be written out as this value (default: '')
+    headers -- the columns to write, in order (default: None) Keys of the
+        rows that are not in headers are not written. If None, the headers
+        are derived from schema, or else are the sorted union of the keys of
+        all the rows.
+    schema -- an analysis schema (default: None) If headers is None, the
+        headers are '_id' and the columns of the schema, sorted.
 
     See also: https://dev.priorknowledge.com/docs/client/python
 
     """
-    headers = set()
-    for r in rows:
-        headers = headers.union(r.keys())
-    headers = list(headers)
-    headers.sort()
-    with open(filename, 'w') as out_file:
+    if headers is None and schema is not None:
+        headers = sorted(list(schema.keys()) + ['_id'])
+    if headers is None:
+        if not isinstance(rows, list):
+            rows = list(rows)
+        headers = set()
+        for r in rows:
+            headers.update(r.keys())
+        headers = sorted(headers)
+    with _create_csv(filename) as out_file:
         writer = csv.writer(out_file, dialect=dialect)
         writer.writerow(headers)
         for r in rows:
-            writer.writerow([(na_val if not c in r
-                              else na_val if r[c] is None
-                              else str(r[c])) for c in headers])
+            writer.writerow([_csv_value(r.get(c), na_val) for c in headers])
+
+
+class CsvSink:
+
+    """Writes row dicts to a .csv file one at a time, as they are passed to it.
+
+    A sink for the streaming splitters, such as hash_split, which call it with
+    each row of a partition and close it at the end. Since rows are written
+    as they arrive, the headers must be known in advance.
+
+    Arguments:
+    filename -- the filename to which to write
+    headers -- the columns to write, in order (default: None) If None, they
+        are derived from schema.
+    schema -- an analysis schema (default: None) If headers is None, the
+        headers are '_id' and the columns of the schema, sorted.
+    dialect -- a subclass of csv.Dialect (default: csv.excel)
+    na_val -- columns that are missing in a row or that are set to None will
+        be written out as this value (default: '')
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, filename, headers=None, schema=None,
+                 dialect=csv.excel, na_val=''):
+        if headers is None and schema is not None:
+            headers = sorted(list(schema.keys()) + ['_id'])
+        if headers is None:
+            raise VeritableError("CsvSink needs headers or a schema.")
+        self.filename = filename
+        self.headers = list(headers)
+        self.na_val = na_val
+        self.nrows = 0
+        self._file = _create_csv(filename)
+        self._writer = csv.writer(self._file, dialect=dialect)
+        self._writer.writerow(self.headers)
+
+    def __str__(self):
+        return "<veritable.CsvSink filename='{0}' nrows={1}>".format(
+            self.filename, self.nrows)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __call__(self, row):
+        self._writer.writerow([_csv_value(row.get(c), self.na_val)
+            for c in self.headers])
+        self.nrows = self.nrows + 1
+
+    def close(self):
+        """Closes the file."""
+        self._file.close()
+
+
+class UploadSink:
+
+    """Uploads row dicts to a table in batches, as they are passed to it.
+
+    A sink for the streaming splitters, such as hash_split, which call it with
+    each row of a partition and close it at the end, uploading the last
+    partial batch.
+
+    Arguments:
+    table -- the veritable.Table to which to upload the rows
+    per_page -- the number of rows to upload at a time (default: 100)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, table, per_page=100):
+        self.table = table
+        self.per_page = per_page
+        self.nrows = 0
+        self._batch = []
+
+    def __str__(self):
+        return "<veritable.UploadSink table={0} nrows={1}>".format(
+            self.table, self.nrows)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __call__(self, row):
+        self._batch.append(row)
+        self.nrows = self.nrows + 1
+        if len(self._batch) >= self.per_page:
+            self.flush()
+
+    def flush(self):
+        """Uploads any rows not yet uploaded."""
+        if self._batch:
+            batch = self._batch
+            self._batch = []
+            self.table.batch_upload_rows(batch, per_page=self.per_page)
+
+    def close(self):
+        """Uploads any rows not yet uploaded."""
+        self.flush()
+
+
+def _quantile(sorted_values, q):
+    # the value at quantile q of a sorted list, without interpolation
+    return sorted_values[int(round(q * (len(sorted_values) - 1)))]
+
+
+def _quantile_header(column, q):
+    return '{0}_p{1:g}'.format(column, q * 100)
 
 
 # Dialects: csv.excel_tab, csv.excel
-def read_csv(filename, id_col=None, dialect=csv.excel, na_vals=['']):
-    """Reads a .csv from disk into a list of row dicts.
+def write_predictions_csv(predictions, filename, columns=None,
+    dialect=csv.excel, na_val='', uncertainty=True, quantiles=None):
+    """Writes predictions to disk as .csv, one row per prediction.
+
+    Predictions are written as they are produced, so the iterator returned
+    by Analysis.batch_predict can be passed directly, without holding all
+    the predictions in memory. Each row holds the '_request_id' of the
+    prediction and the point estimate for each column, optionally followed
+    by its uncertainty, in a column '<column>_uncertainty', and by quantiles
+    of its predicted values, in columns '<column>_p<percent>' (for instance
+    'age_p5' and 'age_p95' for quantiles [0.05, 0.95]). Quantiles are only
+    written for real and count columns; they are na_val for others.
+
+    Arguments:
+    predictions -- an iterable of Prediction objects
+    filename -- the filename to which to write
+    columns -- the columns to write (default: None) If None, the sorted
+        columns of the first prediction.
+    dialect -- a subclass of csv.Dialect (default: csv.excel)
+    na_val -- the value written for missing values (default: '')
+    uncertainty -- controls whether the uncertainty of each point estimate
+        is written (default: True)
+    quantiles -- a list of quantiles between 0 and 1 to write for each
+        column (default: None)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    quantiles = quantiles or []
+    for q in quantiles:
+        if not 0 <= q <= 1:
+            raise VeritableError("Quantiles must be between 0 and 1")
+    predictions = iter(predictions)
+    first = next(predictions, None)
+    if columns is None:
+        columns = sorted(first.keys()) if first is not None else []
+    headers = ['_request_id']
+    for c in columns:
+        headers.append(c)
+        if uncertainty:
+            headers.append(c + '_uncertainty')
+        headers.extend([_quantile_header(c, q) for q in quantiles])
+    with _create_csv(filename) as out_file:
+        writer = csv.writer(out_file, dialect=dialect)
+        writer.writerow(headers)
+        p = first
+        while p is not None:
+            distribution = p.distribution if quantiles else None
+            row = [_csv_value(p.request_id, na_val)]
+            for c in columns:
+                row.append(_csv_value(p.get(c), na_val))
+                if uncertainty:
+                    row.append(_csv_value(p.uncertainty.get(c), na_val))
+                if quantiles:
+                    if (c in p.schema and
+                            p.schema[c]['type'] in ['real', 'count']):
+                        values = sorted([d[c] for d in distribution])
+                        row.extend([str(_quantile(values, q))
+                            for q in quantiles])
+                    else:
+                        row.extend([na_val] * len(quantiles))
+            writer.writerow(row)
+            p = next(predictions, None)
+
+
+def _open_csv(filename):
+    # csv needs universal newline handling: 'rU' on Python 2, and on Python 3
+    #   newline='', which lets the reader see the line endings itself
+    if sys.version_info[0] < 3:
+        return open(filename, 'rU')
+    return open(filename, newline='')
 
-    Returns a list of dicts representing the rows in the .csv file.
+
+# values which are converted to True and False in boolean columns
+TRUE_STRINGS = ['true', 't', 'yes', 'y']
+FALSE_STRINGS = ['false', 'f', 'no', 'n']
+_BOOLEAN_STRINGS = frozenset(TRUE_STRINGS + FALSE_STRINGS)
+
+
+def _convert_count(v):
+    v = int(v)
+    if v < 0 or v > COUNT_LIMIT:
+        raise ValueError("{0} is not between 0 and {1}".format(v,
+            COUNT_LIMIT))
+    return v
+
+
+def _convert_real(v):
+    v = float(v)
+    if isnan(v) or isinf(v):
+        raise ValueError("Invalid NaN or Inf")
+    return v
+
+
+def _convert_boolean(v):
+    lc = str(v).strip().lower()
+    if lc in TRUE_STRINGS:
+        return True
+    if lc in FALSE_STRINGS:
+        return False
+    return bool(int(v))
+
+
+# converters from the values of each column type, as clean_data converts
+#   them; each raises an exception if the value is invalid
+_CONVERTERS = {'count': _convert_count, 'real': _convert_real,
+    'boolean': _convert_boolean, 'categorical': str}
+
+
+def _csv_converters(header, schema, id_col):
+    # returns the converter for each column of a .csv, or None if no schema
+    if schema is None:
+        return None
+    _validate_schema(schema)
+    return [_CONVERTERS[schema[h]['type']] if h in schema and h != id_col
+        else None for h in header]
+
+
+def _csv_record(header, row, id_col, na_vals, converters=None):
+    # converts a parsed .csv record to a row dict, renaming id_col to '_id'
+    #   and converting values if there are converters, which drops invalid
+    #   values; returns None if the record's id is missing
+    r = {}
+    for i in range(min(len(header), len(row))):
+        val = row[i].strip()
+        if not val in na_vals:
+            if(header[i] == id_col):
+                r['_id'] = val
+            elif converters is not None and converters[i] is not None:
+                try:
+                    r[header[i]] = converters[i](val)
+                except (ValueError, TypeError, OverflowError):
+                    pass
+            else:
+                r[header[i]] = val
+        else:
+            if header[i] == id_col:
+                return None
+    return r
+
+
+# Dialects: csv.excel_tab, csv.excel
+def iter_csv(filename, id_col=None, dialect=csv.excel, na_vals=[''],
+    schema=None):
+    """Reads a .csv from disk one row at a time.
+
+    Returns an iterator over dicts representing the rows in the .csv file,
+    which reads the file lazily, so that files larger than memory can be
+    passed straight to Table.batch_upload_rows. Rows are as returned by
+    read_csv.
 
     Does not support .csvs that contain Unicode values.
 
@@ -278,56 +1127,284 @@ def read_csv(filename, id_col=None, dialect=csv.excel, na_vals=['']):
         If None, the rows will be numbered sequentially; otherwise, this
         column will be renamed to '_id' (as required by the row upload
         functions). If id_col is specified, but ids are missing for some rows,
-        then a VeritableError will be raised.
+        then a VeritableError will be raised when those rows are reached.
     dialect -- a subclass of csv.Dialect to use in reading the .csv file
         (default: csv.excel)
     na_vals -- a list of values to treat as NA (default: ['']) Each row dict
         will contain only those columns in which these values do not occur.
+    schema -- an analysis schema (default: None) If provided, values in the
+        columns of the schema are converted to the column types as they are
+        read, as clean_data would convert them, and invalid values are
+        dropped. If None, all values are returned as strings.
 
     See also: https://dev.priorknowledge.com/docs/client/python
 
     """
-    table = []
-    with open(filename, "rU") as f:
-        f.seek(0)
+    with _open_csv(filename) as f:
         reader = csv.reader(f, dialect)
-        header = [h.strip() for h in next(reader)]
+        header = next(reader, None)
+        if header is None:  # empty file
+            return
+        header = [h.strip() for h in header]
         if '_id' in header:
             id_col = '_id'
-        if id_col is None:
-            rid = 0
+        converters = _csv_converters(header, schema, id_col)
+        rid = 0
         for row in reader:
-            r = {}
-            for i in range(min(len(header), len(row))):
-                val = row[i].strip()
-                if not val in na_vals:
-                    if(header[i] == id_col):
-                        r['_id'] = val
-                    else:
-                        r[header[i]] = val
-                else:
-                    if header[i] == id_col:
-                        raise VeritableError("Missing id for row" + str(i))
+            rid = rid + 1
+            r = _csv_record(header, row, id_col, na_vals, converters)
+            if r is None:
+                raise VeritableError("Missing id for row " + str(rid),
+                    row=rid - 1, col=id_col)
             if id_col is None:
-                rid = rid + 1
                 r['_id'] = str(rid)
-            table.append(r)
-    return table
+            yield r
+
+
+# Dialects: csv.excel_tab, csv.excel
+def read_csv(filename, id_col=None, dialect=csv.excel, na_vals=[''],
+    schema=None):
+    """Reads a .csv from disk into a list of row dicts.
+
+    Returns a list of dicts representing the rows in the .csv file. To read
+    the rows one at a time instead, use iter_csv.
+
+    Does not support .csvs that contain Unicode values.
+
+    Arguments:
+    filename -- the .csv file to read from
+    id_col -- the column, if any, containing unique row ids (default: None)
+        If None, the rows will be numbered sequentially; otherwise, this
+        column will be renamed to '_id' (as required by the row upload
+        functions). If id_col is specified, but ids are missing for some rows,
+        then a VeritableError will be raised.
+    dialect -- a subclass of csv.Dialect to use in reading the .csv file
+        (default: csv.excel)
+    na_vals -- a list of values to treat as NA (default: ['']) Each row dict
+        will contain only those columns in which these values do not occur.
+    schema -- an analysis schema (default: None) If provided, values in the
+        columns of the schema are converted to the column types as they are
+        read, as clean_data would convert them, and invalid values are
+        dropped, saving a separate pass over every cell. If None, all values
+        are returned as strings.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    return list(iter_csv(filename, id_col=id_col, dialect=dialect,
+        na_vals=na_vals, schema=schema))
+
+def _csv_quote(dialect):
+    if dialect.quoting == csv.QUOTE_NONE or not dialect.quotechar:
+        return None
+    return dialect.quotechar.encode('ascii')
+
+
+def _csv_record_end(mm, start, target, quote):
+    # returns the offset just past the first newline at or after target that
+    #   ends a record, given that a record starts at start, or the end of
+    #   the file. A newline ends a record if the quote characters before it
+    #   are balanced; doubled quotes inside quoted fields keep the count even.
+    pos = start
+    quotes = 0
+    end = mm.find(b'\n', target)
+    while end != -1:
+        if quote is not None:
+            quotes += mm[pos:end].count(quote)
+        pos = end
+        if quotes % 2 == 0:
+            return end + 1
+        end = mm.find(b'\n', end + 1)
+    return len(mm)
+
+
+def _csv_boundaries(mm, start, quote, chunk_bytes):
+    # splits the records from start to the end of the file into chunks of
+    #   about chunk_bytes; returns the offsets delimiting the chunks
+    offsets = [start]
+    while offsets[-1] + chunk_bytes < len(mm):
+        offsets.append(_csv_record_end(mm, offsets[-1],
+            offsets[-1] + chunk_bytes, quote))
+    if offsets[-1] < len(mm):
+        offsets.append(len(mm))
+    return offsets
+
+
+def _csv_text(chunk):
+    # wraps raw .csv bytes for csv.reader, decoding them as open() would
+    if sys.version_info[0] < 3:
+        return io.BytesIO(chunk)
+    return io.StringIO(chunk.decode(locale.getpreferredencoding(False)),
+        newline='')
+
+
+def _parse_csv_chunk(args):
+    # parses the records between two offsets of a .csv file. Returns
+    #   (rows, missing), where missing is the index of the first record
+    #   whose id is missing, or None; rows stops before that record. Rows
+    #   are row dicts, or a dict of column lists if columnar.
+    (filename, start, end, header, id_col, dialect, na_vals, schema,
+        columnar) = args
+    with open(filename, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            chunk = mm[start:end]
+        finally:
+            mm.close()
+    reader = csv.reader(_csv_text(chunk), dialect)
+    converters = _csv_converters(header, schema, id_col)
+    rows = []
+    missing = None
+    for (i, row) in enumerate(reader):
+        r = _csv_record(header, row, id_col, na_vals, converters)
+        if r is None:
+            missing = i
+            break
+        rows.append(r)
+    if columnar:
+        columns = ['_id' if h == id_col else h for h in header]
+        if not '_id' in columns:
+            columns.append('_id')
+        rows = dict([(c, [r.get(c) for r in rows]) for c in columns])
+    return (rows, missing)
+
+
+# Dialects: csv.excel_tab, csv.excel
+def iter_csv_parallel(filename, id_col=None, dialect=csv.excel,
+    na_vals=[''], schema=None, processes=None, chunk_bytes=8 * 1024 * 1024,
+    columnar=False):
+    """Reads a .csv from disk, parsing it in parallel across processes.
+
+    Memory-maps the file, splits it into chunks of about chunk_bytes at
+    record boundaries, and parses the chunks in a pool of worker processes.
+    Returns an iterator over the rows in file order, which are the same as
+    those returned by iter_csv, including the sequential ids assigned when
+    id_col is None. Only a few chunks are held in memory at a time.
+
+    Records are split on '\n' line endings, so files using bare '\r' line
+    endings, or dialects with an escapechar, are parsed as a single chunk.
+
+    Arguments:
+    filename -- the .csv file to read from
+    id_col -- the column, if any, containing unique row ids (default: None)
+        As for iter_csv.
+    dialect -- a subclass of csv.Dialect to use in reading the .csv file
+        (default: csv.excel)
+    na_vals -- a list of values to treat as NA (default: [''])
+    schema -- an analysis schema whose columns are converted to their types
+        as they are parsed (default: None) As for iter_csv.
+    processes -- the number of worker processes (default: None) If None,
+        the number of CPUs. If 1, chunks are parsed in this process.
+    chunk_bytes -- the approximate size of the chunks in bytes
+        (default: 8 * 1024 * 1024)
+    columnar -- controls whether to return the rows as columnar blocks
+        (default: False) If True, the iterator yields one dict per chunk
+        mapping every column, and '_id', to a list of its values in the
+        chunk's rows, with None for NA values.
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 and not columnar:
+        # nothing to gain from chunking
+        for r in iter_csv(filename, id_col=id_col, dialect=dialect,
+                na_vals=na_vals, schema=schema):
+            yield r
+        return
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # the header is the first record
+            quote = _csv_quote(dialect)
+            header_end = _csv_record_end(mm, 0, 0, quote)
+            header = [h.strip() for h in next(csv.reader(
+                _csv_text(mm[0:header_end]), dialect))]
+            if dialect.escapechar is not None:
+                offsets = [header_end, size]
+            else:
+                offsets = _csv_boundaries(mm, header_end, quote, chunk_bytes)
+        finally:
+            mm.close()
+    if '_id' in header:
+        id_col = '_id'
+    if schema is not None:
+        _validate_schema(schema)
+    tasks = [(filename, offsets[i], offsets[i + 1], header, id_col, dialect,
+        na_vals, schema, columnar) for i in range(len(offsets) - 1)
+        if offsets[i] < offsets[i + 1]]
+    pool = None
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes)
+    try:
+        # keep a bounded window of chunks in flight, in file order
+        pending = deque()
+        tasks = iter(tasks)
+        rid = 0
+        while True:
+            while pool is not None and len(pending) < 2 * processes:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.append(pool.apply_async(_parse_csv_chunk, (task,)))
+            if pool is not None:
+                if not pending:
+                    break
+                (rows, missing) = pending.popleft().get()
+            else:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                (rows, missing) = _parse_csv_chunk(task)
+            if columnar:
+                n = len(rows['_id'])
+                if id_col is None:
+                    rows['_id'] = [str(rid + i + 1) for i in range(n)]
+                if n > 0:
+                    yield rows
+            else:
+                n = len(rows)
+                for i in range(n):
+                    if id_col is None:
+                        rows[i]['_id'] = str(rid + i + 1)
+                    yield rows[i]
+            rid = rid + n
+            if missing is not None:
+                raise VeritableError("Missing id for row " + str(rid + 1),
+                    row=rid, col=id_col)
+    finally:
+        if pool is not None:
+            pool.terminate()
 
 def clean_data(rows, schema, convert_types=True, remove_nones=True,
     remove_invalids=True, reduce_categories=True, assign_ids=False,
-    remove_extra_fields=False, rename_columns=False):
+    remove_extra_fields=False, rename_columns=False, processes=1, state=None,
+    compact_ids=False, profile=None):
     """Cleans up a list of row dicts in accordance with an analysis schema.
 
     Raises a VeritableError containing further details if the data
     does not validate against the schema.
 
+    The rows may instead be given as a columnar table: a dict mapping each
+    column, including '_id', to a list or array of its values, one for each
+    row. None, or NaN in a float array, marks a missing value. The table is
+    checked a column at a time. A numeric or boolean array whose values
+    already have the column type is checked as an array and left as it is;
+    each other column is replaced by a list of its cleaned values, with
+    removed values set to None. Errors are raised for the first problem in
+    each column in turn. A columnar table can't be cleaned against a state,
+    and is always checked in this process.
+
     Note: This function mutates its rows argument. If clean_data raises an
     exception, values in some rows may be converted while others are left in
     their original state.
 
     Arguments:
-    rows -- the list of row dicts to clean up
+    rows -- the list of row dicts, or the columnar table, to clean up
     schema -- an analysis schema specifying the types of the columns appearing
         in the rows being cleaned
     convert_types -- controls whether clean_data will attempt to convert
@@ -355,6 +1432,25 @@ def clean_data(rows, schema, convert_types=True, remove_nones=True,
         'new_name'], or False (default), in which case column names will not
         be changed. Will silently succeed if asked to rename columns not
         present in the dataset.
+    processes -- the number of worker processes to check the rows in
+        (default: 1) If greater than 1, the rows are checked in chunks in a
+        pool of processes, and the cleaned rows copied back; errors are
+        reported for the same row and column as when checked in this
+        process. If None, the number of CPUs.
+    state -- a ValidationState holding the ids, fill and categories of
+        earlier batches of rows (default: None) If given, the rows are
+        cleaned as a new batch appended to those, and added to the state.
+    compact_ids -- controls whether repeated ids are found with a Bloom
+        filter of about 2 bytes per row, checking the few possible repeats
+        exactly, rather than a dict of every id (default: False) Errors are
+        the same either way; set this for rows too many for the dict to fit
+        in memory.
+    profile -- a ColumnProfile of the dataset the rows belong to (default:
+        None) If given, categories are reduced by their counts in the
+        profile rather than in the rows, so that rows cleaned in parts of a
+        dataset keep the same categories. Categories in the rows that the
+        profile has not seen are counted from the rows. Can't be combined
+        with state.
 
     See also: https://dev.priorknowledge.com/docs/client/python
 
@@ -364,18 +1460,175 @@ def clean_data(rows, schema, convert_types=True, remove_nones=True,
         remove_invalids=remove_invalids, reduce_categories=reduce_categories,
         has_ids='_id', assign_ids=assign_ids, allow_extra_fields=True,
         remove_extra_fields=remove_extra_fields, allow_empty_columns=False,
-        rename_columns=False)
+        rename_columns=False, processes=processes, state=state,
+        compact_ids=compact_ids, profile=profile)
 
-def validate_data(rows, schema):
+def iter_clean_data(rows, schema, convert_types=True, remove_nones=True,
+    remove_invalids=True, reduce_categories=True, assign_ids=False,
+    remove_extra_fields=False, category_counts=None, chunk_rows=1000,
+    profile=None):
+    """Cleans up rows in accordance with an analysis schema as they stream.
+
+    Returns an iterator over the rows, cleaned as by clean_data, so that
+    datasets too large for memory can be cleaned on their way to
+    Table.batch_upload_rows. Only a chunk of rows, the row ids and the
+    category counts are held in memory at a time. Like clean_data, this
+    may mutate the row dicts it is given.
+
+    Categories can only be reduced, and repeated ids and empty columns
+    found, once every row has been seen, so the rows are read in two passes:
+    the first checks them and counts their categories, raising any
+    VeritableError before any row is returned, and the second cleans them
+    and returns them. If rows is a callable, it is called to start each
+    pass. If rows is an iterator, which can only be read once, the rows
+    checked in the first pass are spilled to a temporary file and read back
+    from it. Other iterables, such as lists, are iterated twice.
+
+    If category_counts is given, the rows are cleaned in a single pass,
+    reducing categories using those counts. Errors are then raised as the
+    rows are read, and an empty column, or a column with too many
+    categories that category_counts did not reduce, because the column is
+    missing from it or has more categories in the rows than in it, is only
+    reported after the last row.
+
+    Arguments:
+    rows -- the rows to clean up: an iterable of row dicts, or a callable
+        returning a new iterator over them, e.g.
+        lambda: iter_csv(filename, id_col='id')
+    schema -- an analysis schema specifying the types of the columns appearing
+        in the rows being cleaned
+    convert_types -- as for clean_data (default: True)
+    remove_nones -- as for clean_data (default: True)
+    remove_invalids -- as for clean_data (default: True)
+    reduce_categories -- as for clean_data (default: True)
+    assign_ids -- as for clean_data (default: False)
+    remove_extra_fields -- as for clean_data (default: False)
+    category_counts -- a dict mapping categorical columns to dicts mapping
+        their values, as cleaned, to their counts in the rows (default: None)
+        If given, the rows are read once, and values missing from the counts
+        of a column with too many categories are binned as "Other".
+    chunk_rows -- the number of rows checked at a time (default: 1000)
+    profile -- a ColumnProfile of the rows, whose category counts are used
+        if category_counts is not given (default: None)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    _validate_schema(schema)
+    if category_counts is None and profile is not None:
+        category_counts = profile.category_counts(schema, convert_types)
+    id_col = _id_col('_id', assign_ids)
+    flags = (convert_types, False, remove_nones, remove_invalids, '_id',
+        assign_ids, True, remove_extra_fields)
+    unique_ids = {}
+    field_fill = _empty_fill(schema, id_col)
+    counted = {}
+    def check(chunk, offset):
+        # cleans a chunk in place, checking its ids against earlier chunks
+        #   and adding up its fill and category counts
+        (cleaned, ids, fill, counts, error) = _validate_chunk((chunk,
+            offset, schema, id_col, flags))
+        _check_unique_ids(offset, ids, id_col, unique_ids)
+        if error is not None:
+            raise error
+        _merge_counts(fill, counts, field_fill, counted)
+    if category_counts is not None:
+        kept = _kept_categories(category_counts, reduce_categories)
+        offset = 0
+        for chunk in _chunks(rows() if callable(rows) else rows, chunk_rows):
+            check(chunk, offset)
+            _reduce_categories(chunk, kept)
+            for r in chunk:
+                yield r
+            offset = offset + len(chunk)
+        # columns that were not reduced by the counts given, whether they
+        #   were missing from them or had too few categories in them, can't
+        #   be reduced now
+        _kept_categories(dict([(c, counted[c]) for c in counted
+            if c not in kept]), False)
+        _check_fill(field_fill)
+        return
+    spill = None
+    if callable(rows):
+        source = rows
+    elif iter(rows) is rows:
+        spill = tempfile.TemporaryFile()
+    else:
+        source = lambda: rows
+    try:
+        offset = 0
+        for chunk in _chunks(rows if spill is not None else source(),
+                chunk_rows):
+            if spill is None:
+                # leave the rows as they are until the second pass
+                chunk = [dict(r) for r in chunk]
+            check(chunk, offset)
+            if spill is not None:
+                pickle.dump(chunk, spill, pickle.HIGHEST_PROTOCOL)
+            offset = offset + len(chunk)
+        kept = _kept_categories(counted, reduce_categories)
+        _check_fill(field_fill)
+        if spill is not None:
+            spill.seek(0)
+            chunks = _unspill(spill)
+        else:
+            chunks = _chunks(source(), chunk_rows)
+        offset = 0
+        for chunk in chunks:
+            if spill is None:
+                _validate_chunk((chunk, offset, schema, id_col, flags))
+                offset = offset + len(chunk)
+            _reduce_categories(chunk, kept)
+            for r in chunk:
+                yield r
+    finally:
+        if spill is not None:
+            spill.close()
+
+def iter_columnar_rows(columns, chunk_rows=1000):
+    """Yields a row dict for each row of a columnar table.
+
+    A columnar table is a dict mapping each column to a list or array of its
+    values, one for each row, such as a dict of NumPy arrays. Rows are built
+    chunk_rows at a time, converting a slice of each column to Python values
+    at once, so only one chunk of row dicts exists at a time. None, or NaN
+    in a float array, marks a missing value, which is left out of the row.
+
+    Arguments:
+    columns -- the columnar table
+    chunk_rows -- the number of rows to build at a time (default: 1000)
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+    n = _columnar_length(columns)
+    names = list(columns.keys())
+    for start in range(0, n, chunk_rows):
+        chunk = [_column_values(columns[c][start:start + chunk_rows])
+            for c in names]
+        for values in zip(*chunk):
+            yield dict([(c, v) for (c, v) in zip(names, values)
+                if v is not None])
+
+
+def validate_data(rows, schema, processes=1, compact_ids=False):
     """Validates a list of row dicts against an analysis schema.
 
     Raises a DataValidationException containing further details if the data
     does not validate against the schema.
 
+    The rows may instead be given as a columnar table, a dict mapping each
+    column to a list or array of its values, as for clean_data.
+
     Arguments:
-    rows -- the list of row dicts to validate
+    rows -- the list of row dicts, or the columnar table, to validate
     schema -- an analysis schema specifying the types of the columns appearing
         in the rows being validated
+    processes -- the number of worker processes to check the rows in
+        (default: 1) As for clean_data.
+    compact_ids -- controls whether repeated ids are found with a compact
+        Bloom filter rather than a dict of every id (default: False) As for
+        clean_data.
 
     See also: https://dev.priorknowledge.com/docs/client/python
 
@@ -385,7 +1638,7 @@ def validate_data(rows, schema):
         remove_invalids=False, reduce_categories=False,
         has_ids='_id', assign_ids=False, allow_extra_fields=True,
         remove_extra_fields=False, allow_empty_columns=False,
-        rename_columns=False)
+        rename_columns=False, processes=processes, compact_ids=compact_ids)
 
 def clean_predictions(predictions, schema, convert_types=True, assign_ids=True,
     remove_invalids=True, remove_extra_fields=True, rename_columns=[['_id', '_request_id']]):
@@ -454,247 +1707,1117 @@ def validate_predictions(predictions, schema):
         allow_empty_columns=True, rename_columns=False)
 
 
-def _validate(rows, schema, convert_types, allow_nones, remove_nones,
-    remove_invalids, reduce_categories, has_ids, assign_ids,
-    allow_extra_fields, remove_extra_fields, allow_empty_columns,
-    rename_columns):
-    # First check that the schema is well formed
-    _validate_schema(schema)
+class ValidationState:
 
-    # figure out which column holds the unique id
-    if has_ids or assign_ids:
-        if isinstance(has_ids, str) and isinstance(assign_ids, str):
-            if not has_ids == assign_ids:
-                raise VeritableError("Can't assign new row ids to column " \
-                    "'{0}' when ids are expected in column " \
-                    "'{1}'.".format(assign_ids, has_ids))
-        if isinstance(assign_ids, str):
-            id_col = assign_ids
-        elif isinstance(has_ids, str):
-            id_col = has_ids
+    """Validation state carried across batches of rows appended to a table.
+
+    Pass the same state to clean_data for each new batch of rows. The
+    batch's ids are checked against the ids of the earlier batches, ids
+    assigned with assign_ids continue their numbering, and columns need only
+    have values in some batch. Categories are reduced across all the
+    batches, so only the new rows need to be cleaned. The state is only
+    updated when a batch is cleaned successfully.
+
+    Rows of earlier batches have already been uploaded, so their categories
+    are always kept. When a batch takes a categorical column over MAX_CATS
+    categories, its largest new categories are kept while there is room and
+    the rest are binned as "Other".
+
+    Save the state with save between runs and restore it with
+    ValidationState.load.
+
+    With compact_ids, the ids of the earlier batches are kept in a Bloom
+    filter of about 4 bytes per id rather than in a set. The ids themselves
+    are then not kept, and about once in a million times a new id is
+    reported as repeating the id of a row of an earlier batch when it does
+    not.
+
+    Arguments:
+    schema -- the analysis schema the batches are cleaned against
+    compact_ids -- controls whether the ids of the batches are kept in a
+        compact Bloom filter rather than a set (default: False)
+
+    Attributes:
+    nrows -- the number of rows in the batches so far
+    ids -- the set of row ids in the batches so far, or with compact_ids a
+        filter of them that supports only in
+    field_fill -- a dict mapping each column to its number of values
+    category_counts -- a dict mapping each categorical column to a dict of
+        the counts of its values, as uploaded after any binning
+
+    See also: https://dev.priorknowledge.com/docs/client/python
+
+    """
+
+    def __init__(self, schema, compact_ids=False):
+        _validate_schema(schema)
+        self.schema = schema
+        self.nrows = 0
+        self.ids = _IdFilter() if compact_ids else set()
+        self.field_fill = {}
+        self.category_counts = {}
+
+    def __str__(self):
+        return "<veritable.ValidationState rows={0}>".format(self.nrows)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def save(self, filename):
+        """Saves the state to a file as JSON.
+
+        Arguments:
+        filename -- the file to save to
+
+        """
+        doc = {'schema': self.schema, 'nrows': self.nrows,
+            'field_fill': self.field_fill,
+            'category_counts': self.category_counts}
+        if isinstance(self.ids, _IdFilter):
+            doc['id_filter'] = self.ids.to_json()
         else:
-            id_col = '_id'
+            doc['ids'] = sorted(self.ids)
+        with open(filename, 'w') as f:
+            json.dump(doc, f)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads a state saved with save.
+
+        Arguments:
+        filename -- the file to load from
+
+        """
+        with open(filename) as f:
+            doc = json.load(f)
+        state = cls(doc['schema'])
+        state.nrows = doc['nrows']
+        if 'id_filter' in doc:
+            state.ids = _IdFilter.from_json(doc['id_filter'])
+        else:
+            state.ids = set(doc['ids'])
+        state.field_fill = doc['field_fill']
+        state.category_counts = doc['category_counts']
+        return state
 
-    # unique_ids stores the row numbers of each unique id so that if an id is
-    #   repeated we can alert the user appropriately
-    unique_ids = {}
 
-    # field_fill keeps track of the density of all fields present
-    field_fill = {}
-    for c in schema.keys():
-        if c != id_col:
-            field_fill[c] = 0
+# marks values that a validator found invalid and that should be removed
+_INVALID = object()
 
-    # category_counts stores the number of categories in each categorical
-    #   column
-    category_counts = {}
+_INF = float('inf')
+
+_NoneType = type(None)
+
+# the kinds of array columns, as _array_kind gives them, whose values are
+#   already of each column type's fast path type
+_FAST_KINDS = {int: 'iu', float: 'f', bool: 'b'}
+
+# the kinds of the values of array.array columns by typecode
+_TYPECODE_KINDS = {'b': 'i', 'h': 'i', 'i': 'i', 'l': 'i', 'q': 'i',
+    'B': 'u', 'H': 'u', 'I': 'u', 'L': 'u', 'Q': 'u', 'f': 'f', 'd': 'f'}
+
+# the number of rows whose values _validate_typed gathers at a time, which
+#   bounds the memory it uses beyond what the row-by-row path needs
+_TYPED_CHUNK = 128
+
+
+def _validate_id(r, i, id_col, convert_types):
+    # checks the id of row i in detail, raising a VeritableError describing
+    #   the problem if it is invalid
+    if convert_types:   # attempt to convert id_col to string
+        try:
+            r[id_col] = str(r[id_col])
+        except UnicodeDecodeError:  # catch and use str.encode
+            raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' " \
+            "is {3}, not a str".format(str(i), id_col,
+                r[id_col].encode('utf-8'), str(type(r[id_col]))),
+                row=i, col=id_col)
+    if not isinstance(r[id_col], str):  # invalid type for id_col
+            try:
+                str(r[id_col])
+            except UnicodeEncodeError:  # ensure we work in 2.7 and 3
+                raise VeritableError("Row:'{0}' Key:'{1}' is {2}, " \
+                "not an ascii str.".format(str(i), id_col, 
+                    str(type(r[id_col]))), row=i, col=id_col)
+            else:
+                raise VeritableError("Row:'{0}' Key:'{1}' " \
+                "Value:'{1}' is {2}, not an ascii " \
+                "str.".format(str(i), id_col, r[id_col],
+                    str(type(r[id_col]))), row=i, col=id_col)
+    else:
+        try:
+            r[id_col].encode('utf-8').decode('ascii')
+        except UnicodeDecodeError:
+            raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' " \
+            "is {3}, not an ascii str.".format(str(i), id_col,
+                str(r[id_col]), str(type(r[id_col]))), row=i,
+                col=id_col)
+    try:  # make sure id_col is alphanumeric
+        _check_id(r[id_col])
+    except VeritableError:
+        raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' must " \
+        "contain only alphanumerics, underscores, and " \
+        "hyphens".format(str(i), id_col, str(r[id_col])), row=i,
+        col=id_col)
+
+
+def _count_validator(convert_types, remove_invalids):
+    def validate(i, c, v):
+        if type(v) is int and 0 <= v <= COUNT_LIMIT:  # already valid
+            return v
+        if convert_types:  # try converting to int
+            try:
+                v = int(v)
+            except:
+                if remove_invalids:
+                    return _INVALID
+        if remove_invalids and isinstance(v, int) and (v < 0 or v > COUNT_LIMIT):
+            return _INVALID
+        if not isinstance(v, int) or not v >= 0 or not v <= COUNT_LIMIT:
+            raise VeritableError("Row:'{0}' Key:'{1}' " \
+            "Value:'{2}' is {3}, not an int " \
+            "between 0 and {4}".format(str(i), c, str(v),
+                str(type(v)),COUNT_LIMIT), row=i, col=c)
+        return v
+    return validate
+
+
+def _real_validator(convert_types, remove_invalids):
+    def validate(i, c, v):
+        if type(v) is float and -_INF < v < _INF:  # already valid
+            return v
+        if convert_types:  # try converting to float
+            try:
+                v = float(v)
+                if isnan(v) or isinf(v):
+                    raise VeritableError("Invalid NaN or Inf")
+            except:
+                if remove_invalids:
+                    return _INVALID
+        if (not isinstance(v, float)) or isnan(v) or isinf(v):
+            raise VeritableError("Row:'{0}' Key: '{1}' " \
+            "Value: '{2}' is {3}, not a " \
+            "valid float".format(str(i), c, str(v),
+                str(type(v))), row=i, col=c)
+        return v
+    return validate
+
+
+def _boolean_validator(convert_types, remove_invalids):
+    def validate(i, c, v):
+        if type(v) is bool:  # already valid
+            return v
+        if convert_types:  # try converting to bool
+            lc = str(v).strip().lower()
+            try:
+                if lc in TRUE_STRINGS:
+                    v = True
+                elif lc in FALSE_STRINGS:
+                    v = False
+                else:
+                    v = bool(int(v))
+            except:
+                if remove_invalids:
+                    return _INVALID
+        if not isinstance(v, bool):
+            raise VeritableError("Row:'{0}' Key:'{1}' " \
+            "Value:'{2}' is {3}, not a " \
+            "bool".format(str(i), c, str(v),
+                str(type(v))), row=i, col=c)
+        return v
+    return validate
+
+
+def _categorical_validator(convert_types, remove_invalids):
+    def validate(i, c, v):
+        if type(v) is str:  # already valid
+            return v
+        if convert_types:  # try converting to str
+            try:
+                v = str(v)
+            except:
+                if remove_invalids:
+                    return _INVALID
+        if not isinstance(v, str):
+            raise VeritableError("Row:'{0}' Key:'{1}' " \
+            "Value:'{2}' is {3}, not a " \
+            "str".format(str(i), c, str(v),
+                str(type(v))), row=i, col=c)
+        return v
+    return validate
+
+
+_VALIDATORS = {'count': _count_validator, 'real': _real_validator,
+    'boolean': _boolean_validator, 'categorical': _categorical_validator}
+
+# for each column type, the type of values which are valid as they are if
+#   lo < value < hi; str values are always valid in categorical columns
+_FAST_PATHS = {'count': (int, -1, COUNT_LIMIT + 1), 'real': (float, -_INF, _INF),
+    'boolean': (bool, -1, 2), 'categorical': (str, None, None)}
+
+
+def _compile_validators(schema, convert_types, remove_invalids):
+    # returns a dict mapping each column of the schema to a tuple (type, lo,
+    #   hi, validate). Values of exactly that type with lo < value < hi are
+    #   valid. Otherwise validate(i, c, v) returns the value v of column c in
+    #   row i, converted if convert_types, or _INVALID if the value should be
+    #   removed, and raises a VeritableError if the value is invalid.
+    validators = {}
+    for t in _VALIDATORS:
+        validators[t] = _VALIDATORS[t](convert_types, remove_invalids)
+    return dict([(c, _FAST_PATHS[schema[c]['type']] +
+        (validators[schema[c]['type']],)) for c in schema])
+
+
+def _valid_id(rid):
+    # whether rid is a valid row id as it is
+    return (type(rid) is str and _alphanumeric.match(rid) is not None and
+        rid[-1] != "\n" and rid[0] != '_')
+
+
+def _first_seen(rows, columns):
+    # orders columns by where they first appear, scanning the rows in order
+    def position(c):
+        for (i, r) in enumerate(rows):
+            if c in r:
+                return (i, list(r.keys()).index(c))
+    return sorted(columns, key=position)
+
+
+def _typed_extras(rows, schema, id_col, nchunks):
+    # returns the set of keys of the rows that are neither in the schema nor
+    #   id_col, gathering the keys of _TYPED_CHUNK rows at a time
+    present = set()
+    it = iter(rows)
+    for k in nchunks:
+        present.update(*islice(it, _TYPED_CHUNK))
+    present.discard(id_col)
+    return present.difference(schema)
+
+
+def _typed_column(rows, c, spec, nchunks, allow_nones, remove_nones):
+    # checks column c of the rows for _validate_typed, _TYPED_CHUNK rows at a
+    #   time. Returns a tuple (fill, counts), where counts is a dict of the
+    #   category counts of a categorical column that has values, or else
+    #   None; or returns None if a value needs converting, removing or an
+    #   error.
+    (fast_type, lo, hi, validate) = spec
+    fill = 0
+    counts = Counter() if fast_type is str else None
+    it = iter(rows)
+    for k in nchunks:
+        values = [r[c] for r in islice(it, _TYPED_CHUNK) if c in r]
+        if not values:
+            continue
+        types = set(map(type, values))
+        if _NoneType in types:  # None values
+            if remove_nones or not allow_nones:
+                return None
+            types.discard(_NoneType)
+            values = [v for v in values if v is not None]
+            if not values:
+                continue
+        if types != set([fast_type]):
+            return None
+        if fast_type is str:
+            counts.update(values)
+        elif not lo < min(values) or not max(values) < hi:
+            return None
+        elif fast_type is float and any(map(isnan, values)):
+            return None
+        fill = fill + len(values)
+    return (fill, dict(counts) if fill and counts is not None else None)
+
+
+def _validate_typed(rows, schema, specs, id_col, allow_nones, remove_nones,
+    has_ids, assign_ids, allow_extra_fields, remove_extra_fields, field_fill,
+    category_counts, offset=0, check_unique=True):
+    # a fast path for rows whose values all already have their column types
+    #   and need no conversion, removal or error. Checks them a column at a
+    #   time, with builtins, and if they qualify, assigns ids if assign_ids,
+    #   updates field_fill and category_counts as _validate_rows would, and
+    #   returns True. Otherwise returns False, having changed nothing. The
+    #   rows are numbered from offset. Values are gathered _TYPED_CHUNK rows
+    #   at a time, and repeated ids are found by sorting the ids rather than
+    #   with a dict of them, so that the fast path needs no more memory than
+    #   the row-by-row path.
+    n = len(rows)
+    nchunks = range((n + _TYPED_CHUNK - 1) // _TYPED_CHUNK)
+    extras = _typed_extras(rows, schema, id_col, nchunks)
+    if extras and (remove_extra_fields or not allow_extra_fields):
+        return False
+    if assign_ids:
+        pass
+    elif has_ids:
+        it = iter(rows)
+        for k in nchunks:
+            if not all(map(_valid_id, [r.get(id_col)
+                    for r in islice(it, _TYPED_CHUNK)])):
+                return False
+    elif any([id_col in r for r in rows]):
+        return False
+    fill = {}
+    counts = {}
+    for c in schema:
+        if c == id_col:
+            continue
+        checked = _typed_column(rows, c, specs[c], nchunks, allow_nones,
+            remove_nones)
+        if checked is None:
+            return False
+        fill[c] = checked[0]
+        if checked[1] is not None:
+            counts[c] = checked[1]
+    if has_ids and not assign_ids and check_unique and not _unique(
+            [r[id_col] for r in rows]):
+        return False
+    for c in schema:
+        if c != id_col:
+            field_fill[c] = field_fill[c] + fill[c]
+    for c in _first_seen(rows, extras):
+        field_fill[c] = sum(1 for r in rows if r.get(c) is not None)
+    for c in _first_seen(rows, counts.keys()):
+        category_counts[c] = counts[c]
+    # the ids are assigned last, once what the checks gathered is no longer
+    #   held, as the new ids are most of what the fast path allocates
+    fill = counts = extras = None
+    if assign_ids:
+        for i in range(n):
+            rows[i][id_col] = str(offset + i)
+    return True
+
+
+def _unique(ids):
+    # whether a list of ids has no repeats, sorting it in place; sorted,
+    #   repeated ids are adjacent, and the list takes much less memory than
+    #   a dict or set of the ids
+    ids.sort()
+    return not any(map(eq, ids, islice(ids, 1, None)))
+
+
+def _validate_rows(rows, schema, specs, id_col, convert_types, allow_nones,
+    remove_nones, has_ids, assign_ids, allow_extra_fields,
+    remove_extra_fields, field_fill, category_counts, offset=0,
+    check_unique=True):
+    # checks, converts and cleans the rows one at a time, updating
+    #   field_fill and category_counts. The rows are numbered from offset.
+    #   Repeated ids are left to the caller unless check_unique.
 
-    # values which will be converted to True and False in boolean columns
-    #   if convert_types
-    TRUE_STRINGS = ['true', 't', 'yes', 'y']
-    FALSE_STRINGS = ['false', 'f', 'no', 'n']
+    # unique_ids stores the row numbers of each unique id so that if an id is
+    #   repeated we can alert the user appropriately
+    unique_ids = {}
 
     # be careful before changing the order of any of this logic - the point is
     #   to map through the rows only once
-    for i in range(len(rows)):
-        r = rows[i]
-        if rename_columns: # first apply the column renaming rules, if any
-            if not isinstance(rename_columns, list):
-                raise VeritableError("Must supply column renaming rules as " \
-                    "a list of lists.")
-            for rule in rename_columns:
-                if not isinstance(rule, list):
-                    raise VeritableError("Must supply column renaming rules "\
-                        "as a list of lists.")
-                try:
-                    r[rule[1]] = r[rule[0]]
-                    del r[rule[0]]
-                except KeyError:
-                    pass
+    for j in range(len(rows)):
+        r = rows[j]
+        i = offset + j
         if assign_ids:  # number the rows sequentially
             r[id_col] = str(i)
         elif has_ids:   # we expect an id_col column
             if not id_col in r:
                 raise VeritableError("Row: {0} is missing " \
                 "Key:'{1}'".format(str(i), id_col), row=i, col=id_col)
-            if convert_types:   # attempt to convert id_col to string
-                try:
-                    r[id_col] = str(r[id_col])
-                except UnicodeDecodeError:  # catch and use str.encode
-                    raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' " \
-                    "is {3}, not a str".format(str(i), id_col,
-                        r[id_col].encode('utf-8'), str(type(r[id_col]))),
-                        row=i, col=id_col)
-            if not isinstance(r[id_col], str):  # invalid type for id_col
-                    try:
-                        str(r[id_col])
-                    except UnicodeEncodeError:  # ensure we work in 2.7 and 3
-                        raise VeritableError("Row:'{0}' Key:'{1}' is {2}, " \
-                        "not an ascii str.".format(str(i), id_col, 
-                            str(type(r[id_col]))), row=i, col=id_col)
-                    else:
-                        raise VeritableError("Row:'{0}' Key:'{1}' " \
-                        "Value:'{1}' is {2}, not an ascii " \
-                        "str.".format(str(i), id_col, r[id_col],
-                            str(type(r[id_col]))), row=i, col=id_col)
-            else:
-                try:
-                    r[id_col].encode('utf-8').decode('ascii')
-                except UnicodeDecodeError:
-                    raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' " \
-                    "is {3}, not an ascii str.".format(str(i), id_col,
-                        str(r[id_col]), str(type(r[id_col]))), row=i,
-                        col=id_col)
-            try:  # make sure id_col is alphanumeric
-                _check_id(r[id_col])
-            except VeritableError:
-                raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' must " \
-                "contain only alphanumerics, underscores, and " \
-                "hyphens".format(str(i), id_col, str(r[id_col])), row=i,
-                col=id_col)
-            if r[id_col] in unique_ids:
+            if not _valid_id(r[id_col]):
+                _validate_id(r, i, id_col, convert_types)
+            if not check_unique:
+                pass
+            elif r[id_col] in unique_ids:
                 raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' is " \
                 "not unique, conflicts with Row:'{3}'".format(str(i), id_col,
                     str(r[id_col]), str(unique_ids[r[id_col]])), row=i,
                     col=id_col)
-            unique_ids[r[id_col]] = i
+            else:
+                unique_ids[r[id_col]] = i
         elif id_col in r:  # no ids, no autoid, but id_col column
             if remove_extra_fields:  # just remove it
                 r.pop(id_col)
             else:
                 raise VeritableError("Row:'{0}' Key:{1} should not be " \
                 "included".format(str(i), id_col), row=i, col=id_col)
-        for c in list(r.keys()):
-            if c != id_col:
-                if not c in schema:  # keys missing from schema
-                    if remove_extra_fields:  # remove it
-                        r.pop(c)
-                    else:
-                        if not allow_extra_fields:  # or silently allow
-                            raise VeritableError("Row:'{0}' Key: '{1}' is "\
-                            "not defined in schema".format(str(i), c), row=i,
-                                col=c)
-                elif r[c] is None:  # None values
-                    if remove_nones:  # remove
-                        r.pop(c)
-                    else:
-                        if not allow_nones:  # or silently allow
-                            raise VeritableError("Row:'{0}' Key:'{1}' " \
-                            "should be removed because it has value " \
-                            "None".format(str(i), c), row=i, col=c)
-                else:  # keys present in schema
-                    coltype = schema[c]['type']  # check the column type
-                    if coltype == 'count':
-                        if convert_types:  # try converting to int
-                            try:
-                                r[c] = int(r[c])
-                            except:
-                                if remove_invalids:  # flag for removal
-                                    r[c] = None
-                        if r[c] is None:  # remove flagged values
-                            r.pop(c)
-                        elif remove_invalids and isinstance(r[c], int) and (r[c] < 0 or r[c] > COUNT_LIMIT):
-                            r.pop(c)
-                        else:
-                            if not isinstance(r[c], int) or not r[c] >= 0 or not r[c] <= COUNT_LIMIT:  # catch invalids
-                                raise VeritableError("Row:'{0}' Key:'{1}' " \
-                                "Value:'{2}' is {3}, not an int " \
-                                "between 0 and {4}".format(str(i), c, str(r[c]),
-                                    str(type(r[c])),COUNT_LIMIT), row=i, col=c)
-                    elif coltype == 'real':
-                        if convert_types:  # try converting to float
-                            try:
-                                r[c] = float(r[c])
-                                if isnan(r[c]) or isinf(r[c]):
-                                    raise VeritableError("Invalid NaN or Inf")
-                            except:
-                                if remove_invalids:  # flag for removal
-                                    r[c] = None
-                        if r[c] is None:  # remove flagged values
-                            r.pop(c)
-                        else:
-                            if (not isinstance(r[c], float)) or isnan(r[c]) or isinf(r[c]):  # catch invalids
-                                raise VeritableError("Row:'{0}' Key: '{1}' " \
-                                "Value: '{2}' is {3}, not a " \
-                                "valid float".format(str(i), c, str(r[c]),
-                                    str(type(r[c]))), row=i, col=c)
-
-                    elif coltype == 'boolean':
-                        if convert_types:  # try converting to bool
-                            lc = str(r[c]).strip().lower()
-                            try:
-                                if lc in TRUE_STRINGS:
-                                    r[c] = True
-                                elif lc in FALSE_STRINGS:
-                                    r[c] = False
-                                else:
-                                    r[c] = bool(int(r[c]))
-                            except:
-                                if remove_invalids:  # flag for removal
-                                    r[c] = None
-                        if r[c] is None:  # remove flagged values
-                            r.pop(c)
-                        else:
-                            if not isinstance(r[c], bool):  # catch invalids
-                                raise VeritableError("Row:'{0}' Key:'{1}' " \
-                                "Value:'{2}' is {3}, not a " \
-                                "bool".format(str(i), c, str(r[c]),
-                                    str(type(r[c]))), row=i, col=c)
-                    elif coltype == 'categorical':
-                        if convert_types:  # try converting to str
-                            try:
-                                r[c] = str(r[c])
-                            except:
-                                if remove_invalids:  # flag for removal
-                                    r[c] = None
-                        if r[c] is None:  # remove flagged values
-                            r.pop(c)
-                        else:
-                            if not isinstance(r[c], str):  # catch invalids
-                                raise VeritableError("Row:'{0}' Key:'{1}' " \
-                                "Value:'{2}' is {3}, not a " \
-                                "str".format(str(i), c, str(r[c]),
-                                    str(type(r[c]))), row=i, col=c)
-                            if not c in category_counts:  # increment count
-                                category_counts[c] = {}
-                            if not r[c] in category_counts[c]:
-                                category_counts[c][r[c]] = 0
-                            category_counts[c][r[c]] += 1
-                if not c in field_fill and not remove_extra_fields:
+        for (c, v) in list(r.items()):
+            if c == id_col:
+                continue
+            spec = specs.get(c)
+            if spec is None:  # keys missing from schema
+                if remove_extra_fields:  # remove it
+                    r.pop(c)
+                    continue
+                if not allow_extra_fields:  # or silently allow
+                    raise VeritableError("Row:'{0}' Key: '{1}' is "\
+                    "not defined in schema".format(str(i), c), row=i,
+                        col=c)
+                if not c in field_fill:
                     field_fill[c] = 0
-                if c in r and r[c] is not None:
+                if v is not None:
                     field_fill[c] = field_fill[c] + 1
-
-    MAX_CATS = 256
+            elif v is None:  # None values
+                if remove_nones:  # remove
+                    r.pop(c)
+                elif not allow_nones:  # or silently allow
+                    raise VeritableError("Row:'{0}' Key:'{1}' " \
+                    "should be removed because it has value " \
+                    "None".format(str(i), c), row=i, col=c)
+            else:  # keys present in schema
+                (fast_type, lo, hi, validate) = spec
+                # values already of the column type and in range need no
+                #   further checks
+                if not (type(v) is fast_type and
+                        (fast_type is str or lo < v < hi)):
+                    v = validate(i, c, v)
+                    if v is _INVALID:  # remove invalid values
+                        r.pop(c)
+                        continue
+                    r[c] = v
+                if fast_type is str:  # increment category count
+                    counts = category_counts.get(c)
+                    if counts is None:
+                        counts = category_counts[c] = {}
+                    counts[v] = counts.get(v, 0) + 1
+                field_fill[c] = field_fill[c] + 1
+
+
+def _check_rows(rows, schema, specs, id_col, convert_types, allow_nones,
+    remove_nones, has_ids, assign_ids, allow_extra_fields,
+    remove_extra_fields, field_fill, category_counts, offset=0,
+    check_unique=True):
+    # rows whose values already have their column types can be checked a
+    #   column at a time; otherwise, map through the rows
+    if not _validate_typed(rows, schema, specs, id_col, allow_nones,
+            remove_nones, has_ids, assign_ids, allow_extra_fields,
+            remove_extra_fields, field_fill, category_counts, offset,
+            check_unique):
+        _validate_rows(rows, schema, specs, id_col, convert_types,
+            allow_nones, remove_nones, has_ids, assign_ids,
+            allow_extra_fields, remove_extra_fields, field_fill,
+            category_counts, offset, check_unique)
+
+
+def _empty_fill(schema, id_col):
+    # field_fill keeps track of the density of all fields present
+    return dict([(c, 0) for c in schema.keys() if c != id_col])
+
+
+def _validate_chunk(args):
+    # checks a chunk of rows in a worker process. Returns (rows, ids,
+    #   field_fill, category_counts, error): the cleaned rows, or None if
+    #   the rows are not changed; the ids of the rows checked, in order, if
+    #   the rows have ids; the chunk's fill and category counts; and the
+    #   VeritableError the chunk raised, if any
+    (rows, offset, schema, id_col, flags) = args
+    (convert_types, allow_nones, remove_nones, remove_invalids, has_ids,
+        assign_ids, allow_extra_fields, remove_extra_fields) = flags
+    specs = _compile_validators(schema, convert_types, remove_invalids)
+    field_fill = _empty_fill(schema, id_col)
+    category_counts = {}
+    error = None
+    try:
+        _check_rows(rows, schema, specs, id_col, convert_types, allow_nones,
+            remove_nones, has_ids, assign_ids, allow_extra_fields,
+            remove_extra_fields, field_fill, category_counts, offset)
+    except VeritableError as e:
+        error = e
+    ids = []
+    if has_ids and not assign_ids:
+        checked = len(rows)
+        if error is not None:
+            # the id of the failing row was only recorded if it was valid
+            checked = error.row - offset + (error.col != id_col)
+        ids = [rows[j][id_col] for j in range(checked)]
+    changed = (convert_types or remove_nones or remove_invalids or
+        assign_ids or remove_extra_fields)
+    return (rows if changed else None, ids, field_fill, category_counts,
+        error)
+
+
+def _check_unique_ids(offset, ids, id_col, unique_ids):
+    # checks the ids of a chunk of rows, numbered from offset, against the
+    #   ids of earlier chunks, recording them in unique_ids
+    for j in range(len(ids)):
+        if ids[j] in unique_ids:
+            raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' is not " \
+            "unique, conflicts with Row:'{3}'".format(str(offset + j),
+                id_col, str(ids[j]), str(unique_ids[ids[j]])),
+                row=offset + j, col=id_col)
+        unique_ids[ids[j]] = offset + j
+
+
+def _merge_counts(fill, counts, field_fill, category_counts):
+    # adds a chunk's fill and category counts to the totals
+    for c in fill:
+        field_fill[c] = field_fill.get(c, 0) + fill[c]
+    for c in counts:
+        merged = category_counts.setdefault(c, {})
+        for (cat, n) in counts[c].items():
+            merged[cat] = merged.get(cat, 0) + n
+
+
+def _largest_categories(counts, k):
+    # returns the set of the k categories with the largest counts. Ties go to
+    #   the categories counted last, as they would by sorting the categories
+    #   in order of their counts and keeping the last k.
+    return set(heapq.nlargest(k, reversed(list(counts.keys())),
+        key=counts.get))
+
+
+def _kept_categories(category_counts, reduce_categories):
+    # returns a dict mapping each categorical column with more than MAX_CATS
+    #   categories to the set of its categories that are kept: the largest
+    #   MAX_CATS - 1. The rest are binned as 'Other'. Raises a VeritableError
+    #   if there are too many and not reduce_categories.
+    kept = {}
     for c in category_counts.keys():
-        cats = list(category_counts[c].keys())
-        if len(cats) > MAX_CATS:  # too many categories
+        if len(category_counts[c]) > MAX_CATS:  # too many categories
             if reduce_categories:  # keep the largest MAX_CATS - 1
-                cats.sort(key=lambda cat: category_counts[c][cat])
-                cats.reverse()
-                category_map = {}
-                for j in range(len(cats)):
-                    if j < (MAX_CATS - 1):
-                        category_map[cats[j]] = cats[j]
-                    else:
-                        category_map[cats[j]] = 'Other'  # bin the rest
-                for r in rows:
-                    if c in r:
-                        if r[c] is not None:
-                            r[c] = category_map[r[c]]  # convert the values
+                kept[c] = _largest_categories(category_counts[c],
+                    MAX_CATS - 1)
             else:
                 raise VeritableError("Categorical column '{0}' has {1} " \
                 "unique values which exceeds the limit of {2}.".format(c,
                     str(len(category_counts[c].keys())), str(MAX_CATS)),
                     col=c)
+    return kept
+
+
+def _add_profile_counts(category_counts, profile, schema, convert_types):
+    # replaces the category counts of the rows with those of the profile, so
+    #   that categories are kept by their counts in the whole dataset. The
+    #   counts of categories in the rows that the profile has not seen are
+    #   kept, so that rows the profile does not cover can't take a column
+    #   past MAX_CATS categories without it being reduced.
+    for (c, cats) in profile.category_counts(schema, convert_types).items():
+        counts = dict(cats)
+        for (cat, n) in category_counts.get(c, {}).items():
+            if cat not in counts:
+                counts[cat] = n
+        category_counts[c] = counts
+
+
+def _reduce_categories(rows, kept):
+    # bins as 'Other' the values of each column in kept that are not among
+    #   its kept categories, in one pass over the rows for all the columns
+    if not kept:
+        return
+    columns = list(kept.items())
+    for r in rows:
+        for (c, cats) in columns:
+            v = r.get(c)
+            if v is not None and v not in cats:
+                r[c] = 'Other'  # bin the value
+
+
+def _chunks(rows, chunk_rows):
+    # splits an iterable of rows into lists of chunk_rows rows
+    chunk = []
+    for r in rows:
+        chunk.append(r)
+        if len(chunk) == chunk_rows:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def _unspill(f):
+    # reads back the chunks of rows pickled to f
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+
+def _check_fill(field_fill):
+    for (c, fill) in field_fill.items():
+        if fill == 0:
+            raise VeritableError("Column '{0}' does not have any " \
+            "values".format(c), col=c)
+
+
+def _bloom_add(bits, m, h1, h2, k, test_only=False):
+    # sets the k bits of the m-bit Bloom filter bits that the hashes h1 and
+    #   h2 pick by double hashing, and returns whether they were all set
+    #   already. With test_only, only tests them.
+    seen = True
+    for j in range(k):
+        b = (h1 + j * h2) % m
+        mask = 1 << (b & 7)
+        if not bits[b >> 3] & mask:
+            if test_only:
+                return False
+            bits[b >> 3] = bits[b >> 3] | mask
+            seen = False
+    return seen
+
+
+def _first_repeated_id(rows, n, id_col):
+    # returns (i, j) for the first of the first n rows, i, whose id repeats
+    #   that of an earlier row, j, or None. Rather than a dict of every id,
+    #   a Bloom filter of about 2 bytes per row picks out the few ids that
+    #   may repeat, and only those are then checked exactly. If id_col is
+    #   None, rows is a list of the ids themselves.
+    m = max(16 * n, 64)
+    bits = bytearray((m + 7) // 8)
+    candidates = set()
+    ids = rows if id_col is None else None
+    for i in range(n):
+        h = hash(rows[i][id_col] if ids is None else ids[i])
+        # three probes
+        if _bloom_add(bits, m, h & 0xffffffff, (h >> 32) | 1, 3):
+            # a repeat, or a false positive
+            candidates.add(rows[i][id_col] if ids is None else ids[i])
+    if not candidates:
+        return None
+    first = {}
+    for i in range(n):
+        rid = rows[i][id_col] if ids is None else ids[i]
+        if rid in candidates:
+            if rid in first:
+                return (i, first[rid])
+            first[rid] = i
+    return None
+
+
+class _IdFilter:
+
+    # a Bloom filter of row ids that stands in for the set of ids of a
+    #   ValidationState, at about 4 bytes per id, with the set's in and
+    #   update. An id that was never added is found in it about once in a
+    #   million times. The ids are hashed with md5 so that a saved filter
+    #   still holds in another process. As the ids of later batches can't
+    #   be added to a full filter without raising its rate of false
+    #   positives, each filter holds a fixed number of ids, and a new one,
+    #   twice as large, is started when the last is full.
+
+    BITS = 32   # bits per id
+    PROBES = 11
+
+    def __init__(self, filters=None):
+        # a list of [capacity, count, bits] for each filter
+        self.filters = filters if filters is not None else []
+
+    def _hashes(self, rid):
+        h = int(hashlib.md5(rid.encode('utf-8')).hexdigest(), 16)
+        return (h & 0xffffffffffffffff, (h >> 64) | 1)
+
+    def __contains__(self, rid):
+        (h1, h2) = self._hashes(rid)
+        for (capacity, count, bits) in self.filters:
+            if _bloom_add(bits, capacity * self.BITS, h1, h2, self.PROBES,
+                    test_only=True):
+                return True
+        return False
+
+    def update(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        last = self.filters[-1] if self.filters else None
+        if last is None or last[1] + len(ids) > last[0]:
+            capacity = max(2 * last[0] if last else 1024, len(ids))
+            last = [capacity, 0, bytearray(capacity * self.BITS // 8)]
+            self.filters.append(last)
+        for rid in ids:
+            (h1, h2) = self._hashes(rid)
+            _bloom_add(last[2], last[0] * self.BITS, h1, h2, self.PROBES)
+        last[1] = last[1] + len(ids)
+
+    def to_json(self):
+        return [[capacity, count, base64.b64encode(bytes(bits)).decode(
+            'ascii')] for (capacity, count, bits) in self.filters]
+
+    @classmethod
+    def from_json(cls, doc):
+        return cls([[capacity, count, bytearray(base64.b64decode(bits))]
+            for (capacity, count, bits) in doc])
+
+
+def _check_repeated_ids(rows, n, id_col):
+    # raises a VeritableError for the first of the first n rows whose id
+    #   repeats that of an earlier row, as _validate_rows would
+    repeat = _first_repeated_id(rows, n, id_col)
+    if repeat is not None:
+        (i, j) = repeat
+        raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' is not " \
+        "unique, conflicts with Row:'{3}'".format(str(i), id_col,
+            str(rows[i][id_col]), str(j)), row=i, col=id_col)
+
+
+def _apply_state(state, rows, id_col, has_ids, assign_ids, field_fill,
+    category_counts, reduce_categories, allow_empty_columns):
+    # checks a batch of rows, already checked on their own, against the
+    #   earlier batches in state, reduces its categories, and then adds the
+    #   batch to the state
+    if assign_ids:  # continue the numbering of the earlier batches
+        for i in range(len(rows)):
+            rows[i][id_col] = str(state.nrows + i)
+    ids = []
+    if has_ids or assign_ids:
+        ids = [r[id_col] for r in rows]
+        # a Bloom filter can only say that an id may be a repeat
+        unique = "may not be" if isinstance(state.ids, _IdFilter) else \
+            "is not"
+        for i in range(len(ids)):
+            if ids[i] in state.ids:
+                raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' {3} " \
+                "unique, conflicts with a row of an earlier " \
+                "batch".format(str(i), id_col, str(ids[i]), unique),
+                    row=i, col=id_col)
+    kept = {}
+    for c in category_counts.keys():
+        known = state.category_counts.get(c, {})
+        new = dict([(cat, n) for (cat, n) in category_counts[c].items()
+            if cat not in known])
+        if len(known) + len(new) <= MAX_CATS:
+            continue
+        room = MAX_CATS - 1 - len([cat for cat in known if cat != 'Other'])
+        if not reduce_categories or room < 0:
+            raise VeritableError("Categorical column '{0}' has {1} " \
+            "unique values which exceeds the limit of {2}.".format(c,
+                str(len(known) + len(new)), str(MAX_CATS)), col=c)
+        # keep the largest new categories while there is room
+        kept[c] = set(known) | _largest_categories(new, room)
+    fill = dict(state.field_fill)
+    for c in field_fill:
+        fill[c] = fill.get(c, 0) + field_fill[c]
     if not allow_empty_columns:
-        for (c, fill) in field_fill.items():
-            if fill == 0:
-                raise VeritableError("Column '{0}' does not have any " \
-                "values".format(c), col=c)
+        _check_fill(fill)
+    _reduce_categories(rows, kept)
+    state.nrows = state.nrows + len(rows)
+    state.ids.update(ids)
+    state.field_fill = fill
+    for c in category_counts:
+        counts = state.category_counts.setdefault(c, {})
+        cats = kept.get(c)
+        for (cat, n) in category_counts[c].items():
+            if cats is not None and cat not in cats:
+                cat = 'Other'
+            counts[cat] = counts.get(cat, 0) + n
+
+
+def _validate_parallel(rows, schema, id_col, flags, field_fill,
+    category_counts, processes, check_unique=True):
+    # checks the rows in chunks across a pool of worker processes, then
+    #   merges the chunks' ids, fill and category counts in row order, so
+    #   that the first error in the rows is raised, as _check_rows would.
+    #   Ids repeated across chunks are left to the caller unless
+    #   check_unique.
+    size = max(int(ceil(len(rows) / float(4 * processes))), 1)
+    offsets = range(0, len(rows), size)
+    tasks = [(rows[s:s + size], s, schema, id_col, flags) for s in offsets]
+    pool = multiprocessing.Pool(processes)
+    try:
+        # unique_ids stores the row numbers of each unique id so that if an
+        #   id is repeated across chunks we can alert the user appropriately
+        unique_ids = {}
+        for (s, (chunk, ids, fill, counts, error)) in zip(offsets,
+                pool.imap(_validate_chunk, tasks)):
+            if check_unique:
+                _check_unique_ids(s, ids, id_col, unique_ids)
+            if chunk is not None:  # copy the cleaned rows back
+                for j in range(len(chunk)):
+                    rows[s + j].clear()
+                    rows[s + j].update(chunk[j])
+            if error is not None:
+                raise error
+            _merge_counts(fill, counts, field_fill, category_counts)
+    finally:
+        pool.terminate()
+
+
+def _id_col(has_ids, assign_ids):
+    if has_ids or assign_ids:
+        if isinstance(has_ids, str) and isinstance(assign_ids, str):
+            if not has_ids == assign_ids:
+                raise VeritableError("Can't assign new row ids to column " \
+                    "'{0}' when ids are expected in column " \
+                    "'{1}'.".format(assign_ids, has_ids))
+        if isinstance(assign_ids, str):
+            return assign_ids
+        elif isinstance(has_ids, str):
+            return has_ids
+        else:
+            return '_id'
+
+
+def _columnar_length(columns):
+    # the number of rows in a columnar table
+    lengths = set([len(values) for values in columns.values()])
+    if len(lengths) > 1:
+        raise VeritableError("The columns of a columnar table must all " \
+            "have the same length.")
+    return lengths.pop() if lengths else 0
+
+
+def _array_kind(values):
+    # the kind of the values of an array column, as NumPy gives it by
+    #   dtype.kind: 'b', 'i', 'u' or 'f' for booleans, signed and unsigned
+    #   ints and floats. The kinds of array.array typecodes are looked up.
+    #   None for lists and other columns.
+    dtype = getattr(values, 'dtype', None)
+    if dtype is not None:
+        return getattr(dtype, 'kind', None)
+    return _TYPECODE_KINDS.get(getattr(values, 'typecode', None))
+
+
+def _array_fill(values, kind):
+    # the number of values of an array column of the given kind that are
+    #   not NaN, counted without making a list of them
+    if kind != 'f':
+        return len(values)
+    if hasattr(values, 'dtype'):
+        return int((values == values).sum())
+    return sum(1 for v in values if v == v)
+
+
+def _typed_array_fill(values, fast_type, lo, hi):
+    # checks an array column whose kind already gives the column type on the
+    #   array itself, with its min and max methods and a mask of its NaNs,
+    #   which stand for missing values. Returns the number of its values if
+    #   they are all valid as they are, or None if the column must be
+    #   checked as a list.
+    kind = _array_kind(values)
+    if kind is None or kind not in _FAST_KINDS.get(fast_type, ''):
+        return None
+    fill = _array_fill(values, kind)
+    if fill == 0 or fast_type is bool:
+        return fill
+    if not hasattr(values, 'dtype'):  # an array.array, iterated in C
+        if fill < len(values):
+            (smallest, largest) = (min(v for v in values if v == v),
+                max(v for v in values if v == v))
+        else:
+            (smallest, largest) = (min(values), max(values))
+    else:
+        if fill < len(values):
+            values = values[values == values]
+        (smallest, largest) = (values.min(), values.max())
+    if lo < smallest and largest < hi:
+        return fill
+    return None
+
+
+def _column_values(values):
+    # the values of a column of a columnar table as a list, converting
+    #   arrays with their tolist method, which gives Python values. NaNs in
+    #   float arrays stand for missing values, and become None.
+    if isinstance(values, list):
+        return values
+    kind = _array_kind(values)
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    else:
+        values = list(values)
+    if kind == 'f' and any([v != v for v in values]):
+        values = [None if v != v else v for v in values]
+    return values
 
 
+def _first_present(values):
+    # the index of the first value that is not None
+    for i in range(len(values)):
+        if values[i] is not None:
+            return i
+    return None
 
 
+def _validate_columns(columns, schema, specs, id_col, convert_types,
+    remove_invalids, reduce_categories, has_ids, assign_ids,
+    allow_extra_fields, remove_extra_fields, allow_empty_columns,
+    compact_ids, profile):
+    # checks a columnar table a column at a time, with the same checks as
+    #   _check_rows makes of rows. Array columns whose values already have
+    #   the column type are checked as arrays and left as they are. If
+    #   converting or removing values, each other column checked is replaced
+    #   by a list of its cleaned values, with removed values set to None.
+    n = _columnar_length(columns)
+    clean = convert_types or remove_invalids
+    field_fill = _empty_fill(schema, id_col)
+    category_counts = {}
+    if assign_ids:  # number the rows sequentially
+        columns[id_col] = [str(i) for i in range(n)]
+    elif has_ids:   # we expect an id_col column
+        ids = _column_values(columns.get(id_col, [None] * n))
+        if not all(map(_valid_id, ids)):
+            ids = list(ids)
+            for i in range(n):
+                if ids[i] is None:
+                    raise VeritableError("Row: {0} is missing " \
+                    "Key:'{1}'".format(str(i), id_col), row=i, col=id_col)
+                if not _valid_id(ids[i]):
+                    r = {id_col: ids[i]}
+                    _validate_id(r, i, id_col, convert_types)
+                    ids[i] = r[id_col]
+        if compact_ids:
+            repeat = _first_repeated_id(ids, n, None)
+            if repeat is not None:
+                (i, j) = repeat
+                raise VeritableError("Row:'{0}' Key:'{1}' Value:'{2}' is " \
+                "not unique, conflicts with Row:'{3}'".format(str(i), id_col,
+                    str(ids[i]), str(j)), row=i, col=id_col)
+        else:
+            _check_unique_ids(0, ids, id_col, {})
+        if clean and n > 0:
+            columns[id_col] = ids
+    elif id_col in columns:  # no ids, no autoid, but id_col column
+        if remove_extra_fields:  # just remove it
+            del columns[id_col]
+        else:
+            i = _first_present(_column_values(columns[id_col]))
+            if i is not None:
+                raise VeritableError("Row:'{0}' Key:{1} should not be " \
+                "included".format(str(i), id_col), row=i, col=id_col)
+    for c in list(columns.keys()):
+        if c == id_col or c in schema:
+            continue
+        # columns missing from schema
+        if remove_extra_fields:  # remove it
+            del columns[c]
+            continue
+        kind = _array_kind(columns[c])
+        if allow_extra_fields and kind is not None:
+            field_fill[c] = _array_fill(columns[c], kind)
+            continue
+        values = _column_values(columns[c])
+        if not allow_extra_fields:  # or silently allow
+            i = _first_present(values)
+            if i is not None:
+                raise VeritableError("Row:'{0}' Key: '{1}' is "\
+                "not defined in schema".format(str(i), c), row=i, col=c)
+        field_fill[c] = n - values.count(None)
+    for c in schema:
+        if c == id_col or c not in columns:
+            continue
+        (fast_type, lo, hi, validate) = specs[c]
+        fill = _typed_array_fill(columns[c], fast_type, lo, hi)
+        if fill is not None:
+            field_fill[c] = fill
+            continue
+        values = _column_values(columns[c])
+        present = [v for v in values if v is not None]
+        # values already of the column type and in range need no further
+        #   checks
+        if present and (set(map(type, present)) != set([fast_type]) or
+                (fast_type is not str and
+                    not (lo < min(present) and max(present) < hi)) or
+                (fast_type is float and any(map(isnan, present)))):
+            for i in range(n):
+                v = values[i]
+                if v is None or (type(v) is fast_type and
+                        (fast_type is str or lo < v < hi)):
+                    continue
+                v = validate(i, c, v)
+                values[i] = None if v is _INVALID else v
+            present = [v for v in values if v is not None]
+        if fast_type is str:
+            category_counts[c] = dict(Counter(present))
+        field_fill[c] = len(present)
+        if clean:
+            columns[c] = values
+    if profile is not None:  # reduce by the counts in the whole dataset
+        _add_profile_counts(category_counts, profile, schema, convert_types)
+    kept = _kept_categories(category_counts, reduce_categories)
+    for (c, cats) in kept.items():
+        if c in columns:  # bin the values
+            columns[c] = [v if v is None or v in cats else 'Other'
+                for v in _column_values(columns[c])]
+    if not allow_empty_columns:
+        _check_fill(field_fill)
 
 
+def _validate(rows, schema, convert_types, allow_nones, remove_nones,
+    remove_invalids, reduce_categories, has_ids, assign_ids,
+    allow_extra_fields, remove_extra_fields, allow_empty_columns,
+    rename_columns, processes=1, state=None, compact_ids=False,
+    profile=None):
+    # First check that the schema is well formed
+    _validate_schema(schema)
+    if state is not None and state.schema != schema:
+        raise VeritableError("The validation state was built for a " \
+            "different schema.")
+    if state is not None and profile is not None:
+        raise VeritableError("Can't clean rows against both a validation " \
+            "state and a profile.")
+
+    # figure out which column holds the unique id
+    id_col = _id_col(has_ids, assign_ids)
+
+    if isinstance(rows, dict):  # a columnar table
+        if allow_nones:
+            raise VeritableError("Predictions requests must be a list of " \
+                "dicts.")
+        if state is not None:
+            raise VeritableError("Can't clean a columnar table against a " \
+                "validation state.")
+        _validate_columns(rows, schema, _compile_validators(schema,
+            convert_types, remove_invalids), id_col, convert_types,
+            remove_invalids, reduce_categories, has_ids, assign_ids,
+            allow_extra_fields, remove_extra_fields, allow_empty_columns,
+            compact_ids and has_ids, profile)
+        return
+
+    # field_fill keeps track of the density of all fields present
+    field_fill = _empty_fill(schema, id_col)
+
+    # category_counts stores the number of categories in each categorical
+    #   column
+    category_counts = {}
+
+    # apply the column renaming rules, if any
+    if rename_columns and len(rows) > 0:
+        if not isinstance(rename_columns, list):
+            raise VeritableError("Must supply column renaming rules as " \
+                "a list of lists.")
+        for rule in rename_columns:
+            if not isinstance(rule, list):
+                raise VeritableError("Must supply column renaming rules "\
+                    "as a list of lists.")
+        for r in rows:
+            for rule in rename_columns:
+                try:
+                    r[rule[1]] = r[rule[0]]
+                    del r[rule[0]]
+                except KeyError:
+                    pass
+
+    # with compact_ids, repeated ids are looked for once the rows have been
+    #   checked, or up to the row that failed, so that the first error in
+    #   the rows is still the one raised
+    compact_ids = compact_ids and has_ids and not assign_ids
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    try:
+        if processes > 1 and len(rows) > 1:
+            _validate_parallel(rows, schema, id_col, (convert_types,
+                allow_nones, remove_nones, remove_invalids, has_ids,
+                assign_ids, allow_extra_fields, remove_extra_fields),
+                field_fill, category_counts, processes,
+                check_unique=not compact_ids)
+        else:
+            # compile the schema into a validator for each column, so that
+            #   the column type is dispatched on once rather than for every
+            #   cell
+            specs = _compile_validators(schema, convert_types,
+                remove_invalids)
+            _check_rows(rows, schema, specs, id_col, convert_types,
+                allow_nones, remove_nones, has_ids, assign_ids,
+                allow_extra_fields, remove_extra_fields, field_fill,
+                category_counts, check_unique=not compact_ids)
+    except VeritableError as e:
+        if compact_ids:
+            # the failing row's id was checked unless it was the problem
+            _check_repeated_ids(rows, e.row + (e.col != id_col), id_col)
+        raise
+    if compact_ids:
+        _check_repeated_ids(rows, len(rows), id_col)
+
+    if state is not None:
+        _apply_state(state, rows, id_col, has_ids, assign_ids, field_fill,
+            category_counts, reduce_categories, allow_empty_columns)
+        return
+    if profile is not None:  # reduce by the counts in the whole dataset
+        _add_profile_counts(category_counts, profile, schema, convert_types)
+    _reduce_categories(rows, _kept_categories(category_counts,
+        reduce_categories))
+    if not allow_empty_columns:
+        _check_fill(field_fill)